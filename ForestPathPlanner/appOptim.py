@@ -140,7 +140,7 @@ import time
 import importlib.util
 import sys
 import os
-from threshold import IsoGrayThresh
+from threshold import MaskCost, VegetationCost
 
 # Get the directory of the current script
 current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -160,10 +160,14 @@ except Exception as e:
     print(f"Error loading pathfinder module: {e}")
     pathfinder = None
 
-def main_with_return(image=None, start=(0, 0), end=None):
+def main_with_return(image=None, start=(0, 0), end=None, method=None, threshold_factor=1.5, mask=None):
     """
     Compute optimal path using ForestPathPlanner and return results as a dict.
     This is designed for Streamlit integration.
+
+    The cost grid comes from ``mask`` (a 0/1 vegetation mask already computed
+    for this image, e.g. by the Green Cover page) when given, otherwise from
+    the Green Cover classifier named by ``method`` (None = IsoGray threshold).
     """
     # Check if pathfinder module is available
     if pathfinder is None:
@@ -173,10 +177,11 @@ def main_with_return(image=None, start=(0, 0), end=None):
     if image is None:
         image_path = 'img3.jpeg'
         image = Image.open(image_path)
-    img_array = np.array(image.convert('RGB'))
-    
-    # Apply threshold from threshold.py
-    binary_img = IsoGrayThresh(img_array)
+    # Vegetation cost grid from the shared mask engine
+    if mask is not None:
+        binary_img = MaskCost(mask)
+    else:
+        binary_img = VegetationCost(np.asarray(image.convert('RGB')), method, threshold_factor)
 
     rows, cols = binary_img.shape
     if end is None:
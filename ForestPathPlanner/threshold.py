@@ -1,6 +1,25 @@
+import os
+import sys
+
 import numpy as np
 import cv2
 
+# The vegetation mask engine is shared with the TreeSense Green Cover page, one level up
+REPO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+if REPO_DIR not in sys.path:
+    sys.path.append(REPO_DIR)
+
+from imaging_services.vegetation import (  # noqa: E402
+    apply_lut,
+    channel_histogram,
+    classify_vegetation,
+    histogram_mean,
+)
+
+# Cost grid values for idle land and vegetation
+COST_LUT = np.array([0, 255] + [0] * 254, dtype=np.uint8)
+
+
 def RGNull(img):
     arr = img.copy()
 
@@ -23,10 +42,32 @@ def IsoGray(img):
     gray_img = cv2.cvtColor(RGNull_img, cv2.COLOR_RGB2GRAY)
     return gray_img, thresh
 
-def IsoGrayThresh(img):
-    gray_img, threshold = IsoGray(img)
+def green_gray_levels():
+    """Grey level cv2 gives a pure-green pixel (0, G, 0), for every G"""
+    green = np.zeros((1, 256, 3), dtype=np.uint8)
+    green[0, :, 1] = np.arange(256)
+    return cv2.cvtColor(green, cv2.COLOR_RGB2GRAY)[0]
+
+def IsoGrayThresh(img, threshold_factor=1.5):
+    """
+    255 where the green-only grey level exceeds mean(green) / threshold_factor, else 0.
+
+    Same result as thresholding IsoGray, but as one 256-entry lookup over
+    the green channel: no image copy, channel zeroing or cvtColor.
+    """
+    mean = histogram_mean(channel_histogram(img, 1))
+    lut = np.where(green_gray_levels() > mean / threshold_factor, 255, 0).astype(np.uint8)
+    return apply_lut(img, lut, lambda block: block[:, :, 1])
 
-    # Apply threshold using vectorized operation
-    binary_img = np.where(gray_img > threshold, 255, 0).astype(np.uint8)
+def VegetationCost(img, method=None, threshold_factor=1.5):
+    """
+    Binary cost grid (255 = vegetation) from any Green Cover classifier,
+    or the original IsoGray threshold when ``method`` is None
+    """
+    if method is None:
+        return IsoGrayThresh(img, threshold_factor)
+    return MaskCost(classify_vegetation(img, method, threshold_factor).mask)
 
-    return binary_img
+def MaskCost(mask):
+    """0/1 vegetation mask -> 0/255 cost grid"""
+    return cv2.LUT(np.ascontiguousarray(mask, dtype=np.uint8), COST_LUT)
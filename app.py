@@ -4,19 +4,25 @@ import pandas as pd
 from PIL import Image
 import cv2
 
-# Handle YOLO import properly
-try:
-    from ultralytics import YOLO
-except (ImportError, ModuleNotFoundError):
-    YOLO = None
-    st.warning("YOLO not available. Tree detection will be disabled.")
-
 # from modules.green_cover import show_green_cover_page
 
 from modules.optimal_pathing import show_optimal_pathing_page
 from modules.historical_data import show_historical_data_page
 from modules.change_detection import show as show_change_detection_page
 from modules.green_cover import show_upload_method
+from detection_services import (
+    canopy_union_area,
+    DetectorUnavailableError,
+    draw_detections,
+    InferenceBusyError,
+    get_detection_cache,
+    get_detector,
+    get_inference_service,
+    start_warmup,
+    detect_image,
+)
+from detection_services.backends import DEFAULT_CONFIDENCE, DEFAULT_IOU
+from imaging_services import ingest_source, show_image
 
 # Configure page
 st.set_page_config(
@@ -410,6 +416,9 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 def main():
+    # Load and warm up the shared tree detector in the background while the user navigates
+    start_warmup()
+
     st.sidebar.markdown("### 🌳 TreeSense")
     
     page = st.sidebar.selectbox(
@@ -561,46 +570,75 @@ def show_home_page():
 def show_tree_count_page():
     """Tree detection and counting page"""
     st.title("🌳 Tree Count")
-    uploaded_file = st.file_uploader("Upload an image", type=["jpg", "jpeg", "png"])
+    uploaded_file = st.file_uploader("Upload an image", type=["jpg", "jpeg", "png", "tif", "tiff"])
     
     if not uploaded_file:
         st.info("Please upload an image to detect trees.")
         return
 
-    image = Image.open(uploaded_file)
-    st.image(image, caption="Uploaded Image", use_container_width=True)
+    # Large TIFFs are read window by window; display uses a cached, display-sized preview pyramid
+    image, upload_key, pyramid = ingest_source(uploaded_file)
+    show_image(image, caption="Uploaded Image", cache_key=upload_key)
 
-    @st.cache_resource
-    def load_model():
-        if YOLO is not None:
-            return YOLO("models/best.pt")
-        else:
-            st.error("YOLO model not available. Please check your installation.")
-            return None
+    # Large orthomosaics lose almost every crown when squeezed into the model input size
+    with st.expander("🧩 Tiled Inference (large images)", expanded=max(image.size) > 2 * 640):
+        use_tiling = st.checkbox("Enable tiled inference", value=max(image.size) > 2 * 640)
+        tile_size = st.select_slider("Tile Size (px)", options=[320, 480, 640, 800, 960, 1280], value=640)
+        overlap = st.slider("Tile Overlap", min_value=0.0, max_value=0.5, value=0.2, step=0.05)
+        batch_size = st.slider("Batch Size", min_value=1, max_value=32, value=8)
 
-    model = load_model()
+    with st.expander("🎚️ Detection Thresholds"):
+        conf = st.slider("Confidence Threshold", min_value=0.05, max_value=0.95, value=DEFAULT_CONFIDENCE, step=0.05)
+        iou = st.slider("NMS IoU Threshold", min_value=0.1, max_value=0.95, value=DEFAULT_IOU, step=0.05)
+
+    try:
+        model = get_detector()
+    except DetectorUnavailableError as e:
+        st.error(f"Tree detector not available: {e}")
+        model = None
     if model is not None:
-        results = model(np.array(image))
-        
-        boxes = results[0].boxes.xyxy.cpu().numpy() if results[0].boxes is not None else []
-        confidences = results[0].boxes.conf.cpu().numpy() if results[0].boxes is not None else []
+        # Forward passes go through the shared, bounded worker pool rather than this session's thread
+        service = get_inference_service()
+        predict_batch = service.as_batch_predictor(conf=conf, iou=iou)
+
+        def run_detection():
+            with st.spinner("Detecting trees..."):
+                return detect_image(image, predict_batch, tile_size=tile_size if use_tiling else None,
+                                    overlap=overlap, batch_size=batch_size)
 
-        img_np = np.array(image)
-        for i, box in enumerate(boxes):
-            x1, y1, x2, y2 = box.astype(int)
-            cv2.rectangle(img_np, (x1, y1), (x2, y2), (0, 255, 0), 2)
-            cv2.putText(img_np, f"Tree {confidences[i]:.2f}", (x1, y1-5),
-                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 1)
+        # Reruns and repeat uploads of the same image are served from the shared result cache
+        cache = get_detection_cache()
+        cache_key = cache.make_key(upload_key, model.model_id, conf=conf, iou=iou,
+                                   tiling=(tile_size, overlap) if use_tiling else None)
+        try:
+            boxes, confidences = cache.get_or_compute(cache_key, run_detection)
+        except InferenceBusyError as e:
+            st.warning(f"⏳ {e}")
+            return
 
-        st.image(img_np, caption="Detected Trees", use_container_width=True)
+        # Boxes are drawn on the display-sized level, not on a full-resolution copy
+        preview, scale = pyramid.preview()
+        show_image(draw_detections(preview, np.asarray(boxes) * scale, confidences), caption="Detected Trees")
         st.success(f"🌲 Number of trees detected: **{len(boxes)}**")
 
+        # Tree cover from the union of crown boxes (overlaps counted once)
+        tree_area = canopy_union_area(np.asarray(boxes).astype(int), image.width, image.height)
+        st.metric("🟩 Tree Cover Percentage", f"{tree_area / (image.width * image.height) * 100:.2f}%")
+
         if len(boxes) < 10:
             st.info("Category: 🌱 Low density")
         elif len(boxes) < 30:
             st.info("Category: 🌿 Medium density")
         else:
             st.info("Category: 🌳 High density")
+
+        cache_stats = cache.stats()
+        st.caption(f"🗄️ Detection cache: {cache_stats['hits']} hits · {cache_stats['misses']} misses · "
+                   f"{cache_stats['entries']}/{cache_stats['max_entries']} entries")
+        queue_stats = service.stats()
+        st.caption(f"🚦 Inference queue: {queue_stats['queue_depth']}/{queue_stats['max_queue']} waiting · "
+                   f"p99 wait {queue_stats['wait_ms_p99']:.0f} ms · "
+                   f"{queue_stats['mean_batch_images']} images per batch")
     else:
         st.error("Tree detection is not available due to missing dependencies.")
 
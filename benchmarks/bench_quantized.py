@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Detector Variant Benchmark
+Compares the FP32 and INT8 ONNX detectors on a local labeled image set:
+per-image latency, throughput, tree-count error and mAP@0.5.
+
+Labels are YOLO txt files (class cx cy w h, normalized) with the same stem
+as each image, looked up in --labels (default: a sibling "labels" folder,
+then the image folder itself). Without labels, the first variant is used
+as the reference for count and mAP deltas.
+
+Usage:
+    python benchmarks/bench_quantized.py --images data/val/images \\
+        [--models models/best.onnx models/best.int8.onnx] [--threads 4]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from detection_services import BACKEND_ONNX, DetectorSettings, OnnxBackend, box_overlap  # noqa: E402
+from detection_services.quantize import list_images  # noqa: E402
+
+MATCH_IOU = 0.5
+
+
+def load_labels(path, width, height):
+    """YOLO normalized labels -> xyxy pixel boxes (None when the file is missing)"""
+    if not os.path.exists(path):
+        return None
+    rows = np.loadtxt(path, ndmin=2, usecols=(1, 2, 3, 4)) if os.path.getsize(path) else np.empty((0, 4))
+    cx, cy, w, h = rows.T * np.array([[width], [height], [width], [height]])
+    return np.stack([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2], axis=1)
+
+
+def average_precision(predictions, truths, iou_threshold=MATCH_IOU):
+    """Single-class VOC-style AP (all-point interpolation) over a set of images"""
+    scores, hits = [], []
+    total = sum(len(t) for t in truths)
+    for (boxes, conf), truth in zip(predictions, truths):
+        matched = np.zeros(len(truth), dtype=bool)
+        for i in np.argsort(-conf):
+            scores.append(conf[i])
+            if len(truth) == 0:
+                hits.append(False)
+                continue
+            overlap = box_overlap(boxes[i], truth)
+            overlap[matched] = 0
+            best = int(np.argmax(overlap))
+            hit = overlap[best] >= iou_threshold
+            matched[best] |= hit
+            hits.append(hit)
+    if total == 0:
+        return float("nan")
+    hits = np.asarray(hits, dtype=bool)[np.argsort(-np.asarray(scores), kind="stable")]
+    tp = np.cumsum(hits)
+    recall = np.concatenate([[0], tp / total, [1]])
+    precision = np.concatenate([[1], tp / np.arange(1, len(tp) + 1), [0]])
+    precision = np.maximum.accumulate(precision[::-1])[::-1]
+    return float(np.sum(np.diff(recall) * precision[1:]))
+
+
+def run_variant(model_path, images, args):
+    settings = DetectorSettings(backend=BACKEND_ONNX, model_path=model_path, input_size=args.input_size,
+                                intra_op_threads=args.threads, optimized_model_path="")
+    detector = OnnxBackend(settings)
+    for image in images[:args.warmup]:
+        detector.predict([image], conf=args.conf, iou=args.iou)
+
+    latencies, predictions = [], []
+    for image in images:
+        start = time.perf_counter()
+        predictions.append(detector.predict([image], conf=args.conf, iou=args.iou)[0])
+        latencies.append(time.perf_counter() - start)
+    return np.asarray(latencies) * 1000, predictions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--images", required=True, help="Folder of evaluation images")
+    parser.add_argument("--labels", help="Folder of YOLO txt labels")
+    parser.add_argument("--models", nargs="+", default=["models/best.onnx", "models/best.int8.onnx"],
+                        help="ONNX models to compare; the first is the reference")
+    parser.add_argument("--conf", type=float, default=0.25)
+    parser.add_argument("--iou", type=float, default=0.7)
+    parser.add_argument("--input-size", type=int, default=640)
+    parser.add_argument("--threads", type=int, default=0, help="Intra-op threads (0 = ONNX Runtime default)")
+    parser.add_argument("--warmup", type=int, default=3, help="Untimed images run first")
+    parser.add_argument("--limit", type=int, default=0, help="Evaluate at most this many images")
+    args = parser.parse_args()
+
+    paths = list_images(args.images)
+    if args.limit:
+        paths = paths[:args.limit]
+    if not paths:
+        sys.exit(f"No images found in {args.images}")
+    images = [np.array(Image.open(p).convert("RGB")) for p in paths]
+
+    label_dirs = [args.labels] if args.labels else \
+        [os.path.join(os.path.dirname(os.path.abspath(args.images)), "labels"), args.images]
+    truths = []
+    for path, image in zip(paths, images):
+        stem = os.path.splitext(os.path.basename(path))[0]
+        found = (load_labels(os.path.join(d, stem + ".txt"), image.shape[1], image.shape[0]) for d in label_dirs)
+        truths.append(next((t for t in found if t is not None), None))
+    labeled = all(t is not None for t in truths)
+
+    print(f"{len(images)} images, {'labeled' if labeled else 'unlabeled (deltas vs ' + args.models[0] + ')'}")
+    print(f"{'model':<32} {'MB':>6} {'mean ms':>8} {'p50 ms':>7} {'p95 ms':>7} {'img/s':>6} "
+          f"{'trees':>7} {'count MAE':>9} {'mAP@0.5':>8}")
+
+    reference = None
+    for model_path in args.models:
+        if not os.path.exists(model_path):
+            print(f"{model_path:<32} missing, skipped")
+            continue
+        latencies, predictions = run_variant(model_path, images, args)
+        if reference is None:
+            reference = [(b, np.ones(len(b))) for b, _ in predictions]
+        targets = truths if labeled else [b for b, _ in reference]
+        counts = np.array([len(b) for b, _ in predictions])
+        count_mae = np.mean(np.abs(counts - np.array([len(t) for t in targets])))
+        ap = average_precision(predictions, targets)
+        print(f"{os.path.basename(model_path):<32} {os.path.getsize(model_path) / 1e6:>6.1f} "
+              f"{latencies.mean():>8.1f} {np.percentile(latencies, 50):>7.1f} {np.percentile(latencies, 95):>7.1f} "
+              f"{1000 / latencies.mean():>6.1f} {counts.sum():>7} {count_mae:>9.2f} {ap:>8.3f}")
+
+
+if __name__ == "__main__":
+    main()
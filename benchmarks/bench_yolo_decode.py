@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+YOLO Output Decoding Benchmark
+Times the vectorized ONNX decoder against the original per-prediction
+Python loop as the number of candidate boxes above threshold grows.
+
+Usage:
+    python benchmarks/bench_yolo_decode.py [--repeats 5] [--max-loop 2000]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from detection_services import decode_yolo_output  # noqa: E402
+
+NUM_PREDICTIONS = 8400
+CONF_THRESHOLD = 0.25
+IOU_THRESHOLD = 0.7
+
+
+def make_output(num_candidates: int, seed: int = 0) -> np.ndarray:
+    """Synthetic (1, 5, 8400) head output with ``num_candidates`` scores above threshold"""
+    rng = np.random.default_rng(seed)
+    output = np.zeros((1, 5, NUM_PREDICTIONS), dtype=np.float32)
+    # Candidates cluster around a few hundred crowns, like real anchor-free heads
+    centers = rng.uniform(20, 620, size=(max(1, num_candidates // 8), 2))
+    pick = rng.integers(0, len(centers), NUM_PREDICTIONS)
+    output[0, 0] = centers[pick, 0] + rng.normal(0, 3, NUM_PREDICTIONS)
+    output[0, 1] = centers[pick, 1] + rng.normal(0, 3, NUM_PREDICTIONS)
+    output[0, 2] = rng.uniform(15, 40, NUM_PREDICTIONS)
+    output[0, 3] = rng.uniform(15, 40, NUM_PREDICTIONS)
+    output[0, 4] = rng.uniform(0, CONF_THRESHOLD * 0.9, NUM_PREDICTIONS)
+    hot = rng.choice(NUM_PREDICTIONS, size=num_candidates, replace=False)
+    output[0, 4, hot] = rng.uniform(CONF_THRESHOLD, 1.0, num_candidates)
+    return output
+
+
+def loop_decode(output, img_width, img_height, confidence_threshold, iou_threshold):
+    """The original per-prediction loop with list-rebuilding NMS, kept as the baseline"""
+    boxes = []
+    for i in range(output.shape[2]):
+        xc, yc, w, h, conf = (output[0][k][i] for k in range(5))
+        if conf >= confidence_threshold:
+            boxes.append([(xc - w / 2) / 640 * img_width, (yc - h / 2) / 640 * img_height,
+                          (xc + w / 2) / 640 * img_width, (yc + h / 2) / 640 * img_height, "tree", conf])
+
+    def iou(a, b):
+        ix = min(a[2], b[2]) - max(a[0], b[0])
+        iy = min(a[3], b[3]) - max(a[1], b[1])
+        if ix <= 0 or iy <= 0:
+            return 0.0
+        inter = ix * iy
+        union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+        return inter / union if union > 0 else 0.0
+
+    boxes = sorted(boxes, key=lambda x: x[5], reverse=True)
+    result = []
+    while boxes:
+        result.append(boxes[0])
+        boxes = [box for box in boxes[1:] if iou(boxes[0], box) < iou_threshold]
+    return result
+
+
+def best_of(fn, repeats):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        out = fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings) * 1000, out
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeats", type=int, default=5, help="Runs per size (best time is reported)")
+    parser.add_argument("--max-loop", type=int, default=2000,
+                        help="Skip the Python-loop baseline above this many candidates")
+    args = parser.parse_args()
+
+    print(f"{'candidates':>10} {'kept':>6} {'vectorized ms':>14} {'loop ms':>10} {'speedup':>8}")
+    for num_candidates in (50, 100, 250, 500, 1000, 2000, 4000, 8400):
+        output = make_output(num_candidates)
+        vec_ms, (boxes, _) = best_of(
+            lambda: decode_yolo_output(output, 4000, 3000, CONF_THRESHOLD, IOU_THRESHOLD), args.repeats)
+        if num_candidates <= args.max_loop:
+            loop_ms, _ = best_of(
+                lambda: loop_decode(output, 4000, 3000, CONF_THRESHOLD, IOU_THRESHOLD), max(1, args.repeats // 2))
+            print(f"{num_candidates:>10} {len(boxes):>6} {vec_ms:>14.2f} {loop_ms:>10.2f} {loop_ms / vec_ms:>7.1f}x")
+        else:
+            print(f"{num_candidates:>10} {len(boxes):>6} {vec_ms:>14.2f} {'-':>10} {'-':>8}")
+
+
+if __name__ == "__main__":
+    main()
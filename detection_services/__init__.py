@@ -0,0 +1,150 @@
+"""
+Detection Services Package
+Tree detection inference helpers shared by the TreeSense Imaging pages
+"""
+
+from .config import (
+    BACKEND_ONNX,
+    BACKEND_ONNX_INT8,
+    BACKEND_ULTRALYTICS,
+    DetectorSettings,
+    InferenceServiceSettings,
+    load_detector_settings,
+    load_service_settings
+)
+
+from .backends import (
+    DetectorBackend,
+    OnnxBackend,
+    QuantizedOnnxBackend,
+    UltralyticsBackend,
+    create_backend
+)
+
+from .registry import (
+    DetectorUnavailableError,
+    ModelRegistry,
+    get_detector,
+    get_registry,
+    start_warmup
+)
+
+from .service import (
+    InferenceBusyError,
+    InferenceService,
+    get_inference_service
+)
+
+from .cache import (
+    DetectionCache,
+    content_hash,
+    get_detection_cache
+)
+
+from .canopy import (
+    canopy_area_by_region,
+    canopy_union_area
+)
+
+from .change import (
+    detect_epochs,
+    summarize_epochs
+)
+
+from .matching import (
+    MATCH_DISTANCE,
+    MATCH_IOU,
+    TreeMatches,
+    match_trees,
+    transform_boxes
+)
+
+from .history import (
+    EpochRecord,
+    SiteHistory,
+    list_sites
+)
+
+from .postprocess import (
+    box_areas,
+    box_overlap,
+    decode_yolo_output,
+    nms
+)
+
+from .tiling import (
+    detect_image,
+    iter_tiles,
+    tiled_detect
+)
+
+from .visualize import draw_detections
+
+__all__ = [
+    # Configuration
+    'BACKEND_ONNX',
+    'BACKEND_ONNX_INT8',
+    'BACKEND_ULTRALYTICS',
+    'DetectorSettings',
+    'InferenceServiceSettings',
+    'load_detector_settings',
+    'load_service_settings',
+
+    # Backends
+    'DetectorBackend',
+    'OnnxBackend',
+    'QuantizedOnnxBackend',
+    'UltralyticsBackend',
+    'create_backend',
+
+    # Model registry
+    'DetectorUnavailableError',
+    'ModelRegistry',
+    'get_detector',
+    'get_registry',
+    'start_warmup',
+
+    # Inference service
+    'InferenceBusyError',
+    'InferenceService',
+    'get_inference_service',
+
+    # Result cache
+    'DetectionCache',
+    'content_hash',
+    'get_detection_cache',
+
+    # Canopy area
+    'canopy_area_by_region',
+    'canopy_union_area',
+
+    # Change detection
+    'detect_epochs',
+    'summarize_epochs',
+
+    # Tree matching
+    'MATCH_DISTANCE',
+    'MATCH_IOU',
+    'TreeMatches',
+    'match_trees',
+    'transform_boxes',
+
+    # Site history
+    'EpochRecord',
+    'SiteHistory',
+    'list_sites',
+
+    # Post-processing
+    'box_areas',
+    'box_overlap',
+    'decode_yolo_output',
+    'nms',
+
+    # Tiled inference
+    'detect_image',
+    'iter_tiles',
+    'tiled_detect',
+
+    # Visualization
+    'draw_detections'
+]
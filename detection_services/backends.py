@@ -0,0 +1,218 @@
+"""
+Detector Backends
+Pluggable tree detector implementations behind one predict() interface.
+Heavy runtimes (torch via ultralytics, onnxruntime) are only imported by
+the backend that needs them.
+"""
+
+import hashlib
+import os
+import threading
+from typing import List, Optional, Protocol, Tuple
+
+import cv2
+import numpy as np
+
+from .config import (BACKEND_ONNX, BACKEND_ONNX_INT8, BACKEND_ULTRALYTICS, DetectorSettings,
+                     load_detector_settings)
+from .postprocess import decode_yolo_output
+from .tiling import BatchPredictor
+
+DEFAULT_CONFIDENCE = 0.25
+DEFAULT_IOU = 0.7
+
+Detections = Tuple[np.ndarray, np.ndarray]
+
+
+class Predictor(Protocol):
+    """Anything with DetectorBackend.predict's signature (a backend or the inference service)"""
+
+    def predict(self, images: List[np.ndarray], conf: float = ...,
+                iou: float = ...) -> List[Detections]: ...
+
+
+def _empty_detections() -> Detections:
+    return np.empty((0, 4), np.float32), np.empty(0, np.float32)
+
+
+def to_rgb(image: np.ndarray) -> np.ndarray:
+    """Coerce grayscale / RGBA uploads to 3-channel RGB"""
+    if image.ndim == 2:
+        return cv2.cvtColor(image, cv2.COLOR_GRAY2RGB)
+    if image.shape[2] == 4:
+        return cv2.cvtColor(image, cv2.COLOR_RGBA2RGB)
+    return image
+
+
+def to_input_tensor(image: np.ndarray, size: int, dtype=np.float32) -> np.ndarray:
+    """RGB uint8 HxWx3 -> normalized CHW tensor at the model input size"""
+    resized = cv2.resize(to_rgb(image), (size, size), interpolation=cv2.INTER_LINEAR)
+    return np.transpose(resized, (2, 0, 1)).astype(dtype) / 255.0
+
+
+class DetectorBackend:
+    """Base class: turns a list of RGB uint8 images into (boxes_xyxy, scores) pairs"""
+
+    name = "base"
+
+    def __init__(self, settings: DetectorSettings):
+        self.settings = settings
+        if not os.path.exists(settings.model_path):
+            raise FileNotFoundError(f"Model weights not found: {settings.model_path}")
+
+    @property
+    def model_id(self) -> str:
+        """Identifies the loaded weights, e.g. for result caching"""
+        stat = os.stat(self.settings.model_path)
+        return f"{self.name}:{os.path.abspath(self.settings.model_path)}:{stat.st_size}:{int(stat.st_mtime)}"
+
+    def predict(self, images: List[np.ndarray], conf: float = DEFAULT_CONFIDENCE,
+                iou: float = DEFAULT_IOU) -> List[Detections]:
+        raise NotImplementedError
+
+    def as_batch_predictor(self, conf: float = DEFAULT_CONFIDENCE, iou: float = DEFAULT_IOU) -> BatchPredictor:
+        """Adapter for tiled_detect"""
+        return lambda tiles: self.predict(tiles, conf=conf, iou=iou)
+
+
+class UltralyticsBackend(DetectorBackend):
+    """
+    YOLO .pt weights through ultralytics (pulls in torch).
+
+    Ultralytics models are not thread-safe, so forward passes on one
+    instance are serialized; concurrent callers queue on a lock.
+    """
+
+    name = BACKEND_ULTRALYTICS
+
+    def __init__(self, settings: DetectorSettings):
+        super().__init__(settings)
+        from ultralytics import YOLO
+        self.model = YOLO(settings.model_path)
+        self._predict_lock = threading.Lock()
+
+    def predict(self, images: List[np.ndarray], conf: float = DEFAULT_CONFIDENCE,
+                iou: float = DEFAULT_IOU) -> List[Detections]:
+        if not images:
+            return []
+        with self._predict_lock:
+            results = self.model(list(images), conf=conf, iou=iou, verbose=False)
+        outputs = []
+        for result in results:
+            if result.boxes is None:
+                outputs.append(_empty_detections())
+            else:
+                outputs.append((result.boxes.xyxy.cpu().numpy(), result.boxes.conf.cpu().numpy()))
+        return outputs
+
+
+_GRAPH_LEVELS = {
+    "disable": "ORT_DISABLE_ALL",
+    "basic": "ORT_ENABLE_BASIC",
+    "extended": "ORT_ENABLE_EXTENDED",
+    "all": "ORT_ENABLE_ALL",
+}
+
+
+def optimized_variant_path(path: str, settings: DetectorSettings, providers: List[str], runtime_version: str) -> str:
+    """
+    ``path`` tagged with the graph optimization level and a hash of what
+    else shapes the optimized graph (source model, execution providers,
+    ONNX Runtime version), so a change of any of them never reuses a stale
+    file: e.g. best.optimized.extended-1a2b3c4d.onnx
+    """
+    signature = "|".join([os.path.abspath(settings.model_path), ",".join(providers), runtime_version])
+    tag = hashlib.sha1(signature.encode()).hexdigest()[:8]
+    stem, ext = os.path.splitext(path)
+    return f"{stem}.{settings.graph_optimization}-{tag}{ext or '.onnx'}"
+
+
+class OnnxBackend(DetectorBackend):
+    """
+    Exported YOLO .onnx weights through ONNX Runtime (CPU, no torch).
+
+    The InferenceSession is built once per backend instance. When an
+    optimized-model path is configured the optimized graph is written on
+    first load and reused, with graph optimization switched off, on later
+    cold starts as long as it is newer than the source model. The file
+    name carries the optimization settings (optimized_variant_path), so
+    changing them builds a fresh graph. Session runs
+    are thread-safe, so every inference worker shares the one session.
+    """
+
+    name = BACKEND_ONNX
+
+    def __init__(self, settings: DetectorSettings, providers: Optional[List[str]] = None):
+        super().__init__(settings)
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        if settings.intra_op_threads > 0:
+            options.intra_op_num_threads = settings.intra_op_threads
+        if settings.inter_op_threads > 0:
+            options.inter_op_num_threads = settings.inter_op_threads
+            options.execution_mode = ort.ExecutionMode.ORT_PARALLEL
+
+        providers = providers or ["CPUExecutionProvider"]
+        model_path = settings.model_path
+        optimized = settings.optimized_model_path and \
+            optimized_variant_path(settings.optimized_model_path, settings, providers, ort.__version__)
+        if optimized and os.path.exists(optimized) and \
+                os.path.getmtime(optimized) >= os.path.getmtime(settings.model_path):
+            model_path = optimized
+            options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_DISABLE_ALL
+        else:
+            options.graph_optimization_level = getattr(
+                ort.GraphOptimizationLevel, _GRAPH_LEVELS[settings.graph_optimization])
+            if optimized:
+                options.optimized_model_filepath = optimized
+
+        self.session = ort.InferenceSession(model_path, sess_options=options, providers=providers)
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        self.input_dtype = np.float16 if "float16" in model_input.type else np.float32
+        batch_dim = model_input.shape[0]
+        # Exports with a fixed batch of 1 have to be fed one image at a time
+        self.max_batch = batch_dim if isinstance(batch_dim, int) and batch_dim > 0 else None
+
+    def preprocess(self, image: np.ndarray) -> np.ndarray:
+        """RGB uint8 HxWx3 -> normalized CHW float tensor at the model input size"""
+        return to_input_tensor(image, self.settings.input_size, self.input_dtype)
+
+    def predict(self, images: List[np.ndarray], conf: float = DEFAULT_CONFIDENCE,
+                iou: float = DEFAULT_IOU) -> List[Detections]:
+        if not images:
+            return []
+        step = self.max_batch or len(images)
+        outputs = []
+        for start in range(0, len(images), step):
+            chunk = images[start:start + step]
+            batch = np.stack([self.preprocess(image) for image in chunk])
+            raw = self.session.run(None, {self.input_name: batch})[0]
+            for image, head in zip(chunk, raw):
+                height, width = image.shape[:2]
+                outputs.append(decode_yolo_output(head, width, height, conf, iou,
+                                                  input_size=self.settings.input_size))
+        return outputs
+
+
+class QuantizedOnnxBackend(OnnxBackend):
+    """
+    INT8 weights produced by detection_services.quantize. Inputs and outputs
+    stay float32, so it is a drop-in replacement for the FP32 export.
+    """
+
+    name = BACKEND_ONNX_INT8
+
+
+BACKENDS = {
+    BACKEND_ULTRALYTICS: UltralyticsBackend,
+    BACKEND_ONNX: OnnxBackend,
+    BACKEND_ONNX_INT8: QuantizedOnnxBackend,
+}
+
+
+def create_backend(settings: Optional[DetectorSettings] = None) -> DetectorBackend:
+    """Build the detector backend selected by the settings (environment by default)"""
+    settings = settings or load_detector_settings()
+    return BACKENDS[settings.backend](settings)
@@ -0,0 +1,300 @@
+"""
+Headless Batch Tree Counting
+Runs the tree count pipeline over a folder or glob of survey images on a
+process pool (one detector per worker) and streams one row per image to
+CSV or Parquet. Re-running with the same output skips images already done
+and retries failed ones, replacing their error rows (one row per image).
+
+Usage:
+    python -m detection_services.batch "surveys/**/*.jpg" -o counts.csv --workers 4
+    python -m detection_services.batch surveys/ -o counts.parquet --tile-size 640
+"""
+
+import argparse
+import csv
+import glob
+import os
+import shutil
+import sys
+import time
+from multiprocessing import get_context
+from typing import Iterable, Iterator, List, Optional, Set
+
+import numpy as np
+
+from imaging_services.image_source import open_image_source
+
+from .backends import DEFAULT_CONFIDENCE, DEFAULT_IOU, DetectorBackend, create_backend
+from .canopy import canopy_union_area
+from .config import DEFAULT_MODEL_PATHS, load_detector_settings
+from .quantize import IMAGE_EXTENSIONS
+from .tiling import DEFAULT_BATCH_SIZE, DEFAULT_OVERLAP, detect_image
+
+COLUMNS = ["path", "width", "height", "trees", "canopy_area_px", "canopy_cover_pct",
+           "mean_confidence", "seconds", "model", "error"]
+# Parquet rows are written as one part file per chunk, so a crash loses at most one chunk
+DEFAULT_PARQUET_CHUNK = 256
+
+# Per-process state set up by the pool initializer
+_detector: Optional[DetectorBackend] = None
+_init_error: Optional[Exception] = None
+_options: dict = {}
+
+
+def expand_inputs(inputs: Iterable[str], extensions=IMAGE_EXTENSIONS) -> List[str]:
+    """Absolute paths of every image under the given folders / globs / files"""
+    paths = set()
+    for spec in inputs:
+        if os.path.isdir(spec):
+            spec = os.path.join(spec, "**", "*")
+        for path in glob.glob(spec, recursive=True):
+            if os.path.isfile(path) and os.path.splitext(path)[1].lower() in extensions:
+                paths.add(os.path.abspath(path))
+    return sorted(paths)
+
+
+def _init_worker(backend: Optional[str], threads: int, options: dict) -> None:
+    global _detector, _init_error, _options
+    _options = options
+    try:
+        settings = load_detector_settings(backend)
+        if threads and not settings.intra_op_threads:
+            settings.intra_op_threads = threads
+        _detector = create_backend(settings)
+    except Exception as e:
+        # Raising here would make the pool respawn the worker forever; fail the first task instead
+        _init_error = e
+
+
+def count_image(path: str) -> dict:
+    """Detect trees in one image with the worker's detector and summarize it"""
+    if _init_error is not None:
+        raise _init_error
+    row = dict.fromkeys(COLUMNS)
+    row["path"] = path
+    row["model"] = _detector.name
+    start = time.perf_counter()
+    try:
+        # Large TIFFs are read window by window rather than decoded whole
+        image = open_image_source(path)
+        width, height = image.size
+        predict_batch = _detector.as_batch_predictor(_options["conf"], _options["iou"])
+        tile_size = _options["tile_size"] if _options["tile_size"] and max(width, height) > _options["tile_size"] else None
+        try:
+            boxes, scores = detect_image(image, predict_batch, tile_size=tile_size,
+                                         overlap=_options["overlap"], batch_size=_options["batch_size"])
+        finally:
+            image.close()
+        area = canopy_union_area(boxes, width, height)
+        row.update(width=width, height=height, trees=len(boxes), canopy_area_px=round(area, 1),
+                   canopy_cover_pct=round(area / (width * height) * 100, 3),
+                   mean_confidence=round(float(np.mean(scores)), 4) if len(scores) else None)
+    except Exception as e:
+        row["error"] = f"{type(e).__name__}: {e}"
+    row["seconds"] = round(time.perf_counter() - start, 3)
+    return row
+
+
+class CsvSink:
+    """Appends rows to a CSV file, flushed per row so an interrupted run keeps its progress"""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def done_paths(self) -> Set[str]:
+        if not os.path.exists(self.path):
+            return set()
+        with open(self.path, newline="") as f:
+            return {row["path"] for row in csv.DictReader(f) if not row.get("error")}
+
+    def drop_errors(self, paths: Set[str]) -> None:
+        """Remove earlier error rows of ``paths`` (about to be retried), so each image keeps one row"""
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, newline="") as f:
+            rows = list(csv.DictReader(f))
+        kept = [row for row in rows if not (row.get("error") and row["path"] in paths)]
+        if len(kept) == len(rows):
+            return
+        temp = f"{self.path}.{os.getpid()}.part"
+        with open(temp, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=COLUMNS)
+            writer.writeheader()
+            writer.writerows(kept)
+        os.replace(temp, self.path)
+
+    def __enter__(self):
+        new_file = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+        self._file = open(self.path, "a", newline="")
+        self._writer = csv.DictWriter(self._file, fieldnames=COLUMNS)
+        if new_file:
+            self._writer.writeheader()
+        return self
+
+    def write(self, row: dict) -> None:
+        self._writer.writerow(row)
+        self._file.flush()
+
+    def __exit__(self, *exc):
+        self._file.close()
+
+
+class ParquetSink:
+    """
+    Writes rows as a Parquet dataset directory: every chunk becomes its own
+    part file (written to a temp name, then renamed), so readers such as
+    pandas.read_parquet(path) see only complete parts.
+    """
+
+    def __init__(self, path: str, chunk_size: int = DEFAULT_PARQUET_CHUNK):
+        self.path = path
+        self.chunk_size = chunk_size
+        self._rows: List[dict] = []
+
+    def done_paths(self) -> Set[str]:
+        import pyarrow.parquet as pq
+
+        done = set()
+        for part in glob.glob(os.path.join(self.path, "*.parquet")):
+            table = pq.read_table(part, columns=["path", "error"]).to_pydict()
+            done.update(p for p, e in zip(table["path"], table["error"]) if not e)
+        return done
+
+    def drop_errors(self, paths: Set[str]) -> None:
+        """Rewrite (or delete) part files holding earlier error rows of ``paths``, which are about to be retried"""
+        import pyarrow as pa
+        import pyarrow.compute as pc
+        import pyarrow.parquet as pq
+
+        retried = pa.array(sorted(paths), type=pa.string())
+        for part in glob.glob(os.path.join(self.path, "*.parquet")):
+            table = pq.read_table(part)
+            stale = pc.and_(pc.invert(pc.is_null(table["error"])), pc.is_in(table["path"], value_set=retried))
+            stale = pc.fill_null(stale, False)
+            if not pc.any(stale).as_py():
+                continue
+            kept = table.filter(pc.invert(stale))
+            if kept.num_rows:
+                temp = os.path.join(self.path, "." + os.path.basename(part))
+                pq.write_table(kept, temp)
+                os.replace(temp, part)
+            else:
+                os.remove(part)
+
+    def __enter__(self):
+        os.makedirs(self.path, exist_ok=True)
+        return self
+
+    def write(self, row: dict) -> None:
+        self._rows.append(row)
+        if len(self._rows) >= self.chunk_size:
+            self.flush()
+
+    def flush(self) -> None:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        if not self._rows:
+            return
+        table = pa.Table.from_pylist(self._rows, schema=pa.schema([
+            ("path", pa.string()), ("width", pa.int32()), ("height", pa.int32()), ("trees", pa.int32()),
+            ("canopy_area_px", pa.float64()), ("canopy_cover_pct", pa.float64()),
+            ("mean_confidence", pa.float64()), ("seconds", pa.float64()),
+            ("model", pa.string()), ("error", pa.string()),
+        ]))
+        name = f"part-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{time.perf_counter_ns()}.parquet"
+        # Dot-prefixed temp files are ignored by Parquet dataset readers
+        temp = os.path.join(self.path, "." + name)
+        pq.write_table(table, temp)
+        os.replace(temp, os.path.join(self.path, name))
+        self._rows = []
+
+    def __exit__(self, *exc):
+        self.flush()
+
+
+def open_sink(path: str, chunk_size: int = DEFAULT_PARQUET_CHUNK):
+    if path.lower().endswith(".parquet"):
+        return ParquetSink(path, chunk_size)
+    return CsvSink(path)
+
+
+def run_batch(paths: List[str], sink, workers: int, backend: Optional[str], options: dict,
+              threads: int = 0) -> Iterator[dict]:
+    """Yield result rows (in completion order) while writing them to ``sink``"""
+    if workers <= 1:
+        _init_worker(backend, threads, options)
+        if _init_error is not None:
+            raise _init_error
+        rows = map(count_image, paths)
+        pool = None
+    else:
+        # spawn: ONNX Runtime / torch thread pools do not survive fork reliably
+        pool = get_context("spawn").Pool(workers, initializer=_init_worker,
+                                          initargs=(backend, threads, options))
+        rows = pool.imap_unordered(count_image, paths, chunksize=1)
+    try:
+        with sink:
+            for row in rows:
+                sink.write(row)
+                yield row
+    finally:
+        if pool is not None:
+            pool.terminate()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Count trees in many images without the web UI")
+    parser.add_argument("inputs", nargs="+", help="Image folders (searched recursively), globs or files")
+    parser.add_argument("-o", "--output", required=True, help="Results file: .csv, or .parquet (dataset folder)")
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) // 2),
+                        help="Worker processes, each with its own detector")
+    parser.add_argument("--backend", choices=sorted(DEFAULT_MODEL_PATHS),
+                        help="Detector backend (default: TREESENSE_DETECTOR_BACKEND)")
+    parser.add_argument("--conf", type=float, default=DEFAULT_CONFIDENCE)
+    parser.add_argument("--iou", type=float, default=DEFAULT_IOU)
+    parser.add_argument("--tile-size", type=int, default=640,
+                        help="Tile images larger than this (0 = always resize the whole image)")
+    parser.add_argument("--overlap", type=float, default=DEFAULT_OVERLAP)
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="Tiles per forward pass")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_PARQUET_CHUNK, help="Rows per Parquet part")
+    parser.add_argument("--overwrite", action="store_true", help="Discard existing results and start over")
+    args = parser.parse_args()
+
+    paths = expand_inputs(args.inputs)
+    if args.overwrite and os.path.isdir(args.output):
+        shutil.rmtree(args.output)
+    elif args.overwrite and os.path.exists(args.output):
+        os.remove(args.output)
+
+    sink = open_sink(args.output, args.chunk_size)
+    done = sink.done_paths()
+    skipped = len(paths)
+    paths = [p for p in paths if p not in done]
+    skipped -= len(paths)
+    if skipped:
+        print(f"Resuming: {skipped} images already in {args.output}", file=sys.stderr)
+    if not paths:
+        print("Nothing to do", file=sys.stderr)
+        return
+    # Failed images are retried; their old error rows are replaced by the new attempt's row
+    sink.drop_errors(set(paths))
+
+    workers = max(1, min(args.workers, len(paths)))
+    # Split the cores between workers unless TREESENSE_ORT_INTRA_OP_THREADS says otherwise
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    options = dict(conf=args.conf, iou=args.iou, tile_size=args.tile_size,
+                   overlap=args.overlap, batch_size=args.batch_size)
+
+    start = time.perf_counter()
+    failed = 0
+    for done_count, row in enumerate(run_batch(paths, sink, workers, args.backend, options, threads), 1):
+        failed += bool(row["error"])
+        if done_count % 25 == 0 or done_count == len(paths):
+            elapsed = time.perf_counter() - start
+            print(f"{done_count}/{len(paths)} images, {done_count / elapsed:.2f} img/s, {failed} failed",
+                  file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
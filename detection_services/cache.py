@@ -0,0 +1,89 @@
+"""
+Detection Result Cache
+Content-addressed, bounded LRU of detector output shared by every session
+in the process, so Streamlit reruns and repeat uploads skip inference
+"""
+
+import threading
+from collections import OrderedDict
+from typing import Callable, Union
+
+import numpy as np
+
+from imaging_services.ingest import content_hash
+
+from .backends import Detections
+
+DEFAULT_MAX_ENTRIES = 256
+
+
+class DetectionCache:
+    """Thread-safe LRU keyed by image content, model id and inference parameters"""
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Detections]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(image: Union[str, bytes, np.ndarray], model_id: str, **params) -> str:
+        """``image`` is raw bytes, an array, or an already computed content_hash"""
+        digest = image if isinstance(image, str) else content_hash(image)
+        settings = ",".join(f"{name}={params[name]!r}" for name in sorted(params))
+        return f"{digest}|{model_id}|{settings}"
+
+    def get(self, key: str):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: str, value: Detections) -> Detections:
+        boxes, scores = (np.array(v, copy=True) for v in value)
+        # Cached arrays are shared across sessions; make accidental in-place edits fail loudly
+        boxes.flags.writeable = False
+        scores.flags.writeable = False
+        with self._lock:
+            self._entries[key] = (boxes, scores)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return boxes, scores
+
+    def get_or_compute(self, key: str, compute: Callable[[], Detections]) -> Detections:
+        """Return the cached result for ``key`` or compute, store and return it"""
+        value = self.get(key)
+        if value is None:
+            value = self.put(key, compute())
+        return value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+            }
+
+
+_cache = DetectionCache()
+
+
+def get_detection_cache() -> DetectionCache:
+    """The process-wide detection cache"""
+    return _cache
@@ -0,0 +1,46 @@
+"""
+Change Detection Services
+Batched multi-epoch detection and tree-count comparison against a baseline
+"""
+
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+from .backends import DEFAULT_CONFIDENCE, DEFAULT_IOU, Detections, Predictor
+
+DEFAULT_EPOCH_BATCH_SIZE = 8
+
+
+def detect_epochs(detector: Predictor, images: Sequence[np.ndarray],
+                  batch_size: int = DEFAULT_EPOCH_BATCH_SIZE,
+                  conf: float = DEFAULT_CONFIDENCE, iou: float = DEFAULT_IOU) -> List[Detections]:
+    """
+    Detect trees in every epoch of a site with batched forward passes.
+
+    Epochs are sent ``batch_size`` at a time, so a before/after pair is a
+    single call and an N-date review costs ceil(N / batch_size) calls instead
+    of N. Results come back in input order.
+    """
+    detections = []
+    for start in range(0, len(images), batch_size):
+        detections.extend(detector.predict(list(images[start:start + batch_size]), conf=conf, iou=iou))
+    return detections
+
+
+def summarize_epochs(detections: Sequence[Detections], labels: Optional[Sequence[str]] = None) -> List[dict]:
+    """Tree count per epoch and the loss relative to the first (baseline) epoch"""
+    labels = labels or [f"Epoch {i + 1}" for i in range(len(detections))]
+    baseline = len(detections[0][0]) if detections else 0
+    rows = []
+    for label, (boxes, scores) in zip(labels, detections):
+        count = len(boxes)
+        loss = baseline - count
+        rows.append({
+            "Epoch": label,
+            "Trees": count,
+            "Loss vs Baseline": loss,
+            "Loss (%)": round(loss / baseline * 100, 2) if baseline > 0 else 0.0,
+            "Mean Confidence": round(float(np.mean(scores)), 3) if len(scores) else None,
+        })
+    return rows
@@ -0,0 +1,134 @@
+"""
+Detector Settings
+Environment-driven configuration for the tree detector backend
+"""
+
+import os
+from dataclasses import dataclass
+from typing import Optional
+
+BACKEND_ULTRALYTICS = "ultralytics"
+BACKEND_ONNX = "onnx"
+BACKEND_ONNX_INT8 = "onnx-int8"
+
+DEFAULT_MODEL_PATHS = {
+    BACKEND_ULTRALYTICS: "models/best.pt",
+    BACKEND_ONNX: "models/best.onnx",
+    BACKEND_ONNX_INT8: "models/best.int8.onnx",
+}
+
+ONNX_BACKENDS = (BACKEND_ONNX, BACKEND_ONNX_INT8)
+
+GRAPH_OPTIMIZATION_LEVELS = ("disable", "basic", "extended", "all")
+
+
+@dataclass
+class DetectorSettings:
+    """Which detector backend to run and how to tune it"""
+    backend: str = BACKEND_ULTRALYTICS
+    model_path: str = DEFAULT_MODEL_PATHS[BACKEND_ULTRALYTICS]
+    input_size: int = 640
+    # ONNX Runtime session options (0 threads = let ONNX Runtime decide)
+    intra_op_threads: int = 0
+    inter_op_threads: int = 0
+    graph_optimization: str = "extended"
+    optimized_model_path: str = ""
+
+
+@dataclass
+class InferenceServiceSettings:
+    """Sizing of the shared inference worker pool"""
+    workers: int = 1
+    max_queue: int = 64
+    max_batch: int = 8
+    batch_window_ms: float = 5.0
+    submit_timeout: float = 30.0
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.environ.get(name, "").strip()
+    try:
+        return int(value) if value else default
+    except ValueError:
+        raise ValueError(f"{name} must be an integer, got {value!r}")
+
+
+def _env_float(name: str, default: float) -> float:
+    value = os.environ.get(name, "").strip()
+    try:
+        return float(value) if value else default
+    except ValueError:
+        raise ValueError(f"{name} must be a number, got {value!r}")
+
+
+def load_detector_settings(backend: Optional[str] = None) -> DetectorSettings:
+    """
+    Read detector settings from the environment.
+
+    ``backend`` forces a backend regardless of TREESENSE_DETECTOR_BACKEND.
+
+    TREESENSE_DETECTOR_BACKEND      ultralytics (default), onnx or onnx-int8
+    TREESENSE_MODEL_PATH            weights file (defaults to models/best.pt, models/best.onnx
+                                    or models/best.int8.onnx)
+    TREESENSE_INPUT_SIZE            square model input size (default 640)
+    TREESENSE_ORT_INTRA_OP_THREADS  threads inside one operator
+    TREESENSE_ORT_INTER_OP_THREADS  threads across independent operators
+    TREESENSE_ORT_GRAPH_OPT         disable / basic / extended (default) / all
+                                    ("all" adds layout transforms tied to the host CPU)
+    TREESENSE_ORT_OPTIMIZED_MODEL   where to persist the optimized graph
+                                    (defaults to <model>.optimized.onnx, "none" to skip); the
+                                    optimization level and a settings hash are added to the name
+    """
+    backend = (backend or os.environ.get("TREESENSE_DETECTOR_BACKEND", BACKEND_ULTRALYTICS)).strip().lower()
+    if backend not in DEFAULT_MODEL_PATHS:
+        raise ValueError(f"Unknown detector backend {backend!r}; expected one of {sorted(DEFAULT_MODEL_PATHS)}")
+
+    model_path = os.environ.get("TREESENSE_MODEL_PATH", "").strip() or DEFAULT_MODEL_PATHS[backend]
+    expected = os.path.splitext(DEFAULT_MODEL_PATHS[backend])[1]
+    if os.path.splitext(model_path)[1].lower() != expected:
+        raise ValueError(f"TREESENSE_MODEL_PATH {model_path!r} does not match the {backend!r} backend, "
+                         f"which expects a {expected} file")
+
+    graph_optimization = os.environ.get("TREESENSE_ORT_GRAPH_OPT", "extended").strip().lower()
+    if graph_optimization not in GRAPH_OPTIMIZATION_LEVELS:
+        raise ValueError(f"TREESENSE_ORT_GRAPH_OPT must be one of {GRAPH_OPTIMIZATION_LEVELS}")
+
+    optimized_model_path = os.environ.get("TREESENSE_ORT_OPTIMIZED_MODEL", "").strip()
+    if optimized_model_path.lower() == "none":
+        optimized_model_path = ""
+    elif not optimized_model_path and backend in ONNX_BACKENDS:
+        optimized_model_path = os.path.splitext(model_path)[0] + ".optimized.onnx"
+
+    return DetectorSettings(
+        backend=backend,
+        model_path=model_path,
+        input_size=_env_int("TREESENSE_INPUT_SIZE", 640),
+        intra_op_threads=_env_int("TREESENSE_ORT_INTRA_OP_THREADS", 0),
+        inter_op_threads=_env_int("TREESENSE_ORT_INTER_OP_THREADS", 0),
+        graph_optimization=graph_optimization,
+        optimized_model_path=optimized_model_path,
+    )
+
+
+def load_service_settings() -> InferenceServiceSettings:
+    """
+    Read inference pool settings from the environment.
+
+    TREESENSE_INFERENCE_WORKERS          forward passes allowed at once (default 1); only the
+                                         ONNX backends run them in parallel, the ultralytics
+                                         backend is not thread-safe and serializes its passes
+    TREESENSE_INFERENCE_QUEUE            jobs waiting before submissions are refused (default 64)
+    TREESENSE_INFERENCE_MAX_BATCH        images merged into one forward pass (default 8)
+    TREESENSE_INFERENCE_BATCH_WINDOW_MS  how long a worker waits for more jobs to batch (default 5)
+    TREESENSE_INFERENCE_SUBMIT_TIMEOUT   seconds a session waits for queue space (default 30)
+    """
+    settings = InferenceServiceSettings(
+        workers=_env_int("TREESENSE_INFERENCE_WORKERS", 1),
+        max_queue=_env_int("TREESENSE_INFERENCE_QUEUE", 64),
+        max_batch=_env_int("TREESENSE_INFERENCE_MAX_BATCH", 8),
+        batch_window_ms=_env_float("TREESENSE_INFERENCE_BATCH_WINDOW_MS", 5.0),
+        submit_timeout=_env_float("TREESENSE_INFERENCE_SUBMIT_TIMEOUT", 30.0),
+    )
+    if settings.workers < 1 or settings.max_queue < 1 or settings.max_batch < 1:
+        raise ValueError("Inference workers, queue and batch sizes must be at least 1")
+    return settings
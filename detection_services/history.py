@@ -0,0 +1,242 @@
+"""
+Site History
+Persisted multi-epoch record of a monitored site. Every epoch's detections,
+bit-packed vegetation mask and a small registration level are stored once;
+adding an epoch processes only the new image and compares it with the
+latest stored epoch, so cost grows with the new data, not the history.
+
+Layout (under TREESENSE_SITE_DIR, default ~/.treesense/sites):
+    <site>/manifest.json           one record per epoch, in date order
+    <site>/epoch-NNNN.boxes.npz    detections (boxes, scores)
+    <site>/epoch-NNNN.mask.npz     PackedMask.save output
+    <site>/epoch-NNNN.level.npy    grayscale registration level
+"""
+
+import dataclasses
+import json
+import os
+import re
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+import cv2
+import numpy as np
+
+from imaging_services.change_map import GAIN, LOSS, change_map
+from imaging_services.image_source import ArraySource, ImageSource
+from imaging_services.packed_mask import PackedMask
+from imaging_services.registration import register_images
+
+from .backends import Detections
+from .canopy import canopy_union_area
+from .matching import DEFAULT_MATCH_IOU, match_trees
+
+DEFAULT_SITE_DIR = os.path.join(os.path.expanduser("~"), ".treesense", "sites")
+MANIFEST = "manifest.json"
+# Stored registration level: new epochs are aligned against it instead of the full previous image
+REGISTRATION_MAX_SIDE = 2048
+
+
+def _level_lift(scale: List[float]) -> np.ndarray:
+    """3x3 map from registration-level pixels to full-resolution pixels"""
+    return np.diag([scale[0], scale[1], 1.0])
+
+
+def site_dir() -> str:
+    return os.environ.get("TREESENSE_SITE_DIR", "").strip() or DEFAULT_SITE_DIR
+
+
+def site_slug(name: str) -> str:
+    """Folder name for a site"""
+    slug = re.sub(r"[^A-Za-z0-9_.-]+", "-", name.strip()).strip("-.")
+    if not slug:
+        raise ValueError(f"Invalid site name: {name!r}")
+    return slug
+
+
+def list_sites(root: Optional[str] = None) -> List[str]:
+    root = root or site_dir()
+    if not os.path.isdir(root):
+        return []
+    return sorted(name for name in os.listdir(root) if os.path.isfile(os.path.join(root, name, MANIFEST)))
+
+
+@dataclass
+class EpochRecord:
+    """One epoch of a site, with its comparison against the previous epoch"""
+    index: int
+    label: str
+    image_key: str
+    width: int
+    height: int
+    trees: int
+    mean_confidence: Optional[float]
+    canopy_area_px: float
+    cover_pct: float
+    # 2x3 affines from this epoch's pixels to the previous epoch / the baseline
+    to_previous: Optional[List[List[float]]] = None
+    to_baseline: Optional[List[List[float]]] = None
+    lost: int = 0
+    new: int = 0
+    persisting: int = 0
+    lost_area_px: float = 0.0
+    canopy_loss_pct: float = 0.0
+    canopy_gain_pct: float = 0.0
+    # Full-resolution pixels per registration-level pixel (x, y)
+    level_scale: Optional[List[float]] = None
+    added_at: float = field(default_factory=time.time)
+
+    def row(self) -> dict:
+        """Time-series table row"""
+        return {
+            "Epoch": self.label,
+            "Trees": self.trees,
+            "Lost": self.lost,
+            "New": self.new,
+            "Lost Crown Area (px²)": round(self.lost_area_px, 1),
+            "Green Cover (%)": round(self.cover_pct, 2),
+            "Canopy Loss (%)": round(self.canopy_loss_pct, 2),
+            "Canopy Gain (%)": round(self.canopy_gain_pct, 2),
+        }
+
+
+_site_locks: Dict[str, threading.Lock] = {}
+_site_locks_lock = threading.Lock()
+
+
+def _site_lock(path: str) -> threading.Lock:
+    with _site_locks_lock:
+        return _site_locks.setdefault(path, threading.Lock())
+
+
+class SiteHistory:
+    """
+    Epochs of one site on disk. The vegetation classifier is fixed when the
+    site is created so every epoch's mask and cover are comparable.
+    """
+
+    def __init__(self, name: str, method: str, threshold_factor: float, root: Optional[str] = None):
+        self.name = name
+        self.path = os.path.join(root or site_dir(), site_slug(name))
+        self.method = method
+        self.threshold_factor = threshold_factor
+        self.epochs: List[EpochRecord] = []
+
+    @classmethod
+    def open(cls, name: str, method: str, threshold_factor: float, root: Optional[str] = None) -> "SiteHistory":
+        """Load a site, or start an empty one with the given classifier settings"""
+        history = cls(name, method, threshold_factor, root)
+        history.reload()
+        return history
+
+    def reload(self) -> None:
+        manifest = os.path.join(self.path, MANIFEST)
+        if os.path.exists(manifest):
+            with open(manifest) as f:
+                data = json.load(f)
+            self.name = data["name"]
+            self.method = data["method"]
+            self.threshold_factor = data["threshold_factor"]
+            self.epochs = [EpochRecord(**record) for record in data["epochs"]]
+
+    def _file(self, index: int, suffix: str) -> str:
+        return os.path.join(self.path, f"epoch-{index:04d}.{suffix}")
+
+    def _save_manifest(self) -> None:
+        data = {
+            "name": self.name,
+            "method": self.method,
+            "threshold_factor": self.threshold_factor,
+            "epochs": [dataclasses.asdict(record) for record in self.epochs],
+        }
+        # Written to a temp name and renamed, so readers never see a partial manifest
+        temp = os.path.join(self.path, f".{MANIFEST}.{os.getpid()}.part")
+        with open(temp, "w") as f:
+            json.dump(data, f, indent=1)
+        os.replace(temp, os.path.join(self.path, MANIFEST))
+
+    def find(self, image_key: str) -> Optional[EpochRecord]:
+        return next((record for record in self.epochs if record.image_key == image_key), None)
+
+    def detections(self, index: int) -> Detections:
+        with np.load(self._file(index, "boxes.npz")) as data:
+            return data["boxes"], data["scores"]
+
+    def mask(self, index: int) -> PackedMask:
+        return PackedMask.load(self._file(index, "mask.npz"))
+
+    def registration_level(self, index: int) -> np.ndarray:
+        return np.load(self._file(index, "level.npy"))
+
+    def level_scale(self, record: EpochRecord, level: np.ndarray) -> List[float]:
+        """Stored level scale, or the size ratio for epochs saved before it was recorded"""
+        if record.level_scale is not None:
+            return record.level_scale
+        return [record.width / level.shape[1], record.height / level.shape[0]]
+
+    def add_epoch(self, label: str, image_key: str, source: ImageSource, detections: Detections,
+                  mask: PackedMask, iou_threshold: float = DEFAULT_MATCH_IOU) -> EpochRecord:
+        """
+        Store a new (latest) epoch and compare it with the previous one.
+
+        ``detections`` and ``mask`` are this image's tree detections and
+        vegetation mask (classified with the site's method). Only the
+        previous epoch's stored detections, mask and registration level are
+        read back.
+        """
+        with _site_lock(self.path):
+            # Another session may have added epochs since this one was opened
+            self.reload()
+            existing = self.find(image_key)
+            if existing is not None:
+                return existing
+            os.makedirs(self.path, exist_ok=True)
+            index = len(self.epochs)
+            boxes, scores = (np.asarray(v) for v in detections)
+            record = EpochRecord(
+                index=index, label=label, image_key=image_key, width=source.width, height=source.height,
+                trees=len(boxes), mean_confidence=round(float(np.mean(scores)), 3) if len(scores) else None,
+                canopy_area_px=canopy_union_area(boxes, source.width, source.height),
+                cover_pct=mask.count_nonzero() / (source.width * source.height) * 100,
+                level_scale=list(source.thumbnail_scale(REGISTRATION_MAX_SIDE)),
+            )
+
+            level = source.thumbnail(REGISTRATION_MAX_SIDE)
+            level = level if level.ndim == 2 else cv2.cvtColor(level, cv2.COLOR_RGB2GRAY)
+            if self.epochs:
+                previous = self.epochs[-1]
+                previous_level = self.registration_level(previous.index)
+                # Registered level to level, then lifted to full resolution on both sides
+                registration = register_images(ArraySource(previous_level), ArraySource(level))
+                to_previous = (_level_lift(self.level_scale(previous, previous_level))
+                               @ np.vstack([registration.matrix, [0, 0, 1]])
+                               @ np.linalg.inv(_level_lift(record.level_scale)))[:2]
+                registration = dataclasses.replace(registration, matrix=to_previous)
+                to_baseline = np.vstack([previous.to_baseline, [0, 0, 1]]) @ np.vstack([to_previous, [0, 0, 1]])
+
+                previous_boxes, _ = self.detections(previous.index)
+                matches = match_trees(previous_boxes, boxes, to_previous, iou_threshold=iou_threshold)
+                change = change_map(self.mask(previous.index), mask, registration)
+                overlap = max(change.overlap_pixels, 1)
+                record.to_previous = to_previous.tolist()
+                record.to_baseline = to_baseline[:2].tolist()
+                record.lost, record.new, record.persisting = \
+                    matches.lost_count, matches.new_count, matches.persisting_count
+                record.lost_area_px = matches.lost_area
+                record.canopy_loss_pct = float(change.counts[LOSS]) / overlap * 100
+                record.canopy_gain_pct = float(change.counts[GAIN]) / overlap * 100
+            else:
+                record.to_baseline = np.eye(2, 3).tolist()
+
+            np.savez(self._file(index, "boxes.npz"), boxes=boxes, scores=scores)
+            mask.save(self._file(index, "mask.npz"))
+            np.save(self._file(index, "level.npy"), level)
+            self.epochs.append(record)
+            self._save_manifest()
+            return record
+
+    def time_series(self) -> List[dict]:
+        """One row per epoch, read from the manifest only"""
+        return [record.row() for record in self.epochs]
@@ -0,0 +1,264 @@
+"""
+Tree Matching
+One-to-one matching of crown detections between two epochs, so change is
+reported per tree (lost / new / persisting) instead of as a count
+difference. Candidate pairs come from uniform grid hashes (crown extents
+for the IoU gate, centroids for the distance gate), so matching costs
+O(n log n) rather than O(n * m).
+"""
+
+from dataclasses import dataclass
+from typing import Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from .canopy import canopy_union_area
+from .postprocess import box_areas
+
+MATCH_IOU = "iou"
+MATCH_DISTANCE = "distance"
+DEFAULT_MATCH_IOU = 0.3
+# 3x3 neighbourhood of grid cells searched around each centroid
+_NEIGHBOURS = [(dx, dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1)]
+
+STATUS_PERSISTING = "persisting"
+STATUS_LOST = "lost"
+STATUS_NEW = "new"
+
+
+@dataclass
+class TreeMatches:
+    """Matched (before, after) index pairs plus the unmatched trees of each epoch"""
+    pairs: np.ndarray
+    scores: np.ndarray
+    lost: np.ndarray
+    new: np.ndarray
+    boxes_before: np.ndarray
+    boxes_after: np.ndarray
+
+    @property
+    def persisting_count(self) -> int:
+        return len(self.pairs)
+
+    @property
+    def lost_count(self) -> int:
+        return len(self.lost)
+
+    @property
+    def new_count(self) -> int:
+        return len(self.new)
+
+    @property
+    def lost_area(self) -> float:
+        """Union crown area (px², baseline frame) of the lost trees"""
+        return canopy_union_area(self.boxes_before[self.lost]) if len(self.lost) else 0.0
+
+    @property
+    def new_area(self) -> float:
+        """Union crown area (px², baseline frame) of the new trees"""
+        return canopy_union_area(self.boxes_after[self.new]) if len(self.new) else 0.0
+
+    def before_status(self) -> np.ndarray:
+        """Status label of every baseline tree"""
+        status = np.full(len(self.boxes_before), STATUS_PERSISTING, dtype=object)
+        status[self.lost] = STATUS_LOST
+        return status
+
+    def after_status(self) -> np.ndarray:
+        """Status label of every later tree"""
+        status = np.full(len(self.boxes_after), STATUS_PERSISTING, dtype=object)
+        status[self.new] = STATUS_NEW
+        return status
+
+    def summary(self) -> dict:
+        return {
+            "persisting": self.persisting_count,
+            "lost": self.lost_count,
+            "new": self.new_count,
+            "lost_area_px": round(self.lost_area, 1),
+            "new_area_px": round(self.new_area, 1),
+        }
+
+
+def transform_boxes(boxes: np.ndarray, matrix: Optional[np.ndarray]) -> np.ndarray:
+    """Axis-aligned bounds of xyxy boxes after a 2x3 affine (None = unchanged)"""
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    if matrix is None or not len(boxes):
+        return boxes
+    matrix = np.asarray(matrix, dtype=np.float64)
+    corners = boxes[:, [[0, 1], [2, 1], [0, 3], [2, 3]]]
+    mapped = corners @ matrix[:, :2].T + matrix[:, 2]
+    return np.concatenate([mapped.min(axis=1), mapped.max(axis=1)], axis=1)
+
+
+def _centroids(boxes: np.ndarray) -> np.ndarray:
+    return np.stack([(boxes[:, 0] + boxes[:, 2]) / 2, (boxes[:, 1] + boxes[:, 3]) / 2], axis=1)
+
+
+def _cells(points: np.ndarray, cell_size: float) -> np.ndarray:
+    return np.floor(points / cell_size).astype(np.int64)
+
+
+def _cell_keys(cells: np.ndarray) -> np.ndarray:
+    # Cells are offset so both coordinates are non-negative 32-bit values
+    return (cells[:, 0] << 32) | cells[:, 1]
+
+
+def candidate_pairs(points_a: np.ndarray, points_b: np.ndarray,
+                    radius: float) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+    """
+    Yield (i, j) index arrays of every point pair closer than ``radius``.
+
+    ``points_a`` is hashed into a grid of ``radius``-sized cells and sorted
+    by cell key; each point of ``points_b`` finds the run of ``points_a`` in
+    each of its 9 neighbouring cells with ``searchsorted``, so pairs are
+    generated without an n x m matrix.
+    """
+    if not len(points_a) or not len(points_b):
+        return
+    origin = np.minimum(points_a.min(axis=0), points_b.min(axis=0)) - radius
+    cells_a = _cells(points_a - origin, radius)
+    cells_b = _cells(points_b - origin, radius)
+    keys_a = _cell_keys(cells_a)
+    order = np.argsort(keys_a, kind="stable")
+    sorted_keys = keys_a[order]
+    for dx, dy in _NEIGHBOURS:
+        keys = _cell_keys(cells_b + [dx, dy])
+        starts = np.searchsorted(sorted_keys, keys, side="left")
+        counts = np.searchsorted(sorted_keys, keys, side="right") - starts
+        total = int(counts.sum())
+        if not total:
+            continue
+        second = np.repeat(np.arange(len(points_b)), counts)
+        offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+        first = order[np.repeat(starts, counts) + offsets]
+        close = np.hypot(*(points_a[first] - points_b[second]).T) <= radius
+        yield first[close], second[close]
+
+
+def _expand_cells(lo: np.ndarray, hi: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """(box index, cell) of every grid cell inside each box's inclusive [lo, hi] cell range"""
+    spans = hi - lo + 1
+    counts = spans[:, 0] * spans[:, 1]
+    total = int(counts.sum())
+    owner = np.repeat(np.arange(len(lo)), counts)
+    offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+    height = spans[owner, 1]
+    return owner, lo[owner] + np.stack([offsets // height, offsets % height], axis=1)
+
+
+def overlapping_pairs(boxes_a: np.ndarray, boxes_b: np.ndarray, cell_size: float,
+                      max_pairs: int = 4_000_000) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+    """
+    Yield (i, j) index arrays of box pairs whose extents share a grid cell.
+
+    Every box is hashed into each ``cell_size`` cell its extent touches, so
+    a box costs (its side / cell_size)² entries and is only paired with the
+    boxes under it: one oversized box adds work in proportion to its area,
+    instead of widening the search for every other box. A pair is emitted
+    once, from the cell holding the corner of the two ranges' intersection.
+    Pairs are emitted in chunks of at most ``max_pairs``.
+    """
+    if not len(boxes_a) or not len(boxes_b):
+        return
+    origin = np.minimum(boxes_a[:, :2].min(axis=0), boxes_b[:, :2].min(axis=0))
+    lo_a, hi_a = _cells(boxes_a[:, :2] - origin, cell_size), _cells(boxes_a[:, 2:] - origin, cell_size)
+    lo_b, hi_b = _cells(boxes_b[:, :2] - origin, cell_size), _cells(boxes_b[:, 2:] - origin, cell_size)
+    owner_a, cells_a = _expand_cells(lo_a, hi_a)
+    owner_b, cells_b = _expand_cells(lo_b, hi_b)
+    keys_a = _cell_keys(cells_a)
+    order = np.argsort(keys_a, kind="stable")
+    sorted_keys, sorted_owner = keys_a[order], owner_a[order]
+    keys_b = _cell_keys(cells_b)
+    starts = np.searchsorted(sorted_keys, keys_b, side="left")
+    counts = np.searchsorted(sorted_keys, keys_b, side="right") - starts
+
+    row = 0
+    while row < len(keys_b):
+        cumulative = np.cumsum(counts[row:])
+        stop = row + max(1, int(np.searchsorted(cumulative, max_pairs, side="right")))
+        chunk = counts[row:stop]
+        total = int(chunk.sum())
+        if total:
+            entry = np.repeat(np.arange(row, stop), chunk)
+            offsets = np.arange(total) - np.repeat(np.cumsum(chunk) - chunk, chunk)
+            first = sorted_owner[np.repeat(starts[row:stop], chunk) + offsets]
+            second = owner_b[entry]
+            corner = np.maximum(lo_a[first], lo_b[second])
+            once = np.all(cells_b[entry] == corner, axis=1)
+            yield first[once], second[once]
+        row = stop
+
+
+def _pair_iou(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    inter_w = np.clip(np.minimum(a[:, 2], b[:, 2]) - np.maximum(a[:, 0], b[:, 0]), 0, None)
+    inter_h = np.clip(np.minimum(a[:, 3], b[:, 3]) - np.maximum(a[:, 1], b[:, 1]), 0, None)
+    inter = inter_w * inter_h
+    union = box_areas(a) + box_areas(b) - inter
+    return np.divide(inter, union, out=np.zeros_like(inter), where=union > 0)
+
+
+def match_trees(boxes_before: np.ndarray, boxes_after: np.ndarray, transform: Optional[np.ndarray] = None,
+                metric: str = MATCH_IOU, iou_threshold: float = DEFAULT_MATCH_IOU,
+                max_distance: Optional[float] = None) -> TreeMatches:
+    """
+    Match baseline crowns to later crowns one-to-one.
+
+    ``transform`` (2x3) maps later-image pixels onto the baseline, e.g. a
+    Registration matrix; later boxes are moved into the baseline frame
+    before matching. With metric="iou", crowns whose extents overlap by at
+    least ``iou_threshold`` are candidates (found through overlapping_pairs
+    on a grid of median crown sides), so large crowns are matched among
+    small ones; ``max_distance``, when given, also bounds their centroid
+    distance. With metric="distance", pairs whose centroids lie within
+    ``max_distance`` (default: the median crown side) are candidates.
+    Candidates are then accepted greedily, best IoU (or shortest distance)
+    first.
+    """
+    before = np.asarray(boxes_before, dtype=np.float64).reshape(-1, 4)
+    after = transform_boxes(boxes_after, transform)
+    sides = np.concatenate([before[:, 2:] - before[:, :2], after[:, 2:] - after[:, :2]]).ravel()
+    median_side = float(np.median(sides)) if len(sides) else 1.0
+    if metric == MATCH_IOU:
+        candidates = overlapping_pairs(before, after, max(median_side, 1.0))
+    else:
+        radius = max(median_side if max_distance is None else max_distance, 1e-6)
+        candidates = candidate_pairs(_centroids(before), _centroids(after), radius)
+
+    firsts: List[np.ndarray] = []
+    seconds: List[np.ndarray] = []
+    ranks: List[np.ndarray] = []
+    for first, second in candidates:
+        if metric == MATCH_IOU:
+            score = _pair_iou(before[first], after[second])
+            keep = score >= iou_threshold
+            if max_distance is not None:
+                keep &= np.hypot(*(_centroids(before[first]) - _centroids(after[second])).T) <= max_distance
+            first, second, rank = first[keep], second[keep], -score[keep]
+        else:
+            rank = np.hypot(*(_centroids(before[first]) - _centroids(after[second])).T)
+        firsts.append(first)
+        seconds.append(second)
+        ranks.append(rank)
+
+    matched_before = np.zeros(len(before), dtype=bool)
+    matched_after = np.zeros(len(after), dtype=bool)
+    pairs, scores = [], []
+    if firsts:
+        first, second, rank = np.concatenate(firsts), np.concatenate(seconds), np.concatenate(ranks)
+        for k in np.argsort(rank, kind="stable"):
+            i, j = first[k], second[k]
+            if matched_before[i] or matched_after[j]:
+                continue
+            matched_before[i] = matched_after[j] = True
+            pairs.append((i, j))
+            scores.append(-rank[k] if metric == MATCH_IOU else rank[k])
+
+    return TreeMatches(
+        pairs=np.asarray(pairs, dtype=np.int64).reshape(-1, 2),
+        scores=np.asarray(scores, dtype=np.float64),
+        lost=np.flatnonzero(~matched_before),
+        new=np.flatnonzero(~matched_after),
+        boxes_before=before,
+        boxes_after=after,
+    )
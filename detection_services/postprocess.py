@@ -0,0 +1,168 @@
+"""
+Detection Post-processing
+Box overlap metrics, non-maximum suppression and YOLO output decoding on NumPy arrays
+"""
+
+from typing import Tuple
+
+import numpy as np
+
+
+def box_areas(boxes: np.ndarray) -> np.ndarray:
+    """Area of each xyxy box (degenerate boxes count as zero)"""
+    widths = np.clip(boxes[:, 2] - boxes[:, 0], 0, None)
+    heights = np.clip(boxes[:, 3] - boxes[:, 1], 0, None)
+    return widths * heights
+
+
+def box_overlap(box: np.ndarray, boxes: np.ndarray, metric: str = "iou") -> np.ndarray:
+    """
+    Overlap between one xyxy box and an (N, 4) array of boxes.
+
+    metric="iou" is intersection over union, metric="ios" is intersection
+    over the smaller of the two areas (used to merge crowns cut by a tile seam).
+    """
+    xx1 = np.maximum(box[0], boxes[:, 0])
+    yy1 = np.maximum(box[1], boxes[:, 1])
+    xx2 = np.minimum(box[2], boxes[:, 2])
+    yy2 = np.minimum(box[3], boxes[:, 3])
+    inter = np.clip(xx2 - xx1, 0, None) * np.clip(yy2 - yy1, 0, None)
+
+    area = max(float(box[2] - box[0]), 0.0) * max(float(box[3] - box[1]), 0.0)
+    areas = box_areas(boxes)
+    if metric == "ios":
+        denom = np.minimum(area, areas)
+    else:
+        denom = area + areas - inter
+    return np.divide(inter, denom, out=np.zeros_like(inter, dtype=np.float64), where=denom > 0)
+
+
+def _x_overlapping_pairs(boxes: np.ndarray, max_pairs: int = 4_000_000):
+    """
+    Yield (i, j) index arrays covering every pair of boxes whose x-extents intersect.
+
+    Boxes are sorted by x1 and each box's partners are the contiguous run found
+    with ``searchsorted`` on its x2, so pairs are generated without an n x n
+    matrix. Runs are emitted in chunks of at most ``max_pairs`` pairs.
+    """
+    n = len(boxes)
+    order = np.argsort(boxes[:, 0], kind="stable")
+    x1_sorted = boxes[order, 0]
+    ends = np.searchsorted(x1_sorted, boxes[order, 2], side="left")
+    starts = np.arange(1, n + 1)
+    counts = np.maximum(ends - starts, 0)
+
+    row = 0
+    while row < n:
+        cumulative = np.cumsum(counts[row:])
+        stop = row + max(1, int(np.searchsorted(cumulative, max_pairs, side="right")))
+        chunk = counts[row:stop]
+        total = int(chunk.sum())
+        if total:
+            first = np.repeat(np.arange(row, stop), chunk)
+            offsets = np.arange(total) - np.repeat(np.cumsum(chunk) - chunk, chunk)
+            second = np.repeat(starts[row:stop], chunk) + offsets
+            yield order[first], order[second]
+        row = stop
+
+
+def nms(boxes: np.ndarray, scores: np.ndarray, iou_threshold: float = 0.5, metric: str = "iou") -> np.ndarray:
+    """
+    Greedy non-maximum suppression.
+
+    Returns the indices of the kept boxes, highest score first. Candidate pairs
+    come from an x-sorted sweep and their overlaps are computed as one array
+    operation; the greedy pass then only walks the sparse list of pairs above
+    the threshold, so cost grows with the number of overlapping neighbours
+    rather than with n squared.
+    """
+    n = len(boxes)
+    if n == 0:
+        return np.empty(0, dtype=np.int64)
+
+    boxes = np.asarray(boxes, dtype=np.float32)
+    order = np.argsort(-np.asarray(scores), kind="stable")
+    rank = np.empty(n, dtype=np.int64)
+    rank[order] = np.arange(n)
+    areas = box_areas(boxes)
+
+    winners, losers = [], []
+    for a, b in _x_overlapping_pairs(boxes):
+        xx1 = np.maximum(boxes[a, 0], boxes[b, 0])
+        yy1 = np.maximum(boxes[a, 1], boxes[b, 1])
+        xx2 = np.minimum(boxes[a, 2], boxes[b, 2])
+        yy2 = np.minimum(boxes[a, 3], boxes[b, 3])
+        inter = np.clip(xx2 - xx1, 0, None) * np.clip(yy2 - yy1, 0, None)
+        if metric == "ios":
+            denom = np.minimum(areas[a], areas[b])
+        else:
+            denom = areas[a] + areas[b] - inter
+        hit = inter > iou_threshold * denom
+        hit &= denom > 0
+        a, b = a[hit], b[hit]
+        a_wins = rank[a] < rank[b]
+        winners.append(np.where(a_wins, a, b))
+        losers.append(np.where(a_wins, b, a))
+
+    if not winners or sum(len(w) for w in winners) == 0:
+        return order.astype(np.int64)
+
+    winners = np.concatenate(winners)
+    losers = np.concatenate(losers)
+    by_winner = np.argsort(winners, kind="stable")
+    losers = losers[by_winner]
+    indptr = np.concatenate([[0], np.cumsum(np.bincount(winners, minlength=n))])
+
+    suppressed = np.zeros(n, dtype=bool)
+    keep = []
+    for i in order:
+        if suppressed[i]:
+            continue
+        keep.append(i)
+        lo, hi = indptr[i], indptr[i + 1]
+        if hi > lo:
+            suppressed[losers[lo:hi]] = True
+    return np.asarray(keep, dtype=np.int64)
+
+
+def decode_yolo_output(output: np.ndarray, img_width: int, img_height: int,
+                       conf_threshold: float = 0.25, iou_threshold: float = 0.7,
+                       input_size: int = 640, max_candidates: int = 30000) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Decode a raw YOLOv8 head output into boxes in original image pixels.
+
+    ``output`` is the ``(1, 4 + num_classes, N)`` tensor returned by the ONNX
+    export (``(1, 5, N)`` for the single-class tree model). Confidence
+    filtering, xywh -> xyxy conversion and rescaling are single array
+    operations over all N predictions.
+
+    Returns (boxes_xyxy float32 (M, 4), scores float32 (M,)).
+    """
+    pred = np.asarray(output)
+    if pred.ndim == 3:
+        pred = pred[0]
+    if pred.shape[0] > pred.shape[1]:
+        # Some exporters emit (N, 4 + num_classes)
+        pred = pred.T
+
+    scores = pred[4:].max(axis=0) if pred.shape[0] > 5 else pred[4]
+    candidates = np.flatnonzero(scores >= conf_threshold)
+    if candidates.size > max_candidates:
+        top = np.argpartition(-scores[candidates], max_candidates)[:max_candidates]
+        candidates = candidates[top]
+    if candidates.size == 0:
+        return np.empty((0, 4), np.float32), np.empty(0, np.float32)
+
+    xc, yc, w, h = pred[:4, candidates]
+    scale_x = img_width / input_size
+    scale_y = img_height / input_size
+    boxes = np.stack([
+        (xc - w / 2) * scale_x,
+        (yc - h / 2) * scale_y,
+        (xc + w / 2) * scale_x,
+        (yc + h / 2) * scale_y,
+    ], axis=1).astype(np.float32)
+    scores = scores[candidates].astype(np.float32)
+
+    keep = nms(boxes, scores, iou_threshold)
+    return boxes[keep], scores[keep]
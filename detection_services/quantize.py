@@ -0,0 +1,129 @@
+"""
+INT8 Detector Quantization
+Builds the onnx-int8 detector variant from the FP32 ONNX export, either
+with dynamic (weight-only) quantization or with static quantization
+calibrated on a local folder of survey images
+
+Usage:
+    python -m detection_services.quantize --mode static --calibration data/calibration
+    python -m detection_services.quantize --mode dynamic
+"""
+
+import argparse
+import glob
+import os
+import tempfile
+from typing import Iterator, List, Optional, Sequence
+
+import numpy as np
+from PIL import Image
+
+from .backends import to_input_tensor
+from .config import BACKEND_ONNX, BACKEND_ONNX_INT8, DEFAULT_MODEL_PATHS
+
+QUANTIZATION_MODES = ("dynamic", "static")
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".tif", ".tiff")
+DEFAULT_CALIBRATION_IMAGES = 64
+
+
+def list_images(folder: str, extensions: Sequence[str] = IMAGE_EXTENSIONS) -> List[str]:
+    """Image files directly inside ``folder``, sorted by name"""
+    paths = glob.glob(os.path.join(folder, "*"))
+    return sorted(p for p in paths if os.path.splitext(p)[1].lower() in extensions)
+
+
+def _calibration_reader(input_name: str, paths: Sequence[str], input_size: int):
+    from onnxruntime.quantization import CalibrationDataReader
+
+    class FolderCalibrationReader(CalibrationDataReader):
+        """Feeds calibration images preprocessed exactly like OnnxBackend does"""
+
+        def __init__(self):
+            self._batches: Iterator[dict] = (
+                {input_name: to_input_tensor(np.array(Image.open(p).convert("RGB")), input_size)[None]}
+                for p in paths
+            )
+
+        def get_next(self) -> Optional[dict]:
+            return next(self._batches, None)
+
+    return FolderCalibrationReader()
+
+
+def quantize_detector(source: str = DEFAULT_MODEL_PATHS[BACKEND_ONNX],
+                      output: str = DEFAULT_MODEL_PATHS[BACKEND_ONNX_INT8],
+                      mode: str = "static",
+                      calibration_dir: Optional[str] = None,
+                      max_images: int = DEFAULT_CALIBRATION_IMAGES,
+                      input_size: int = 640,
+                      per_channel: bool = True,
+                      exclude_nodes: Sequence[str] = ()) -> str:
+    """
+    Write an INT8 copy of the FP32 detector and return its path.
+
+    ``dynamic`` quantizes weights ahead of time and activations on the fly,
+    so no data is needed. ``static`` also fixes activation ranges from
+    ``calibration_dir`` (QDQ format, MinMax calibration), which is usually
+    faster on CPU for convolutional models. ``exclude_nodes`` keeps
+    accuracy-sensitive nodes, typically the detection head, in float.
+    """
+    import onnx
+    from onnxruntime.quantization import (CalibrationMethod, QuantFormat, QuantType,
+                                          quantize_dynamic, quantize_static)
+
+    if mode not in QUANTIZATION_MODES:
+        raise ValueError(f"Unknown quantization mode {mode!r}; expected one of {QUANTIZATION_MODES}")
+    if not os.path.exists(source):
+        raise FileNotFoundError(f"Model weights not found: {source}")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+
+    if mode == "dynamic":
+        quantize_dynamic(source, output, weight_type=QuantType.QUInt8, per_channel=per_channel,
+                         nodes_to_exclude=list(exclude_nodes))
+        return output
+
+    if not calibration_dir:
+        raise ValueError("Static quantization needs a calibration image folder")
+    paths = list_images(calibration_dir)[:max_images]
+    if not paths:
+        raise FileNotFoundError(f"No calibration images found in {calibration_dir}")
+
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+
+    input_name = onnx.load(source, load_external_data=False).graph.input[0].name
+    with tempfile.TemporaryDirectory() as workdir:
+        # Shape inference and graph folding first, so every tensor gets a calibrated range
+        prepared = os.path.join(workdir, "prepared.onnx")
+        quant_pre_process(source, prepared, skip_symbolic_shape=True)
+        quantize_static(prepared, output, _calibration_reader(input_name, paths, input_size),
+                        quant_format=QuantFormat.QDQ,
+                        activation_type=QuantType.QUInt8,
+                        weight_type=QuantType.QInt8,
+                        per_channel=per_channel,
+                        calibrate_method=CalibrationMethod.MinMax,
+                        nodes_to_exclude=list(exclude_nodes))
+    return output
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Quantize the ONNX tree detector to INT8")
+    parser.add_argument("--source", default=DEFAULT_MODEL_PATHS[BACKEND_ONNX], help="FP32 ONNX export")
+    parser.add_argument("--output", default=DEFAULT_MODEL_PATHS[BACKEND_ONNX_INT8], help="INT8 model to write")
+    parser.add_argument("--mode", choices=QUANTIZATION_MODES, default="static")
+    parser.add_argument("--calibration", help="Folder of representative images (static mode)")
+    parser.add_argument("--max-images", type=int, default=DEFAULT_CALIBRATION_IMAGES,
+                        help="Calibration images to use")
+    parser.add_argument("--input-size", type=int, default=640)
+    parser.add_argument("--per-tensor", action="store_true", help="One scale per tensor instead of per channel")
+    parser.add_argument("--exclude", nargs="*", default=[], help="Node names to keep in float")
+    args = parser.parse_args()
+
+    output = quantize_detector(args.source, args.output, args.mode, args.calibration, args.max_images,
+                               args.input_size, per_channel=not args.per_tensor, exclude_nodes=args.exclude)
+    size_in, size_out = os.path.getsize(args.source), os.path.getsize(output)
+    print(f"Wrote {output} ({size_out / 1e6:.1f} MB, {size_in / size_out:.1f}x smaller than FP32)")
+    print(f"Select it with TREESENSE_DETECTOR_BACKEND={BACKEND_ONNX_INT8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Model Registry
+One process-wide tree detector shared by every page and session, loaded
+and warmed up on a background thread when the app starts
+"""
+
+import threading
+import time
+from typing import Callable, Optional
+
+import numpy as np
+
+from .backends import DetectorBackend, create_backend
+
+
+class DetectorUnavailableError(RuntimeError):
+    """The shared detector failed to load or warm up (the original error is the __cause__)"""
+
+
+class ModelRegistry:
+    """
+    Loads the detector once per process.
+
+    ``start_warmup`` returns immediately and loads the weights plus one dummy
+    inference (which pays for lazy kernel/graph initialisation) on a daemon
+    thread. ``get_detector`` blocks until that finishes, or loads synchronously
+    if warm-up was never started. A load failure of any kind is remembered and
+    re-raised to every caller as DetectorUnavailableError instead of being
+    retried on each Streamlit rerun.
+    """
+
+    def __init__(self, factory: Callable[[], DetectorBackend] = create_backend):
+        self._factory = factory
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._detector: Optional[DetectorBackend] = None
+        self._error: Optional[BaseException] = None
+        self.load_seconds: Optional[float] = None
+        self.warmup_seconds: Optional[float] = None
+
+    def _load(self) -> None:
+        try:
+            start = time.perf_counter()
+            detector = self._factory()
+            self.load_seconds = time.perf_counter() - start
+
+            start = time.perf_counter()
+            size = detector.settings.input_size
+            detector.predict([np.zeros((size, size, 3), dtype=np.uint8)])
+            self.warmup_seconds = time.perf_counter() - start
+
+            self._detector = detector
+        except Exception as e:
+            error = DetectorUnavailableError(str(e) or type(e).__name__)
+            error.__cause__ = e
+            self._error = error
+        finally:
+            self._ready.set()
+
+    def start_warmup(self) -> None:
+        """Begin loading in the background (no-op if already started)"""
+        with self._lock:
+            if self._thread is not None or self._ready.is_set():
+                return
+            self._thread = threading.Thread(target=self._load, name="detector-warmup", daemon=True)
+            self._thread.start()
+
+    @property
+    def is_ready(self) -> bool:
+        return self._ready.is_set()
+
+    def get_detector(self, timeout: Optional[float] = None) -> DetectorBackend:
+        """Return the shared detector, waiting for warm-up if it is still running"""
+        with self._lock:
+            if self._thread is None and not self._ready.is_set():
+                self._load()
+        if not self._ready.wait(timeout):
+            raise TimeoutError("Tree detector is still loading")
+        if self._error is not None:
+            raise self._error
+        return self._detector
+
+    def status(self) -> dict:
+        return {
+            "ready": self.is_ready,
+            "backend": self._detector.name if self._detector is not None else None,
+            "error": str(self._error) if self._error is not None else None,
+            "load_seconds": self.load_seconds,
+            "warmup_seconds": self.warmup_seconds,
+        }
+
+
+_registry = ModelRegistry()
+
+
+def get_registry() -> ModelRegistry:
+    return _registry
+
+
+def start_warmup() -> None:
+    """Kick off background loading of the shared detector"""
+    _registry.start_warmup()
+
+
+def get_detector(timeout: Optional[float] = None) -> DetectorBackend:
+    """The shared, warmed-up detector for this process"""
+    return _registry.get_detector(timeout)
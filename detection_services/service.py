@@ -0,0 +1,201 @@
+"""
+Inference Service
+A bounded queue in front of a fixed pool of worker threads that own every
+forward pass in the process. Streamlit sessions submit jobs and wait on
+futures; jobs that arrive close together are merged into one batch.
+"""
+
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Callable, List, Optional, Sequence
+
+import numpy as np
+
+from .backends import DEFAULT_CONFIDENCE, DEFAULT_IOU, DetectorBackend, Detections
+from .config import InferenceServiceSettings, load_service_settings
+from .registry import get_detector
+from .tiling import BatchPredictor
+
+# Recent jobs kept for latency percentiles
+STATS_WINDOW = 2048
+
+
+class InferenceBusyError(RuntimeError):
+    """The inference queue stayed full for the whole submit timeout"""
+
+
+@dataclass
+class _Job:
+    images: List[np.ndarray]
+    conf: float
+    iou: float
+    future: Future = field(default_factory=Future)
+    enqueued: float = field(default_factory=time.perf_counter)
+
+
+class InferenceService:
+    """
+    Fixed worker pool with micro-batching and backpressure.
+
+    Each worker takes the oldest job, then keeps collecting queued jobs for
+    up to ``batch_window_ms`` or until ``max_batch`` images are gathered,
+    and runs them as one ``predict`` call per (conf, iou) setting. With the
+    default single worker, concurrent sessions never run competing forward
+    passes; they queue, and ``submit`` refuses work once ``max_queue`` jobs
+    are waiting so latency stays bounded instead of growing without limit.
+    """
+
+    def __init__(self, settings: Optional[InferenceServiceSettings] = None,
+                 detector_provider: Callable[[], DetectorBackend] = get_detector):
+        self.settings = settings or load_service_settings()
+        self._detector_provider = detector_provider
+        self._queue: "queue.Queue[Optional[_Job]]" = queue.Queue(maxsize=self.settings.max_queue)
+        self._lock = threading.Lock()
+        self._workers: List[threading.Thread] = []
+        self._waits = deque(maxlen=STATS_WINDOW)
+        self._services = deque(maxlen=STATS_WINDOW)
+        self.submitted = 0
+        self.completed = 0
+        self.rejected = 0
+        self.batches = 0
+        self.batched_images = 0
+
+    def _ensure_workers(self) -> None:
+        with self._lock:
+            if self._workers:
+                return
+            for index in range(self.settings.workers):
+                worker = threading.Thread(target=self._run, name=f"inference-worker-{index}", daemon=True)
+                worker.start()
+                self._workers.append(worker)
+
+    def submit(self, images: Sequence[np.ndarray], conf: float = DEFAULT_CONFIDENCE,
+               iou: float = DEFAULT_IOU) -> "Future[List[Detections]]":
+        """Queue images for detection; the future resolves to one result per image"""
+        self._ensure_workers()
+        job = _Job(list(images), conf, iou)
+        try:
+            self._queue.put(job, timeout=self.settings.submit_timeout)
+        except queue.Full:
+            with self._lock:
+                self.rejected += 1
+            raise InferenceBusyError("Tree detection is busy with other requests, please try again shortly")
+        with self._lock:
+            self.submitted += 1
+        return job.future
+
+    def predict(self, images: Sequence[np.ndarray], conf: float = DEFAULT_CONFIDENCE,
+                iou: float = DEFAULT_IOU, timeout: Optional[float] = None) -> List[Detections]:
+        """Blocking submit, with the same signature as DetectorBackend.predict"""
+        if not images:
+            return []
+        return self.submit(images, conf, iou).result(timeout)
+
+    def as_batch_predictor(self, conf: float = DEFAULT_CONFIDENCE, iou: float = DEFAULT_IOU) -> BatchPredictor:
+        """Adapter for tiled_detect"""
+        return lambda tiles: self.predict(tiles, conf=conf, iou=iou)
+
+    def _collect(self, first: _Job) -> List[_Job]:
+        jobs, count = [first], len(first.images)
+        deadline = time.perf_counter() + self.settings.batch_window_ms / 1000
+        while count < self.settings.max_batch:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                job = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if job is None:
+                # Shutdown sentinel belongs to some worker; hand it back
+                self._queue.put(None)
+                break
+            jobs.append(job)
+            count += len(job.images)
+        return jobs
+
+    def _run(self) -> None:
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            jobs = [job for job in self._collect(first) if job.future.set_running_or_notify_cancel()]
+            if not jobs:
+                continue
+            started = time.perf_counter()
+            try:
+                detector = self._detector_provider()
+            except BaseException as e:
+                for job in jobs:
+                    job.future.set_exception(e)
+                continue
+
+            groups = {}
+            for job in jobs:
+                groups.setdefault((job.conf, job.iou), []).append(job)
+            for (conf, iou), group in groups.items():
+                images = [image for job in group for image in job.images]
+                try:
+                    results = detector.predict(images, conf=conf, iou=iou)
+                except BaseException as e:
+                    for job in group:
+                        job.future.set_exception(e)
+                    continue
+                offset = 0
+                for job in group:
+                    job.future.set_result(results[offset:offset + len(job.images)])
+                    offset += len(job.images)
+
+            finished = time.perf_counter()
+            with self._lock:
+                self.batches += 1
+                self.batched_images += sum(len(job.images) for job in jobs)
+                self.completed += len(jobs)
+                for job in jobs:
+                    self._waits.append(started - job.enqueued)
+                    self._services.append(finished - started)
+
+    def shutdown(self) -> None:
+        """Stop the workers after the jobs already queued"""
+        with self._lock:
+            workers, self._workers = self._workers, []
+        for _ in workers:
+            self._queue.put(None)
+        for worker in workers:
+            worker.join()
+
+    def stats(self) -> dict:
+        with self._lock:
+            waits = np.asarray(self._waits) * 1000
+            services = np.asarray(self._services) * 1000
+            return {
+                "queue_depth": self._queue.qsize(),
+                "max_queue": self.settings.max_queue,
+                "workers": self.settings.workers,
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "batches": self.batches,
+                "mean_batch_images": round(self.batched_images / self.batches, 2) if self.batches else 0.0,
+                "wait_ms_p50": round(float(np.percentile(waits, 50)), 1) if len(waits) else 0.0,
+                "wait_ms_p99": round(float(np.percentile(waits, 99)), 1) if len(waits) else 0.0,
+                "service_ms_p50": round(float(np.percentile(services, 50)), 1) if len(services) else 0.0,
+                "service_ms_p99": round(float(np.percentile(services, 99)), 1) if len(services) else 0.0,
+            }
+
+
+_service: Optional[InferenceService] = None
+_service_lock = threading.Lock()
+
+
+def get_inference_service() -> InferenceService:
+    """The process-wide inference service (workers start on first submit)"""
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = InferenceService()
+        return _service
@@ -0,0 +1,127 @@
+"""
+Tiled Sliding-Window Inference
+Slices large orthomosaics into overlapping tiles, runs them through the
+detector in batches and merges the boxes back into image coordinates
+"""
+
+from typing import Callable, Iterator, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from imaging_services.image_source import ImageSource
+
+from .postprocess import nms
+
+# A batch predictor takes a list of HxWxC tiles and returns one
+# (boxes_xyxy, scores) pair per tile, in tile-local pixel coordinates.
+BatchPredictor = Callable[[List[np.ndarray]], List[Tuple[np.ndarray, np.ndarray]]]
+
+DEFAULT_TILE_SIZE = 640
+DEFAULT_OVERLAP = 0.2
+DEFAULT_BATCH_SIZE = 8
+DEFAULT_MERGE_THRESHOLD = 0.6
+# Untiled detection on an ImageSource runs on a thumbnail no larger than this
+WHOLE_IMAGE_MAX_SIDE = 2048
+
+
+def tile_starts(length: int, tile_size: int, overlap: float) -> List[int]:
+    """Start offsets along one axis; the last tile is aligned to the far edge"""
+    if length <= tile_size:
+        return [0]
+    stride = max(1, tile_size - int(tile_size * overlap))
+    starts = list(range(0, length - tile_size, stride))
+    starts.append(length - tile_size)
+    return starts
+
+
+def iter_tiles(height: int, width: int, tile_size: int = DEFAULT_TILE_SIZE,
+               overlap: float = DEFAULT_OVERLAP) -> Iterator[Tuple[int, int, int, int]]:
+    """Yield (x0, y0, x1, y1) windows covering the image row by row"""
+    for y0 in tile_starts(height, tile_size, overlap):
+        for x0 in tile_starts(width, tile_size, overlap):
+            yield x0, y0, min(x0 + tile_size, width), min(y0 + tile_size, height)
+
+
+def _exclusive_spans(starts: Sequence[int], tile_size: int, length: int) -> List[Tuple[int, int]]:
+    """Part of each tile's span that no neighbouring tile covers"""
+    spans = []
+    for k, start in enumerate(starts):
+        end = min(start + tile_size, length)
+        lo = max(start, starts[k - 1] + tile_size) if k > 0 else start
+        hi = min(end, starts[k + 1]) if k + 1 < len(starts) else end
+        spans.append((lo, hi))
+    return spans
+
+
+def tiled_detect(image: Union[np.ndarray, ImageSource], predict_batch: BatchPredictor,
+                 tile_size: int = DEFAULT_TILE_SIZE, overlap: float = DEFAULT_OVERLAP,
+                 batch_size: int = DEFAULT_BATCH_SIZE,
+                 merge_threshold: float = DEFAULT_MERGE_THRESHOLD) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Detect objects in a large image tile by tile.
+
+    Tiles are numpy views into ``image`` (or windows read from an
+    ImageSource) and are handed to the predictor ``batch_size`` at a time,
+    so working memory is bounded by one batch rather than by the mosaic.
+    Only boxes that reach into an overlap band can be duplicated, so
+    cross-tile NMS (intersection over the smaller box, which also catches
+    crowns cut in half by a seam) runs on those alone.
+
+    Returns (boxes_xyxy, scores) in full-image pixel coordinates.
+    """
+    height, width = image.shape[:2]
+    ys = tile_starts(height, tile_size, overlap)
+    xs = tile_starts(width, tile_size, overlap)
+    y_spans = _exclusive_spans(ys, tile_size, height)
+    x_spans = _exclusive_spans(xs, tile_size, width)
+
+    windows = [(xi, yi) for yi in range(len(ys)) for xi in range(len(xs))]
+    all_boxes, all_scores, all_safe = [], [], []
+
+    for b in range(0, len(windows), batch_size):
+        batch = windows[b:b + batch_size]
+        tiles = [image[ys[yi]:ys[yi] + tile_size, xs[xi]:xs[xi] + tile_size] for xi, yi in batch]
+        for (xi, yi), (boxes, scores) in zip(batch, predict_batch(tiles)):
+            if len(boxes) == 0:
+                continue
+            boxes = np.asarray(boxes, dtype=np.float32).copy()
+            boxes[:, [0, 2]] += xs[xi]
+            boxes[:, [1, 3]] += ys[yi]
+            (ex0, ex1), (ey0, ey1) = x_spans[xi], y_spans[yi]
+            safe = ((boxes[:, 0] >= ex0) & (boxes[:, 2] <= ex1) &
+                    (boxes[:, 1] >= ey0) & (boxes[:, 3] <= ey1))
+            all_boxes.append(boxes)
+            all_scores.append(np.asarray(scores, dtype=np.float32))
+            all_safe.append(safe)
+
+    if not all_boxes:
+        return np.empty((0, 4), np.float32), np.empty(0, np.float32)
+
+    boxes = np.concatenate(all_boxes)
+    scores = np.concatenate(all_scores)
+    safe = np.concatenate(all_safe)
+
+    seam = np.flatnonzero(~safe)
+    kept = seam[nms(boxes[seam], scores[seam], merge_threshold, metric="ios")]
+    keep = np.concatenate([np.flatnonzero(safe), kept])
+    return boxes[keep], scores[keep]
+
+
+def detect_image(image: Union[np.ndarray, ImageSource], predict_batch: BatchPredictor,
+                 tile_size: Optional[int] = None, overlap: float = DEFAULT_OVERLAP,
+                 batch_size: int = DEFAULT_BATCH_SIZE,
+                 merge_threshold: float = DEFAULT_MERGE_THRESHOLD) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Tiled detection when ``tile_size`` is given, otherwise one forward pass
+    on the whole image. An ImageSource is never loaded whole: the untiled
+    pass runs on a thumbnail and the boxes are scaled back.
+    """
+    if tile_size:
+        return tiled_detect(image, predict_batch, tile_size, overlap, batch_size, merge_threshold)
+    if isinstance(image, np.ndarray):
+        return predict_batch([image])[0]
+    small = image.thumbnail(WHOLE_IMAGE_MAX_SIDE)
+    boxes, scores = predict_batch([small])[0]
+    # Scale by the extent the thumbnail covers, not the full image size
+    sx, sy = image.thumbnail_scale(WHOLE_IMAGE_MAX_SIDE)
+    return np.asarray(boxes, dtype=np.float32) * np.float32([sx, sy, sx, sy]), scores
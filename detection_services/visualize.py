@@ -0,0 +1,19 @@
+"""
+Detection Visualization
+Draws detector output onto RGB images for display
+"""
+
+import cv2
+import numpy as np
+
+
+def draw_detections(image: np.ndarray, boxes: np.ndarray, scores: np.ndarray,
+                    color=(0, 255, 0), label: str = "Tree") -> np.ndarray:
+    """Return a copy of ``image`` with one labelled rectangle per box"""
+    annotated = np.array(image, copy=True)
+    for box, score in zip(boxes, scores):
+        x1, y1, x2, y2 = np.asarray(box).astype(int)
+        cv2.rectangle(annotated, (x1, y1), (x2, y2), color, 2)
+        cv2.putText(annotated, f"{label} {score:.2f}", (x1, y1 - 5),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 1)
+    return annotated
@@ -0,0 +1,144 @@
+"""
+Imaging Services Package
+Image ingest, preview and raster helpers shared by the TreeSense Imaging pages
+"""
+
+from .change_map import (
+    ChangeMap,
+    change_map
+)
+
+from .cover_index import (
+    CoverIndex,
+    get_cover_index
+)
+
+from .image_source import (
+    ArraySource,
+    ImageSource,
+    TiffSource,
+    open_image_source
+)
+
+from .ingest import (
+    content_hash,
+    ingest_source,
+    ingest_upload
+)
+
+from .preview import (
+    PreviewPyramid,
+    downscale,
+    encode_image,
+    encode_preview,
+    get_preview_pyramid
+)
+
+from .vegetation import (
+    METHODS,
+    CoverEstimate,
+    CoverStatistics,
+    VegetationResult,
+    classify_vegetation,
+    estimate_green_cover,
+    get_cover_statistics,
+    get_vegetation_mask,
+    render_mask,
+    stream_green_cover
+)
+
+from .ndvi import (
+    NdviStatistics,
+    get_ndvi_statistics,
+    ndvi_mask,
+    ndvi_statistics
+)
+
+from .packed_mask import PackedMask
+
+from .patches import (
+    PatchStatistics,
+    clean_mask,
+    patch_statistics
+)
+
+from .registration import (
+    Registration,
+    register_images
+)
+
+from .regions import (
+    Region,
+    RegionCover,
+    count_regions,
+    load_regions,
+    rasterize_regions
+)
+
+from .ui_components import show_image
+
+__all__ = [
+    # Image sources
+    'ArraySource',
+    'ImageSource',
+    'TiffSource',
+    'open_image_source',
+
+    # Ingest
+    'content_hash',
+    'ingest_source',
+    'ingest_upload',
+
+    # Display previews
+    'PreviewPyramid',
+    'downscale',
+    'encode_image',
+    'encode_preview',
+    'get_preview_pyramid',
+
+    # Cover index
+    'CoverIndex',
+    'get_cover_index',
+
+    # Vegetation classification
+    'METHODS',
+    'CoverEstimate',
+    'CoverStatistics',
+    'VegetationResult',
+    'classify_vegetation',
+    'estimate_green_cover',
+    'get_cover_statistics',
+    'get_vegetation_mask',
+    'render_mask',
+    'stream_green_cover',
+
+    # Multispectral NDVI
+    'NdviStatistics',
+    'get_ndvi_statistics',
+    'ndvi_mask',
+    'ndvi_statistics',
+
+    # Packed masks
+    'PackedMask',
+
+    # Canopy patches
+    'PatchStatistics',
+    'clean_mask',
+    'patch_statistics',
+
+    # Registration and change maps
+    'Registration',
+    'register_images',
+    'ChangeMap',
+    'change_map',
+
+    # Region cover
+    'Region',
+    'RegionCover',
+    'count_regions',
+    'load_regions',
+    'rasterize_regions',
+
+    # UI components
+    'show_image'
+]
@@ -0,0 +1,137 @@
+"""
+Canopy Change Map
+Pixel-level difference of two co-registered vegetation masks into gain,
+loss and stable layers. The later mask is warped into the baseline frame
+one row block at a time (nearest neighbour, so it stays 0/1), counted,
+and kept only as a display-sized category grid unless a full-resolution
+layer is asked for.
+"""
+
+import math
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from .image_source import DEFAULT_BLOCK_ROWS
+from .registration import Registration
+
+# Pixel categories of the change layer
+OUTSIDE = 0
+STABLE_BARE = 1
+LOSS = 2
+GAIN = 3
+STABLE_VEGETATION = 4
+CATEGORY_NAMES = ("Outside overlap", "Stable bare", "Canopy loss", "Canopy gain", "Stable canopy")
+CATEGORY_PALETTE = (
+    0, 0, 0,
+    128, 128, 128,
+    220, 38, 38,
+    59, 130, 246,
+    16, 185, 129,
+)
+# Warped "after" value for pixels that map outside the later image
+_NO_DATA = 2
+# before + 2 * after (+ 4 for no data) -> category
+_CATEGORY_LUT = np.array([STABLE_BARE, LOSS, GAIN, STABLE_VEGETATION, OUTSIDE, OUTSIDE, OUTSIDE, OUTSIDE],
+                         dtype=np.uint8)
+PREVIEW_MAX_SIDE = 1024
+
+
+@dataclass
+class ChangeMap:
+    """Per-category pixel counts in the baseline frame plus a display-sized category grid"""
+    counts: np.ndarray
+    preview: np.ndarray
+    registration: Registration
+    layer: Optional[np.ndarray] = None
+
+    @property
+    def overlap_pixels(self) -> int:
+        return int(self.counts[STABLE_BARE:].sum())
+
+    @property
+    def loss_pixels(self) -> int:
+        return int(self.counts[LOSS])
+
+    @property
+    def gain_pixels(self) -> int:
+        return int(self.counts[GAIN])
+
+    @property
+    def before_cover(self) -> float:
+        """Baseline green cover (%) over the overlap"""
+        green = self.counts[LOSS] + self.counts[STABLE_VEGETATION]
+        return float(green) / self.overlap_pixels * 100 if self.overlap_pixels else 0.0
+
+    @property
+    def after_cover(self) -> float:
+        """Later green cover (%) over the overlap"""
+        green = self.counts[GAIN] + self.counts[STABLE_VEGETATION]
+        return float(green) / self.overlap_pixels * 100 if self.overlap_pixels else 0.0
+
+    def areas(self, pixel_area: float = 1.0) -> Dict[str, float]:
+        """Area per category, in pixels or (with ``pixel_area``) map units"""
+        return {name: float(count) * pixel_area for name, count in zip(CATEGORY_NAMES, self.counts)}
+
+    def to_image(self) -> Image.Image:
+        """Palette ("P") image of the preview categories"""
+        image = Image.fromarray(np.ascontiguousarray(self.preview), mode="P")
+        image.putpalette(CATEGORY_PALETTE)
+        return image
+
+
+def change_map(before_mask: np.ndarray, after_mask: np.ndarray, registration: Registration,
+               layer_path: Optional[str] = None, with_layer: bool = False,
+               preview_max_side: int = PREVIEW_MAX_SIDE, block_rows: int = DEFAULT_BLOCK_ROWS) -> ChangeMap:
+    """
+    Gain / loss / stable counts of ``after_mask`` against ``before_mask``.
+
+    ``registration`` maps the later image onto the baseline
+    (register_images(before, after)). Masks are 0/1 arrays, memmaps or
+    PackedMasks; only one baseline row block and the later-mask rows it
+    maps to are unpacked at a time. The full-resolution category layer is
+    returned when ``with_layer`` is set, memory-mapped at ``layer_path``
+    when given.
+    """
+    height, width = before_mask.shape[:2]
+    after_height, after_width = after_mask.shape[:2]
+    inverse = registration.inverse
+    step = max(1, math.ceil(max(width, height) / preview_max_side))
+    layer = None
+    if with_layer:
+        layer = np.lib.format.open_memmap(layer_path, mode="w+", dtype=np.uint8, shape=(height, width)) \
+            if layer_path else np.empty((height, width), dtype=np.uint8)
+    counts = np.zeros(len(CATEGORY_NAMES), dtype=np.int64)
+    preview_rows = []
+    for y0 in range(0, height, block_rows):
+        y1 = min(height, y0 + block_rows)
+        before = np.asarray(before_mask[y0:y1]) != 0
+        # Later-image rows and columns this block maps to, with a pixel of margin
+        corners = cv2.transform(np.float32([[[0, y0], [width, y0], [0, y1], [width, y1]]]), inverse)[0]
+        ax0, ay0 = np.maximum(np.floor(corners.min(axis=0)).astype(int) - 1, 0)
+        ax1 = min(int(np.ceil(corners[:, 0].max())) + 2, after_width)
+        ay1 = min(int(np.ceil(corners[:, 1].max())) + 2, after_height)
+        if ax0 < ax1 and ay0 < ay1:
+            after = np.ascontiguousarray(after_mask[ay0:ay1, ax0:ax1], dtype=np.uint8)
+            # Block pixel -> later-mask window pixel
+            local = inverse.copy()
+            local[:, 2] += inverse[:, 1] * y0 - [ax0, ay0]
+            warped = cv2.warpAffine(after, local, (width, y1 - y0), flags=cv2.INTER_NEAREST | cv2.WARP_INVERSE_MAP,
+                                    borderMode=cv2.BORDER_CONSTANT, borderValue=_NO_DATA)
+        else:
+            warped = np.full((y1 - y0, width), _NO_DATA, dtype=np.uint8)
+        codes = warped.astype(np.uint8)
+        codes += codes
+        codes |= before
+        categories = _CATEGORY_LUT[codes]
+        counts += np.bincount(categories.ravel(), minlength=len(CATEGORY_NAMES))
+        if layer is not None:
+            layer[y0:y1] = categories
+        # Preview keeps every step-th row and column of the baseline frame
+        preview_rows.append(categories[(-y0) % step::step, ::step])
+    if isinstance(layer, np.memmap):
+        layer.flush()
+    return ChangeMap(counts=counts, preview=np.concatenate(preview_rows), registration=registration, layer=layer)
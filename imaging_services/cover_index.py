@@ -0,0 +1,102 @@
+"""
+Cover Index
+Summed-area table over a vegetation mask. Once built (one pass over the
+mask), the green pixel count of any rectangle is four table lookups, and
+a per-cell cover grid of any size needs no pixel access at all.
+"""
+
+import threading
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+import numpy as np
+
+from .image_source import DEFAULT_BLOCK_ROWS
+
+MAX_CACHED_INDEXES = 8
+
+
+class CoverIndex:
+    """
+    Integral image of a 0/1 mask: ``table[y, x]`` is the number of
+    vegetation pixels above and left of (y, x), with a zero first row and
+    column. uint32 when the count cannot overflow, else uint64; the table
+    may be a memory-mapped .npy so gigapixel masks stay on disk.
+    """
+
+    def __init__(self, table: np.ndarray):
+        self.table = table
+        self.height, self.width = table.shape[0] - 1, table.shape[1] - 1
+
+    @classmethod
+    def from_mask(cls, mask: np.ndarray, path: Optional[str] = None,
+                  block_rows: int = DEFAULT_BLOCK_ROWS) -> "CoverIndex":
+        """Build the table block by block (into an .npy memmap at ``path`` when given)"""
+        height, width = mask.shape[:2]
+        dtype = np.uint32 if height * width < 1 << 32 else np.uint64
+        shape = (height + 1, width + 1)
+        table = np.lib.format.open_memmap(path, mode="w+", dtype=dtype, shape=shape) if path \
+            else np.empty(shape, dtype=dtype)
+        table[0] = 0
+        table[:, 0] = 0
+        above = np.zeros(width, dtype=dtype)
+        for y0 in range(0, height, block_rows):
+            rows = np.cumsum(mask[y0:y0 + block_rows] != 0, axis=1, dtype=dtype)
+            np.cumsum(rows, axis=0, out=rows)
+            rows += above
+            table[y0 + 1:y0 + 1 + len(rows), 1:] = rows
+            above = rows[-1]
+        if path:
+            table.flush()
+        return cls(table)
+
+    def _clip(self, x0: int, y0: int, x1: int, y1: int) -> Tuple[int, int, int, int]:
+        x0, x1 = min(max(x0, 0), self.width), min(max(x1, 0), self.width)
+        y0, y1 = min(max(y0, 0), self.height), min(max(y1, 0), self.height)
+        return x0, y0, max(x0, x1), max(y0, y1)
+
+    def green_pixels(self, x0: int, y0: int, x1: int, y1: int) -> int:
+        """Vegetation pixels in [x0, x1) x [y0, y1), clipped to the image"""
+        x0, y0, x1, y1 = self._clip(x0, y0, x1, y1)
+        table = self.table
+        return int(table[y1, x1]) - int(table[y0, x1]) - int(table[y1, x0]) + int(table[y0, x0])
+
+    def cover(self, x0: int, y0: int, x1: int, y1: int) -> float:
+        """Green cover (%) of a rectangle"""
+        x0, y0, x1, y1 = self._clip(x0, y0, x1, y1)
+        area = (x1 - x0) * (y1 - y0)
+        return self.green_pixels(x0, y0, x1, y1) / area * 100 if area else 0.0
+
+    def grid(self, rows: int, cols: int) -> np.ndarray:
+        """rows x cols array of green cover (%), row 0 at the top"""
+        ys = np.linspace(0, self.height, rows + 1).round().astype(int)
+        xs = np.linspace(0, self.width, cols + 1).round().astype(int)
+        corners = self.table[np.ix_(ys, xs)].astype(np.int64)
+        counts = corners[1:, 1:] - corners[:-1, 1:] - corners[1:, :-1] + corners[:-1, :-1]
+        area = np.diff(ys)[:, None] * np.diff(xs)[None, :]
+        return np.divide(counts * 100.0, area, out=np.zeros(counts.shape), where=area > 0)
+
+
+_indexes: "OrderedDict[str, CoverIndex]" = OrderedDict()
+_indexes_lock = threading.Lock()
+
+
+def get_cover_index(key: str, mask: Optional[np.ndarray] = None, path: Optional[str] = None) -> Optional[CoverIndex]:
+    """
+    Cover index for one image, method and sensitivity, built once per
+    ``key`` and kept in a small process-wide LRU. Returns None when nothing
+    is cached and no mask is given.
+    """
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is not None:
+            _indexes.move_to_end(key)
+            return index
+    if mask is None:
+        return None
+    index = CoverIndex.from_mask(mask, path)
+    with _indexes_lock:
+        _indexes[key] = index
+        while len(_indexes) > MAX_CACHED_INDEXES:
+            _indexes.popitem(last=False)
+    return index
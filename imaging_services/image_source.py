@@ -0,0 +1,416 @@
+"""
+Image Sources
+Window-by-window access to rasters too large to hold in memory. Large
+TIFFs are memory-mapped when stored uncompressed, and otherwise decoded
+only in the tiles/strips a window touches. Small uploads are a plain array.
+"""
+
+import io
+import math
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Iterator, Optional, Sequence, Tuple, Union
+
+import cv2
+import numpy as np
+from PIL import Image
+
+DEFAULT_BLOCK_ROWS = 512
+MAX_CACHED_SEGMENTS = 64
+# PIL modes decoded as one grey band (alpha and bilevel folded into L)
+GRAYSCALE_MODES = ("1", "L", "LA")
+TIFF_MAGIC = (b"II*\x00", b"MM\x00*", b"II+\x00", b"MM\x00+")
+UPLOAD_SPILL_DIR = os.path.join(tempfile.gettempdir(), "treesense-uploads")
+# Size cap of the spill directory; least recently used files are deleted beyond it
+UPLOAD_SPILL_MAX_BYTES = int(float(os.environ.get("TREESENSE_SPILL_MAX_GB", "").strip() or 20) * 2 ** 30)
+
+
+def to_rgb8(array: np.ndarray) -> np.ndarray:
+    """Raw HxW or HxWxC samples of any dtype -> HxWx3 uint8 RGB"""
+    if array.dtype == np.uint16:
+        array = (array >> 8).astype(np.uint8)
+    elif np.issubdtype(array.dtype, np.floating):
+        array = (np.clip(array, 0, 1) * 255).astype(np.uint8)
+    elif array.dtype != np.uint8:
+        array = np.clip(array, 0, 255).astype(np.uint8)
+    if array.ndim == 2:
+        return np.repeat(array[:, :, None], 3, axis=2)
+    if array.shape[2] < 3:
+        # One band, or one band plus an unlabelled extra sample
+        return np.repeat(array[:, :, :1], 3, axis=2)
+    if array.shape[2] > 3:
+        return np.ascontiguousarray(array[:, :, :3])
+    return array
+
+
+class ImageSource:
+    """
+    Read-only raster that hands out RGB uint8 windows.
+
+    Supports ``source[y0:y1, x0:x1]`` and ``source.shape`` like an array,
+    so code written for numpy images (e.g. tiled_detect) can take a source
+    and only ever touch the windows it slices.
+    """
+
+    width: int
+    height: int
+    bands: int = 3
+    # Sample indices that hold transparency rather than a spectral band
+    alpha_bands: Tuple[int, ...] = ()
+
+    @property
+    def shape(self) -> Tuple[int, int, int]:
+        return self.height, self.width, 3
+
+    @property
+    def size(self) -> Tuple[int, int]:
+        """(width, height), like PIL.Image.size"""
+        return self.width, self.height
+
+    @property
+    def spectral_bands(self) -> Tuple[int, ...]:
+        """Band indices that carry image data (every band but alpha)"""
+        return tuple(band for band in range(self.bands) if band not in self.alpha_bands)
+
+    @property
+    def grayscale(self) -> bool:
+        """Single-band image (alpha aside); its RGB windows repeat the one band three times"""
+        return len(self.spectral_bands) == 1
+
+    def _rgb8(self, array: np.ndarray) -> np.ndarray:
+        """to_rgb8 of raw samples (last axis = bands) with the alpha bands dropped"""
+        return to_rgb8(np.delete(array, self.alpha_bands, axis=-1) if self.alpha_bands else array)
+
+    def read_raw(self, x0: int, y0: int, x1: int, y1: int, bands: Optional[Sequence[int]] = None) -> np.ndarray:
+        """Window with the stored dtype, HxWxC, with every band or only ``bands``"""
+        raise NotImplementedError
+
+    def read_window(self, x0: int, y0: int, x1: int, y1: int) -> np.ndarray:
+        """Window as RGB uint8 (clipped to the image)"""
+        x0, y0 = max(0, x0), max(0, y0)
+        x1, y1 = min(self.width, x1), min(self.height, y1)
+        # Alpha bands are never read (with planar storage their planes stay untouched)
+        return to_rgb8(self.read_raw(x0, y0, x1, y1, self.spectral_bands if self.alpha_bands else None))
+
+    def __getitem__(self, key) -> np.ndarray:
+        rows, cols = key[:2] if isinstance(key, tuple) else (key, slice(None))
+        if not isinstance(rows, slice) or not isinstance(cols, slice) or \
+                rows.step not in (None, 1) or cols.step not in (None, 1):
+            raise TypeError("Image sources only support [y0:y1, x0:x1] windows")
+        y0, y1, _ = rows.indices(self.height)
+        x0, x1, _ = cols.indices(self.width)
+        return self.read_window(x0, y0, x1, y1)
+
+    def iter_blocks(self, block_rows: int = DEFAULT_BLOCK_ROWS) -> Iterator[Tuple[int, np.ndarray]]:
+        """Yield (first_row, RGB strip) covering the image top to bottom"""
+        for y0 in range(0, self.height, block_rows):
+            yield y0, self.read_window(0, y0, self.width, min(self.height, y0 + block_rows))
+
+    def thumbnail(self, max_side: int) -> np.ndarray:
+        """
+        Downsampled RGB copy whose longer side is at most ``max_side``.
+
+        Built strip by strip with an integer box filter, so memory stays at
+        one strip plus the result.
+        """
+        factor = self._thumbnail_factor(max_side)
+        if factor == 1:
+            return self.read_window(0, 0, self.width, self.height)
+        out_w, out_h = max(1, self.width // factor), max(1, self.height // factor)
+        rows = max(1, DEFAULT_BLOCK_ROWS // factor) * factor
+        parts = []
+        for y0 in range(0, out_h * factor, rows):
+            strip = self.read_window(0, y0, out_w * factor, min(out_h * factor, y0 + rows))
+            parts.append(cv2.resize(strip, (out_w, strip.shape[0] // factor), interpolation=cv2.INTER_AREA))
+        return np.concatenate(parts)
+
+    def _thumbnail_factor(self, max_side: int) -> int:
+        return max(1, math.ceil(max(self.width, self.height) / max_side))
+
+    def thumbnail_scale(self, max_side: int) -> Tuple[float, float]:
+        """
+        Full-resolution pixels per thumbnail pixel (x, y) for ``thumbnail(max_side)``.
+        The box-filtered thumbnail covers ``factor`` whole pixels per output
+        pixel, dropping at most factor - 1 edge rows and columns.
+        """
+        factor = self._thumbnail_factor(max_side)
+        return float(factor), float(factor)
+
+    def to_array(self) -> np.ndarray:
+        """The whole image as RGB uint8 (only for sources known to be small)"""
+        return self.read_window(0, 0, self.width, self.height)
+
+    def sample_pixels(self, ys: np.ndarray, xs: np.ndarray) -> np.ndarray:
+        """RGB uint8 values (Nx3) of scattered pixels"""
+        return np.concatenate([self.read_window(x, y, x + 1, y + 1).reshape(1, 3) for y, x in zip(ys, xs)]) \
+            if len(ys) else np.empty((0, 3), dtype=np.uint8)
+
+    def close(self) -> None:
+        pass
+
+
+class ArraySource(ImageSource):
+    """An image already in memory"""
+
+    def __init__(self, array: np.ndarray):
+        self.array = array
+        self.height, self.width = array.shape[:2]
+        self.bands = array.shape[2] if array.ndim == 3 else 1
+
+    def read_raw(self, x0: int, y0: int, x1: int, y1: int, bands: Optional[Sequence[int]] = None) -> np.ndarray:
+        window = self.array[y0:y1, x0:x1]
+        if window.ndim == 2:
+            window = window[:, :, None]
+        return window if bands is None else window[:, :, list(bands)]
+
+    def to_array(self) -> np.ndarray:
+        return to_rgb8(self.array)
+
+    def sample_pixels(self, ys: np.ndarray, xs: np.ndarray) -> np.ndarray:
+        return to_rgb8(self.array[ys, xs][:, None]).reshape(-1, 3)
+
+
+class TiffSource(ImageSource):
+    """
+    Windowed reader for (Geo)TIFF files.
+
+    Uncompressed, contiguous images are memory-mapped and windows are plain
+    slices, so the OS pages in only the rows that are read. Compressed
+    tiled or stripped images are decoded one segment at a time; only the
+    segments that intersect a window are read, and the most recent ones
+    are kept in a small LRU for overlapping windows.
+    """
+
+    def __init__(self, path: str, page: int = 0):
+        import tifffile
+
+        self.path = path
+        self._tif = tifffile.TiffFile(path)
+        self._page = self._tif.pages[page]
+        self._lock = threading.Lock()
+        self._segments: "OrderedDict[int, np.ndarray]" = OrderedDict()
+        self._planar = self._page.planarconfig == 2 and self._page.samplesperpixel > 1
+        self.bands = self._page.samplesperpixel
+        # ExtraSamples 1 / 2 are associated / unassociated alpha; extra samples follow the colour samples
+        extra = tuple(self._page.extrasamples or ())
+        first_extra = self.bands - len(extra)
+        self.alpha_bands = tuple(first_extra + k for k, kind in enumerate(extra) if int(kind) in (1, 2))
+        self.dtype = self._page.dtype
+        if self._planar:
+            _, self.height, self.width = self._page.shape[-3:]
+        else:
+            self.height, self.width = self._page.shape[:2]
+
+        self._memmap: Optional[np.ndarray] = None
+        if self._page.is_memmappable:
+            self._memmap = tifffile.memmap(path, page=page, mode="r")
+
+        self._seg_h = self._page.tilelength or self._page.rowsperstrip or self.height
+        self._seg_w = self._page.tilewidth or self.width
+        self._across = math.ceil(self.width / self._seg_w)
+        self._per_plane = self._across * math.ceil(self.height / self._seg_h)
+
+    @property
+    def is_memory_mapped(self) -> bool:
+        return self._memmap is not None
+
+    @property
+    def geo_transform(self) -> Optional[Tuple[float, float, float, float, float, float]]:
+        """
+        GDAL-style (x_origin, pixel_width, row_rotation, y_origin, column_rotation,
+        pixel_height) from the GeoTIFF tags, or None for a plain TIFF
+        """
+        tags = self._page.tags
+        transformation = tags.get("ModelTransformationTag")
+        if transformation is not None:
+            m = transformation.value
+            return m[3], m[0], m[1], m[7], m[4], m[5]
+        scale, tiepoint = tags.get("ModelPixelScaleTag"), tags.get("ModelTiepointTag")
+        if scale is None or tiepoint is None:
+            return None
+        (sx, sy), (i, j, _, x, y) = scale.value[:2], tiepoint.value[:5]
+        return x - i * sx, sx, 0.0, y + j * sy, 0.0, -sy
+
+    def _segment(self, index: int) -> np.ndarray:
+        with self._lock:
+            segment = self._segments.get(index)
+            if segment is not None:
+                self._segments.move_to_end(index)
+                return segment
+            handle = self._tif.filehandle
+            handle.seek(self._page.dataoffsets[index])
+            data = handle.read(self._page.databytecounts[index])
+            segment = self._page.decode(data, index, jpegtables=self._page.jpegtables)[0]
+            # (planes, rows, cols, samples) -> (rows, cols, samples)
+            segment = segment[0]
+            self._segments[index] = segment
+            while len(self._segments) > MAX_CACHED_SEGMENTS:
+                self._segments.popitem(last=False)
+            return segment
+
+    def read_raw(self, x0: int, y0: int, x1: int, y1: int, bands: Optional[Sequence[int]] = None) -> np.ndarray:
+        """
+        Window with the stored dtype, HxWxC. ``bands`` picks sample indices;
+        with planar (band-separate) storage the other bands are never read.
+        """
+        if self._memmap is not None:
+            if self._planar:
+                # Window sliced before the band pick, so only its rows of each plane are copied
+                planes = self._memmap[:, y0:y1, x0:x1]
+                return np.moveaxis(planes if bands is None else planes[list(bands)], 0, -1)
+            window = self._memmap[y0:y1, x0:x1]
+            if window.ndim == 2:
+                window = window[:, :, None]
+            return window if bands is None else window[:, :, list(bands)]
+
+        wanted = list(range(self.bands)) if bands is None else list(bands)
+        out = np.empty((y1 - y0, x1 - x0, len(wanted)), dtype=self.dtype)
+        planes = [(b, [k]) for k, b in enumerate(wanted)] if self._planar else [(0, list(range(len(wanted))))]
+        for plane, targets in planes:
+            for ty in range(y0 // self._seg_h, (y1 - 1) // self._seg_h + 1):
+                for tx in range(x0 // self._seg_w, (x1 - 1) // self._seg_w + 1):
+                    segment = self._segment(plane * self._per_plane + ty * self._across + tx)
+                    sy, sx = ty * self._seg_h, tx * self._seg_w
+                    ya, yb = max(y0, sy), min(y1, sy + self._seg_h, sy + segment.shape[0])
+                    xa, xb = max(x0, sx), min(x1, sx + self._seg_w, sx + segment.shape[1])
+                    piece = segment[ya - sy:yb - sy, xa - sx:xb - sx]
+                    out[ya - y0:yb - y0, xa - x0:xb - x0, targets] = \
+                        piece if self._planar else piece[:, :, wanted]
+        return out
+
+    def sample_pixels(self, ys: np.ndarray, xs: np.ndarray) -> np.ndarray:
+        """Memory-mapped: a fancy index. Compressed: each touched segment is decoded once."""
+        if self._memmap is not None:
+            values = self._memmap[:, ys, xs].T if self._planar else self._memmap[ys, xs]
+            return self._rgb8(values[:, None]).reshape(-1, 3)
+
+        values = np.empty((len(ys), self.bands), dtype=self.dtype)
+        rows, cols = ys // self._seg_h, xs // self._seg_w
+        segments = rows * self._across + cols
+        for index in np.unique(segments):
+            hit = segments == index
+            sy, sx = ys[hit] - rows[hit] * self._seg_h, xs[hit] - cols[hit] * self._seg_w
+            if self._planar:
+                for band in range(self.bands):
+                    values[hit, band] = self._segment(band * self._per_plane + index)[sy, sx, 0]
+            else:
+                values[hit] = self._segment(index)[sy, sx]
+        return self._rgb8(values[:, None]).reshape(-1, 3)
+
+    def _overview(self, max_side: int):
+        """Smallest stored overview level at least ``max_side`` px, and the (width, height) it is resized to"""
+        levels = self._tif.series[0].levels
+        for level in reversed(levels[1:]):
+            height, width = level.shape[-3:-1] if not self._planar else level.shape[-2:]
+            if max(height, width) >= max_side:
+                scale = max_side / max(height, width)
+                if scale < 1:
+                    width, height = max(1, round(width * scale)), max(1, round(height * scale))
+                return level, (width, height)
+        return None, None
+
+    def thumbnail(self, max_side: int) -> np.ndarray:
+        """Uses a stored overview level when the file has one (COG / pyramidal TIFF)"""
+        level, size = self._overview(max_side)
+        if level is None:
+            return super().thumbnail(max_side)
+        array = level.asarray()
+        array = self._rgb8(np.moveaxis(array, 0, -1) if self._planar else array) if array.ndim == 3 else to_rgb8(array)
+        if (array.shape[1], array.shape[0]) != size:
+            array = cv2.resize(array, size, interpolation=cv2.INTER_AREA)
+        return array
+
+    def thumbnail_scale(self, max_side: int) -> Tuple[float, float]:
+        """An overview thumbnail spans the whole image"""
+        level, size = self._overview(max_side)
+        if level is None:
+            return super().thumbnail_scale(max_side)
+        return self.width / size[0], self.height / size[1]
+
+    def close(self) -> None:
+        self._memmap = None
+        self._tif.close()
+
+
+def prune_spill_dir(max_bytes: int = UPLOAD_SPILL_MAX_BYTES) -> int:
+    """
+    Delete the least recently used spill files (oldest mtime first) until
+    the directory fits in ``max_bytes``; returns the bytes freed. Files that
+    cannot be removed (still mapped, on Windows) are skipped.
+    """
+    try:
+        entries = [entry for entry in os.scandir(UPLOAD_SPILL_DIR) if entry.is_file()]
+    except FileNotFoundError:
+        return 0
+    stats = sorted(((entry.stat(), entry.path) for entry in entries), key=lambda item: item[0].st_mtime)
+    total = sum(stat.st_size for stat, _ in stats)
+    freed = 0
+    for stat, path in stats:
+        if total - freed <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        freed += stat.st_size
+    return freed
+
+
+def spill_file(name: str) -> str:
+    """
+    Path of a file in the spill directory. An existing file is marked as
+    recently used; the directory is pruned back under its size cap first.
+    """
+    os.makedirs(UPLOAD_SPILL_DIR, exist_ok=True)
+    path = os.path.join(UPLOAD_SPILL_DIR, name)
+    if os.path.exists(path):
+        os.utime(path)
+    prune_spill_dir()
+    return path
+
+
+def is_tiff(data: bytes) -> bool:
+    return data[:4] in TIFF_MAGIC
+
+
+def _decoded_pixels(image: Image.Image) -> np.ndarray:
+    """Pixels of a PIL image: grayscale stays single-channel (HxW), anything else becomes RGB"""
+    if image.mode in GRAYSCALE_MODES:
+        return np.asarray(image.convert("L"))
+    return np.asarray(image if image.mode == "RGB" else image.convert("RGB"))
+
+
+def open_image_source(source: Union[str, bytes, io.IOBase, Image.Image, np.ndarray],
+                      key: Optional[str] = None) -> ImageSource:
+    """
+    Open a path, raw bytes, an uploaded file, a PIL image or an array.
+
+    TIFF uploads are spilled once to a temp file named after ``key`` (the
+    upload's content hash) so they can be memory-mapped or read by window;
+    other formats are decoded into an ArraySource.
+    """
+    if isinstance(source, np.ndarray):
+        return ArraySource(source)
+    if isinstance(source, Image.Image):
+        return ArraySource(_decoded_pixels(source))
+    if isinstance(source, str):
+        with open(source, "rb") as f:
+            if is_tiff(f.read(4)):
+                return TiffSource(source)
+        return ArraySource(_decoded_pixels(Image.open(source)))
+
+    data = source if isinstance(source, bytes) else source.getvalue()
+    if is_tiff(data):
+        if key is None:
+            from .ingest import content_hash
+            key = content_hash(data)
+        path = spill_file(f"{key}.tif")
+        if not os.path.exists(path):
+            temp = f"{path}.{os.getpid()}.part"
+            with open(temp, "wb") as f:
+                f.write(data)
+            os.replace(temp, path)
+        return TiffSource(path)
+    return ArraySource(_decoded_pixels(Image.open(io.BytesIO(data))))
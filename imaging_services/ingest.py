@@ -0,0 +1,48 @@
+"""
+Image Ingest
+Turns an upload into a content key, a PIL image or windowed image source,
+and its preview pyramid
+"""
+
+import hashlib
+from typing import Tuple, Union
+
+import numpy as np
+from PIL import Image
+
+from .image_source import ImageSource, open_image_source
+from .preview import PreviewPyramid, get_preview_pyramid
+
+
+def content_hash(data: Union[bytes, np.ndarray]) -> str:
+    """Digest of raw upload bytes, or of an array's pixels plus shape and dtype"""
+    digest = hashlib.blake2b(digest_size=16)
+    if isinstance(data, np.ndarray):
+        digest.update(f"{data.shape}{data.dtype}".encode())
+        data = np.ascontiguousarray(data).data
+    digest.update(data)
+    return digest.hexdigest()
+
+
+def ingest_upload(uploaded_file) -> Tuple[Image.Image, str, PreviewPyramid]:
+    """
+    Open an uploaded file once per rerun.
+
+    Returns the PIL image (for full-resolution analysis), the content hash
+    of the upload bytes (the key for every per-image cache) and the cached
+    preview pyramid used for display.
+    """
+    upload_key = content_hash(uploaded_file.getvalue())
+    image = Image.open(uploaded_file)
+    return image, upload_key, get_preview_pyramid(upload_key, image)
+
+
+def ingest_source(uploaded_file) -> Tuple[ImageSource, str, PreviewPyramid]:
+    """
+    Like ingest_upload, but returns an ImageSource so very large rasters
+    (tiled / uncompressed TIFF) are read window by window instead of being
+    decoded into memory; the pyramid is built from a strip-wise thumbnail.
+    """
+    upload_key = content_hash(uploaded_file.getvalue())
+    source = open_image_source(uploaded_file, key=upload_key)
+    return source, upload_key, get_preview_pyramid(upload_key, source)
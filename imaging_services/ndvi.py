@@ -0,0 +1,167 @@
+"""
+Multispectral NDVI
+True NDVI, (NIR - Red) / (NIR + Red), for multi-band drone rasters. Only
+the red and NIR bands are read (planar TIFFs never touch the others), in
+row blocks of float32, and each pixel is reduced to an NDVI histogram bin
+so cover at any threshold, the histogram and a colour-mapped preview all
+come from one pass.
+"""
+
+import math
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Optional, Tuple
+
+import numpy as np
+
+from .image_source import DEFAULT_BLOCK_ROWS, ImageSource
+
+# Band order of common 4-band drone exports (R, G, B, NIR), zero-based
+DEFAULT_RED_BAND = 0
+DEFAULT_NIR_BAND = 3
+# NDVI bins over [-1, 1]: thresholds are resolved to 0.01
+NDVI_BINS = 200
+DEFAULT_NDVI_THRESHOLD = 0.3
+PREVIEW_MAX_SIDE = 1024
+MAX_CACHED_NDVI = 8
+
+
+def ndvi_bins(red: np.ndarray, nir: np.ndarray, bins: int = NDVI_BINS) -> np.ndarray:
+    """
+    NDVI histogram bin (0 .. bins - 1) of every pixel, computed in float32.
+    Pixels with NIR + Red == 0 count as NDVI 0.
+    """
+    red = red.astype(np.float32)
+    nir = nir.astype(np.float32)
+    total = nir + red
+    ndvi = np.subtract(nir, red, out=nir)
+    np.divide(ndvi, total, out=ndvi, where=total != 0)
+    ndvi[total == 0] = 0
+    # [-1, 1] -> [0, bins); NDVI == 1 joins the top bin. Signed or float reflectance can fall
+    # outside [-1, 1]; it is clipped to the end bins instead of wrapping in the integer cast
+    ndvi += 1
+    ndvi *= bins / 2
+    return np.clip(ndvi, 0, bins - 1, out=ndvi).astype(np.uint8 if bins <= 256 else np.uint16)
+
+
+def threshold_bin(threshold: float, bins: int = NDVI_BINS) -> int:
+    """First bin counted as vegetation for ``NDVI >= threshold`` (threshold snapped to the bin grid)"""
+    return min(max(int(round((threshold + 1) * bins / 2)), 0), bins)
+
+
+@lru_cache(maxsize=4)
+def ndvi_colormap(bins: int = NDVI_BINS) -> np.ndarray:
+    """RGB colour per bin: red (bare) through yellow to green (dense vegetation)"""
+    from matplotlib import colormaps
+
+    colours = colormaps["RdYlGn"](np.linspace(0, 1, bins))[:, :3]
+    return (colours * 255).round().astype(np.uint8)
+
+
+@dataclass
+class NdviStatistics:
+    """NDVI histogram of a raster plus a display-sized grid of pixel bins"""
+    histogram: np.ndarray
+    preview_bins: np.ndarray
+    red_band: int
+    nir_band: int
+
+    @property
+    def bins(self) -> int:
+        return len(self.histogram)
+
+    @property
+    def total_pixels(self) -> int:
+        return int(self.histogram.sum())
+
+    @property
+    def bin_centres(self) -> np.ndarray:
+        return -1 + (np.arange(self.bins) + 0.5) * 2 / self.bins
+
+    @property
+    def mean_ndvi(self) -> float:
+        return float(self.histogram @ self.bin_centres / self.total_pixels) if self.total_pixels else 0.0
+
+    def green_pixels(self, threshold: float = DEFAULT_NDVI_THRESHOLD) -> int:
+        """Pixels with NDVI >= threshold, from the histogram"""
+        return int(self.histogram[threshold_bin(threshold, self.bins):].sum())
+
+    def cover(self, threshold: float = DEFAULT_NDVI_THRESHOLD) -> float:
+        """Green cover (%) at an NDVI threshold"""
+        return self.green_pixels(threshold) / self.total_pixels * 100 if self.total_pixels else 0.0
+
+    def preview(self) -> np.ndarray:
+        """Colour-mapped NDVI preview (RGB)"""
+        return ndvi_colormap(self.bins)[self.preview_bins]
+
+    def preview_mask(self, threshold: float = DEFAULT_NDVI_THRESHOLD) -> np.ndarray:
+        """Display-sized 0/1 vegetation mask at a threshold"""
+        return (self.preview_bins >= threshold_bin(threshold, self.bins)).view(np.uint8)
+
+
+def band_reader(source: ImageSource, red_band: int, nir_band: int):
+    """Row-window reader of just the (red, NIR) bands"""
+    if source.bands <= max(red_band, nir_band):
+        raise ValueError(f"The raster has {source.bands} bands; red={red_band + 1}, NIR={nir_band + 1} requested")
+    return lambda y0, y1: source.read_raw(0, y0, source.width, y1, bands=(red_band, nir_band))
+
+
+def ndvi_statistics(source: ImageSource, red_band: int = DEFAULT_RED_BAND, nir_band: int = DEFAULT_NIR_BAND,
+                    bins: int = NDVI_BINS, preview_max_side: int = PREVIEW_MAX_SIDE,
+                    block_rows: int = DEFAULT_BLOCK_ROWS) -> NdviStatistics:
+    """
+    One pass over the red and NIR bands of a multi-band source (TiffSource),
+    one row block at a time
+    """
+    read = band_reader(source, red_band, nir_band)
+    step = max(1, math.ceil(max(source.width, source.height) / preview_max_side))
+    histogram = np.zeros(bins, dtype=np.int64)
+    preview_rows = []
+    for y0 in range(0, source.height, block_rows):
+        window = read(y0, min(source.height, y0 + block_rows))
+        pixel_bins = ndvi_bins(window[:, :, 0], window[:, :, 1], bins)
+        histogram += np.bincount(pixel_bins.ravel(), minlength=bins)
+        # Preview keeps every step-th row and column of the image
+        preview_rows.append(pixel_bins[(-y0) % step::step, ::step])
+    return NdviStatistics(histogram=histogram, preview_bins=np.concatenate(preview_rows),
+                          red_band=red_band, nir_band=nir_band)
+
+
+def ndvi_mask(source: ImageSource, threshold: float = DEFAULT_NDVI_THRESHOLD, red_band: int = DEFAULT_RED_BAND,
+              nir_band: int = DEFAULT_NIR_BAND, mask_path: Optional[str] = None,
+              bins: int = NDVI_BINS, block_rows: int = DEFAULT_BLOCK_ROWS) -> np.ndarray:
+    """Full-resolution 0/1 mask of NDVI >= threshold, memory-mapped at ``mask_path`` when given"""
+    read = band_reader(source, red_band, nir_band)
+    shape = (source.height, source.width)
+    mask = np.lib.format.open_memmap(mask_path, mode="w+", dtype=np.uint8, shape=shape) if mask_path \
+        else np.empty(shape, dtype=np.uint8)
+    first = threshold_bin(threshold, bins)
+    for y0 in range(0, source.height, block_rows):
+        window = read(y0, min(source.height, y0 + block_rows))
+        mask[y0:y0 + len(window)] = ndvi_bins(window[:, :, 0], window[:, :, 1], bins) >= first
+    if mask_path:
+        mask.flush()
+    return mask
+
+
+_ndvi: "OrderedDict[Tuple[str, int, int], NdviStatistics]" = OrderedDict()
+_ndvi_lock = threading.Lock()
+
+
+def get_ndvi_statistics(key: str, source: ImageSource, red_band: int = DEFAULT_RED_BAND,
+                        nir_band: int = DEFAULT_NIR_BAND) -> NdviStatistics:
+    """NDVI statistics per image and band pair, computed once and kept in a small LRU"""
+    cache_key = (key, red_band, nir_band)
+    with _ndvi_lock:
+        statistics = _ndvi.get(cache_key)
+        if statistics is not None:
+            _ndvi.move_to_end(cache_key)
+            return statistics
+    statistics = ndvi_statistics(source, red_band, nir_band)
+    with _ndvi_lock:
+        _ndvi[cache_key] = statistics
+        while len(_ndvi) > MAX_CACHED_NDVI:
+            _ndvi.popitem(last=False)
+    return statistics
@@ -0,0 +1,153 @@
+"""
+Packed Masks
+Vegetation masks stored at one bit per pixel (8x smaller than a uint8
+mask, 24x smaller than a painted RGB image), unpacked a row block at a
+time for analysis, rendered as a palette image only at display size, and
+persisted run-length encoded when that is smaller still.
+"""
+
+import math
+from typing import Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+from .image_source import DEFAULT_BLOCK_ROWS
+
+# Set bits per byte value
+POPCOUNT = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(axis=1)
+
+
+class PackedMask:
+    """
+    Read-only 0/1 mask backed by np.packbits rows (optionally a memmap).
+
+    Behaves like a uint8 array for row-block access: ``mask.shape``,
+    ``mask[y0:y1]``, ``mask[::4, ::4]`` and ``np.asarray(mask)`` unpack
+    only the rows asked for, so the mask analyses accept it unchanged.
+    """
+
+    dtype = np.dtype(np.uint8)
+    ndim = 2
+
+    def __init__(self, bits: np.ndarray, width: int):
+        self.bits = bits
+        self.width = width
+        self.height = bits.shape[0]
+
+    @classmethod
+    def empty(cls, shape: Tuple[int, int], path: Optional[str] = None) -> "PackedMask":
+        """All-zero mask to fill with ``write_rows``, memory-mapped as an .npy file at ``path``"""
+        height, width = shape
+        packed_shape = (height, math.ceil(width / 8))
+        bits = np.lib.format.open_memmap(path, mode="w+", dtype=np.uint8, shape=packed_shape) if path \
+            else np.zeros(packed_shape, dtype=np.uint8)
+        return cls(bits, width)
+
+    @classmethod
+    def from_mask(cls, mask: np.ndarray, path: Optional[str] = None,
+                  block_rows: int = DEFAULT_BLOCK_ROWS) -> "PackedMask":
+        packed = cls.empty(mask.shape[:2], path)
+        for y0 in range(0, packed.height, block_rows):
+            packed.write_rows(y0, mask[y0:y0 + block_rows])
+        packed.flush()
+        return packed
+
+    def write_rows(self, y0: int, rows: np.ndarray) -> None:
+        self.bits[y0:y0 + len(rows)] = np.packbits(rows != 0, axis=1)
+
+    def flush(self) -> None:
+        if isinstance(self.bits, np.memmap):
+            self.bits.flush()
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return self.height, self.width
+
+    @property
+    def nbytes(self) -> int:
+        return self.bits.nbytes
+
+    def __len__(self) -> int:
+        return self.height
+
+    def __getitem__(self, key) -> np.ndarray:
+        rows, cols = key if isinstance(key, tuple) else (key, slice(None))
+        if isinstance(rows, (int, np.integer)):
+            return np.unpackbits(self.bits[rows], count=self.width)[cols]
+        return np.unpackbits(self.bits[rows], axis=1, count=self.width)[:, cols]
+
+    def __array__(self, dtype=None, copy=None) -> np.ndarray:
+        array = self[:]
+        return array if dtype is None else array.astype(dtype, copy=False)
+
+    def count_nonzero(self, block_rows: int = 8 * DEFAULT_BLOCK_ROWS) -> int:
+        """Vegetation pixels, by popcount of the packed bytes"""
+        counts = np.zeros(256, dtype=np.int64)
+        for y0 in range(0, self.height, block_rows):
+            counts += np.bincount(self.bits[y0:y0 + block_rows].ravel(), minlength=256)
+        return int(counts @ POPCOUNT)
+
+    def to_image(self, max_side: Optional[int] = None, color: bool = True) -> Image.Image:
+        """
+        Palette ("P") image, green / grey (or white / grey for grayscale
+        sources), downsampled by striding to at most ``max_side``
+        """
+        step = max(1, math.ceil(max(self.shape) / max_side)) if max_side else 1
+        image = Image.fromarray(np.ascontiguousarray(self[::step, ::step]), mode="P")
+        image.putpalette([128, 128, 128, 0, 255, 0] if color else [128, 128, 128, 255, 255, 255])
+        return image
+
+    def to_rle(self, block_rows: int = DEFAULT_BLOCK_ROWS) -> np.ndarray:
+        """
+        Run lengths of the row-major pixel sequence, alternating 0-runs and
+        1-runs and starting with a (possibly empty) 0-run
+        """
+        runs, value, length = [], 0, 0
+        for y0 in range(0, self.height, block_rows):
+            flat = self[y0:y0 + block_rows].ravel()
+            starts = np.concatenate([[0], np.flatnonzero(flat[1:] != flat[:-1]) + 1])
+            lengths = np.diff(np.append(starts, len(flat)))
+            if flat[0] == value:
+                length += int(lengths[0])
+                lengths = lengths[1:]
+            if len(lengths):
+                runs.append(length)
+                runs.extend(lengths[:-1].tolist())
+                length, value = int(lengths[-1]), int(flat[-1])
+        runs.append(length)
+        return np.asarray(runs, dtype=np.uint64 if self.height * self.width >= 1 << 32 else np.uint32)
+
+    @classmethod
+    def from_rle(cls, runs: np.ndarray, shape: Tuple[int, int], path: Optional[str] = None,
+                 block_rows: int = DEFAULT_BLOCK_ROWS) -> "PackedMask":
+        packed = cls.empty(shape, path)
+        height, width = shape
+        ends = np.cumsum(runs.astype(np.int64))
+        for y0 in range(0, height, block_rows):
+            y1 = min(height, y0 + block_rows)
+            start, stop = y0 * width, y1 * width
+            first = int(np.searchsorted(ends, start, side="right"))
+            last = int(np.searchsorted(ends, stop - 1, side="right"))
+            lengths = np.minimum(ends[first:last + 1], stop) - np.maximum(
+                np.concatenate([[ends[first - 1] if first else 0], ends[first:last]]), start)
+            values = (np.arange(first, last + 1) & 1).astype(np.uint8)
+            packed.write_rows(y0, np.repeat(values, lengths).reshape(y1 - y0, width))
+        packed.flush()
+        return packed
+
+    def save(self, path: str) -> None:
+        """Persist as .npz, run-length encoded when that beats the packed bits"""
+        runs = self.to_rle()
+        if runs.nbytes < self.bits.nbytes:
+            np.savez(path, shape=self.shape, runs=runs)
+        else:
+            np.savez(path, shape=self.shape, bits=np.asarray(self.bits))
+
+    @classmethod
+    def load(cls, path: str) -> "PackedMask":
+        with np.load(path) as data:
+            height, width = (int(v) for v in data["shape"])
+            if "runs" in data:
+                return cls.from_rle(data["runs"], (height, width))
+            return cls(data["bits"], width)
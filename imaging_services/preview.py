@@ -0,0 +1,142 @@
+"""
+Display Previews
+Preview pyramids and compressed encodings so pages ship display-sized
+JPEG/WebP to the browser instead of full-resolution PNG
+"""
+
+import io
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple, Union
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from .image_source import ImageSource
+
+DEFAULT_DISPLAY_WIDTH = 1280
+DEFAULT_FORMAT = "JPEG"
+DEFAULT_QUALITY = 85
+MIN_LEVEL_SIZE = 256
+# Pyramids never keep more than this, whatever the source resolution
+MAX_BASE_SIDE = 2 * DEFAULT_DISPLAY_WIDTH
+MAX_CACHED_PYRAMIDS = 32
+
+
+def to_display_array(image: Union[Image.Image, np.ndarray, ImageSource],
+                     max_side: Optional[int] = None) -> np.ndarray:
+    """RGB or grayscale uint8 array suitable for JPEG/WebP encoding"""
+    if isinstance(image, ImageSource):
+        return image.thumbnail(max_side) if max_side else image.to_array()
+    if isinstance(image, Image.Image):
+        if image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        return np.asarray(image)
+    array = np.asarray(image)
+    if array.dtype != np.uint8:
+        array = np.clip(array, 0, 255).astype(np.uint8)
+    if array.ndim == 3 and array.shape[2] == 4:
+        array = cv2.cvtColor(array, cv2.COLOR_RGBA2RGB)
+    return array
+
+
+def downscale(array: np.ndarray, max_width: int) -> Tuple[np.ndarray, float]:
+    """Shrink to at most ``max_width`` pixels wide; returns (array, scale factor)"""
+    height, width = array.shape[:2]
+    if width <= max_width:
+        return array, 1.0
+    scale = max_width / width
+    size = (max_width, max(1, round(height * scale)))
+    return cv2.resize(array, size, interpolation=cv2.INTER_AREA), scale
+
+
+def encode_image(array: np.ndarray, fmt: str = DEFAULT_FORMAT, quality: int = DEFAULT_QUALITY) -> bytes:
+    """Compress an RGB/grayscale array to JPEG or WebP bytes"""
+    buffer = io.BytesIO()
+    Image.fromarray(array).save(buffer, format=fmt, quality=quality)
+    return buffer.getvalue()
+
+
+class PreviewPyramid:
+    """
+    Successive 2x reductions of a full-resolution image.
+
+    Level 0 is the source reduced to at most ``max_side`` (an ImageSource
+    is downsampled strip by strip, never loaded whole); each further level
+    halves both sides (area averaging) until the longer side drops below
+    MIN_LEVEL_SIZE. A display
+    request is served from the smallest level that is still at least as wide
+    as asked for, so resizing and encoding cost depend on the display size,
+    not on the source resolution. Encoded bytes are memoized per request.
+    """
+
+    def __init__(self, image: Union[Image.Image, np.ndarray, ImageSource], min_size: int = MIN_LEVEL_SIZE,
+                 max_side: int = MAX_BASE_SIDE):
+        if isinstance(image, ImageSource):
+            self.full_size = image.size
+            base = image.thumbnail(max_side)
+        else:
+            base = to_display_array(image)
+            self.full_size = (base.shape[1], base.shape[0])
+            if max(base.shape[:2]) > max_side:
+                base, _ = downscale(base, round(base.shape[1] * max_side / max(base.shape[:2])))
+        self.levels: List[np.ndarray] = [base]
+        while max(self.levels[-1].shape[:2]) // 2 >= min_size:
+            previous = self.levels[-1]
+            half = (max(1, previous.shape[1] // 2), max(1, previous.shape[0] // 2))
+            self.levels.append(cv2.resize(previous, half, interpolation=cv2.INTER_AREA))
+        self._encoded: Dict[tuple, bytes] = {}
+        self._lock = threading.Lock()
+
+    def level_for(self, max_width: int) -> np.ndarray:
+        """Smallest level at least ``max_width`` wide (or the source if none is)"""
+        for level in reversed(self.levels):
+            if level.shape[1] >= max_width:
+                return level
+        return self.levels[0]
+
+    def preview(self, max_width: int = DEFAULT_DISPLAY_WIDTH) -> Tuple[np.ndarray, float]:
+        """Display-sized array and its scale relative to the full-resolution source"""
+        array, _ = downscale(self.level_for(max_width), max_width)
+        return array, array.shape[1] / self.full_size[0]
+
+    def encoded(self, max_width: int = DEFAULT_DISPLAY_WIDTH, fmt: str = DEFAULT_FORMAT,
+                quality: int = DEFAULT_QUALITY) -> bytes:
+        key = (max_width, fmt, quality)
+        with self._lock:
+            if key not in self._encoded:
+                self._encoded[key] = encode_image(self.preview(max_width)[0], fmt, quality)
+            return self._encoded[key]
+
+
+_pyramids: "OrderedDict[str, PreviewPyramid]" = OrderedDict()
+_pyramids_lock = threading.Lock()
+
+
+def get_preview_pyramid(key: str, image: Union[Image.Image, np.ndarray, ImageSource]) -> PreviewPyramid:
+    """
+    Pyramid for an ingested image, built once per ``key`` (e.g. the content
+    hash of the upload) and kept in a small process-wide LRU.
+    """
+    with _pyramids_lock:
+        pyramid = _pyramids.get(key)
+        if pyramid is not None:
+            _pyramids.move_to_end(key)
+            return pyramid
+    pyramid = PreviewPyramid(image)
+    with _pyramids_lock:
+        _pyramids[key] = pyramid
+        while len(_pyramids) > MAX_CACHED_PYRAMIDS:
+            _pyramids.popitem(last=False)
+    return pyramid
+
+
+def encode_preview(image: Union[Image.Image, np.ndarray, ImageSource], max_width: int = DEFAULT_DISPLAY_WIDTH,
+                   fmt: str = DEFAULT_FORMAT, quality: int = DEFAULT_QUALITY,
+                   cache_key: Optional[str] = None) -> bytes:
+    """Display-sized, compressed bytes for any image (pyramid-backed when ``cache_key`` is given)"""
+    if cache_key is not None:
+        return get_preview_pyramid(cache_key, image).encoded(max_width, fmt, quality)
+    array, _ = downscale(to_display_array(image, max_side=max_width), max_width)
+    return encode_image(array, fmt, quality)
@@ -0,0 +1,197 @@
+"""
+Region Cover
+Green cover per parcel, plot or compartment. Polygons (GeoJSON, in pixel
+or georeferenced coordinates) are rasterized once into a label image, and
+every region is then counted in a single bincount pass over the mask.
+"""
+
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from .image_source import DEFAULT_BLOCK_ROWS
+
+MAX_CACHED_LABELS = 8
+
+
+@dataclass
+class Region:
+    """One named polygon (or multipolygon): a list of rings, each an Nx2 array of pixel (x, y)"""
+    name: str
+    rings: List[np.ndarray]
+
+    @property
+    def bounds(self) -> Tuple[float, float, float, float]:
+        points = np.concatenate(self.rings)
+        return points[:, 0].min(), points[:, 1].min(), points[:, 0].max(), points[:, 1].max()
+
+    def edges(self) -> np.ndarray:
+        """Ex4 array of (x0, y0, x1, y1) over every ring, each ring closed"""
+        return np.concatenate([np.hstack([ring, np.roll(ring, -1, axis=0)]) for ring in self.rings])
+
+
+@dataclass
+class RegionCover:
+    name: str
+    pixels: int
+    green_pixels: int
+
+    @property
+    def green_percentage(self) -> float:
+        return self.green_pixels / self.pixels * 100 if self.pixels else 0.0
+
+
+def _world_to_pixel(points: np.ndarray, transform: Sequence[float]) -> np.ndarray:
+    """Invert a GDAL-style affine geo transform"""
+    x0, a, b, y0, d, e = transform
+    inverse = np.linalg.inv(np.array([[a, b], [d, e]]))
+    return (points - [x0, y0]) @ inverse.T
+
+
+def load_regions(geojson: Union[str, bytes, dict],
+                 transform: Optional[Sequence[float]] = None) -> List[Region]:
+    """
+    Regions from a GeoJSON FeatureCollection, Feature or bare (Multi)Polygon.
+
+    Coordinates are pixel (x, y) unless a geo ``transform`` is given, in
+    which case they are map coordinates in the raster's CRS. Feature names
+    come from the ``name`` or ``id`` property.
+    """
+    data = json.loads(geojson) if isinstance(geojson, (str, bytes)) else geojson
+    if not isinstance(data, dict):
+        raise ValueError(f"GeoJSON must be an object, not {type(data).__name__}")
+    if data.get("type") == "FeatureCollection":
+        features = data["features"]
+    elif data.get("type") == "Feature":
+        features = [data]
+    else:
+        features = [{"type": "Feature", "geometry": data, "properties": {}}]
+
+    regions = []
+    for number, feature in enumerate(features, 1):
+        if not isinstance(feature, dict) or not isinstance(feature.get("geometry") or {}, dict):
+            raise ValueError(f"Feature {number} is not a GeoJSON Feature object")
+        geometry = feature.get("geometry") or {}
+        if geometry.get("type") == "Polygon":
+            polygons = [geometry["coordinates"]]
+        elif geometry.get("type") == "MultiPolygon":
+            polygons = geometry["coordinates"]
+        else:
+            continue
+        rings = [np.asarray(ring, dtype=np.float64)[:, :2] for polygon in polygons for ring in polygon if ring]
+        if not rings:
+            continue
+        if transform is not None:
+            rings = [_world_to_pixel(ring, transform) for ring in rings]
+        properties = feature.get("properties") or {}
+        name = properties.get("name") or properties.get("id") or feature.get("id") or f"Region {number}"
+        regions.append(Region(name=str(name), rings=rings))
+    return regions
+
+
+def rasterize_regions(regions: Sequence[Region], height: int, width: int, path: Optional[str] = None,
+                      block_rows: int = DEFAULT_BLOCK_ROWS) -> np.ndarray:
+    """
+    Label image: 0 outside every region, i + 1 inside ``regions[i]``.
+
+    A pixel belongs to a region when its centre is inside by the even-odd
+    rule, so holes stay unlabelled and the result does not depend on how
+    the image is split into blocks; where regions overlap the later one
+    wins. Filled block by block into an .npy memmap at ``path`` when given.
+    """
+    dtype = np.uint16 if len(regions) < 1 << 16 else np.uint32
+    labels = np.lib.format.open_memmap(path, mode="w+", dtype=dtype, shape=(height, width)) if path \
+        else np.empty((height, width), dtype=dtype)
+    edges = [region.edges() for region in regions]
+    for y0 in range(0, height, block_rows):
+        y1 = min(height, y0 + block_rows)
+        block = np.zeros((y1 - y0, width), dtype=dtype)
+        for label, region_edges in enumerate(edges, 1):
+            _fill_scanlines(block, y0, region_edges, label)
+        labels[y0:y1] = block
+    if path:
+        labels.flush()
+    return labels
+
+
+def _fill_scanlines(block: np.ndarray, y0: int, edges: np.ndarray, label: int) -> None:
+    """Fill one region's rows of ``block`` (image rows y0...) from its edge crossings at pixel centres"""
+    x0, ey0, x1, ey1 = edges.T
+    first = max(y0, int(np.ceil(min(ey0.min(), ey1.min()) - 0.5)))
+    last = min(y0 + len(block), int(np.ceil(max(ey0.max(), ey1.max()) - 0.5)))
+    if first >= last:
+        return
+    centres = np.arange(first, last) + 0.5
+    # Half-open crossing test, so a vertex on a scanline is counted once
+    rows, hit = np.nonzero((ey0 <= centres[:, None]) != (ey1 <= centres[:, None]))
+    if not len(rows):
+        return
+    xs = x0[hit] + (centres[rows] - ey0[hit]) * (x1[hit] - x0[hit]) / (ey1[hit] - ey0[hit])
+    order = np.lexsort((xs, rows))
+    rows, xs = rows[order], xs[order]
+    # Consecutive crossings on a row pair up into spans of pixel centres inside
+    width = block.shape[1]
+    starts = np.clip(np.ceil(xs[0::2] - 0.5), 0, width).astype(np.int64)
+    ends = np.clip(np.ceil(xs[1::2] - 0.5), 0, width).astype(np.int64)
+    left, right = int(starts.min()), int(ends.max())
+    if left >= right:
+        return
+    span_rows = rows[0::2]
+    coverage = np.zeros((last - first, right - left + 1), dtype=np.int32)
+    np.add.at(coverage, (span_rows, starts - left), 1)
+    np.add.at(coverage, (span_rows, ends - left), -1)
+    inside = np.cumsum(coverage[:, :-1], axis=1) > 0
+    window = block[first - y0:last - y0, left:right]
+    window[inside] = label
+
+
+def count_regions(labels: np.ndarray, mask: np.ndarray, regions: Sequence[Region],
+                  block_rows: int = DEFAULT_BLOCK_ROWS) -> List[RegionCover]:
+    """Pixels and vegetation pixels of every region in one pass: bincount over label * 2 + mask"""
+    bins = 2 * (len(regions) + 1)
+    counts = np.zeros(bins, dtype=np.int64)
+    for y0 in range(0, labels.shape[0], block_rows):
+        keys = labels[y0:y0 + block_rows].astype(np.int64) << 1
+        keys |= mask[y0:y0 + block_rows] != 0
+        counts += np.bincount(keys.ravel(), minlength=bins)
+    counts = counts.reshape(-1, 2)[1:]
+    return [RegionCover(name=region.name, pixels=int(idle + green), green_pixels=int(green))
+            for region, (idle, green) in zip(regions, counts)]
+
+
+def regions_key(regions: Sequence[Region]) -> str:
+    """Content hash of a region set, for caching its label image"""
+    digest = hashlib.md5()
+    for region in regions:
+        digest.update(region.name.encode())
+        for ring in region.rings:
+            digest.update(np.ascontiguousarray(ring, dtype=np.float64).tobytes())
+    return digest.hexdigest()
+
+
+_labels: "OrderedDict[str, np.ndarray]" = OrderedDict()
+_labels_lock = threading.Lock()
+
+
+def get_region_labels(key: str, regions: Sequence[Region], height: int, width: int,
+                      path: Optional[str] = None) -> np.ndarray:
+    """
+    Label image for one image size and region set, rasterized once per
+    ``key`` and kept in a small process-wide LRU
+    """
+    with _labels_lock:
+        labels = _labels.get(key)
+        if labels is not None:
+            _labels.move_to_end(key)
+            return labels
+    labels = rasterize_regions(regions, height, width, path)
+    with _labels_lock:
+        _labels[key] = labels
+        while len(_labels) > MAX_CACHED_LABELS:
+            _labels.popitem(last=False)
+    return labels
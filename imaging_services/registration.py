@@ -0,0 +1,219 @@
+"""
+Image Registration
+Coarse-to-fine co-registration of two epochs of the same site. A global
+affine is estimated on small pyramid levels (ORB features + RANSAC, with
+ECC as the fallback), then refined at full resolution by phase
+correlation of a handful of windows, so the cost depends on the preview
+size and window count rather than on the raster size.
+"""
+
+import math
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple, Union
+
+import cv2
+import numpy as np
+
+from .image_source import ArraySource, ImageSource
+
+COARSE_MAX_SIDE = 1024
+ORB_FEATURES = 4000
+MIN_MATCHES = 12
+# Full-resolution refinement: grid of windows and their size
+REFINE_GRID = 4
+REFINE_WINDOW = 512
+MIN_PHASE_RESPONSE = 0.1
+
+
+@dataclass
+class Registration:
+    """
+    2x3 affine mapping moving-image pixel coordinates onto the reference
+    image, plus how it was obtained
+    """
+    matrix: np.ndarray
+    method: str
+    inliers: int = 0
+    residual_px: Optional[float] = None
+    details: dict = field(default_factory=dict)
+
+    @property
+    def inverse(self) -> np.ndarray:
+        """Reference -> moving"""
+        return cv2.invertAffineTransform(self.matrix)
+
+    @property
+    def shift(self) -> Tuple[float, float]:
+        return float(self.matrix[0, 2]), float(self.matrix[1, 2])
+
+    @property
+    def rotation_deg(self) -> float:
+        return math.degrees(math.atan2(self.matrix[1, 0], self.matrix[0, 0]))
+
+    @property
+    def scale(self) -> float:
+        return math.sqrt(abs(np.linalg.det(self.matrix[:, :2])))
+
+
+def _as_source(image: Union[np.ndarray, ImageSource]) -> ImageSource:
+    return image if isinstance(image, ImageSource) else ArraySource(image)
+
+
+def _gray(image: np.ndarray) -> np.ndarray:
+    return cv2.cvtColor(image, cv2.COLOR_RGB2GRAY) if image.ndim == 3 else image
+
+
+def _level(source: ImageSource, max_side: int) -> Tuple[np.ndarray, Tuple[float, float]]:
+    """Grayscale pyramid level and its full-resolution pixels per level pixel (x, y)"""
+    return _gray(source.thumbnail(max_side)), source.thumbnail_scale(max_side)
+
+
+def _scaled(matrix: np.ndarray, moving_scale: Tuple[float, float],
+            reference_scale: Tuple[float, float]) -> np.ndarray:
+    """Affine between pyramid levels -> affine between full-resolution images"""
+    to_level = np.diag([1 / moving_scale[0], 1 / moving_scale[1], 1.0])
+    from_level = np.diag([reference_scale[0], reference_scale[1], 1.0])
+    return (from_level @ np.vstack([matrix, [0, 0, 1]]) @ to_level)[:2]
+
+
+def _unscaled(matrix: np.ndarray, moving_scale: Tuple[float, float],
+              reference_scale: Tuple[float, float]) -> np.ndarray:
+    """Inverse of _scaled: full-resolution affine -> affine between pyramid levels"""
+    return _scaled(matrix, (1 / moving_scale[0], 1 / moving_scale[1]),
+                   (1 / reference_scale[0], 1 / reference_scale[1]))
+
+
+def match_features(reference: np.ndarray, moving: np.ndarray,
+                   max_features: int = ORB_FEATURES) -> Tuple[Optional[np.ndarray], int]:
+    """Similarity transform moving -> reference from ORB matches (None when too few agree)"""
+    orb = cv2.ORB_create(max_features)
+    ref_points, ref_desc = orb.detectAndCompute(reference, None)
+    mov_points, mov_desc = orb.detectAndCompute(moving, None)
+    if ref_desc is None or mov_desc is None or len(ref_points) < MIN_MATCHES or len(mov_points) < MIN_MATCHES:
+        return None, 0
+    pairs = cv2.BFMatcher(cv2.NORM_HAMMING).knnMatch(mov_desc, ref_desc, k=2)
+    # Lowe's ratio test
+    good = [p[0] for p in pairs if len(p) == 2 and p[0].distance < 0.75 * p[1].distance]
+    if len(good) < MIN_MATCHES:
+        return None, 0
+    src = np.float32([mov_points[m.queryIdx].pt for m in good])
+    dst = np.float32([ref_points[m.trainIdx].pt for m in good])
+    matrix, inliers = cv2.estimateAffinePartial2D(src, dst, method=cv2.RANSAC, ransacReprojThreshold=3.0)
+    count = int(inliers.sum()) if inliers is not None else 0
+    return (matrix, count) if matrix is not None and count >= MIN_MATCHES else (None, count)
+
+
+def align_ecc(reference: np.ndarray, moving: np.ndarray, initial: Optional[np.ndarray] = None,
+              iterations: int = 100) -> Optional[np.ndarray]:
+    """Affine moving -> reference by ECC maximisation (None if it does not converge)"""
+    warp = cv2.invertAffineTransform(initial if initial is not None else np.eye(2, 3)).astype(np.float32)
+    criteria = (cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, iterations, 1e-5)
+    try:
+        # ECC's warp maps template (reference) coordinates into the input (moving) image
+        _, warp = cv2.findTransformECC(reference.astype(np.float32), moving.astype(np.float32), warp,
+                                       cv2.MOTION_AFFINE, criteria, None, 5)
+    except cv2.error:
+        return None
+    return cv2.invertAffineTransform(warp)
+
+
+def _window_grid(width: int, height: int, grid: int, size: int) -> List[Tuple[int, int]]:
+    """Top-left corners of a grid x grid layout of windows inside the image"""
+    size_x, size_y = min(size, width), min(size, height)
+    xs = np.linspace(0, width - size_x, grid).astype(int)
+    ys = np.linspace(0, height - size_y, grid).astype(int)
+    return [(int(x), int(y)) for y in ys for x in xs]
+
+
+def refine_full_resolution(reference: ImageSource, moving: ImageSource, matrix: np.ndarray,
+                           grid: int = REFINE_GRID, window: int = REFINE_WINDOW) -> Tuple[np.ndarray, int, Optional[float]]:
+    """
+    Correct a coarse affine with full-resolution phase correlation.
+
+    For each window of the reference, the matching area of the moving
+    image is read and warped by the current estimate; the residual shift
+    from cv2.phaseCorrelate gives one correspondence, and all of them are
+    fitted to a new affine with RANSAC. Returns (matrix, windows used,
+    median residual px before refinement).
+    """
+    inverse = cv2.invertAffineTransform(matrix)
+    hanning = None
+    moving_points, reference_points, residuals = [], [], []
+    for x0, y0 in _window_grid(reference.width, reference.height, grid, window):
+        ref = _gray(reference.read_window(x0, y0, x0 + window, y0 + window)).astype(np.float32)
+        h, w = ref.shape
+        # Moving-image bounding box of this window, read once
+        corners = cv2.transform(np.float32([[[x0, y0], [x0 + w, y0], [x0, y0 + h], [x0 + w, y0 + h]]]), inverse)[0]
+        mx0, my0 = np.floor(corners.min(axis=0)).astype(int) - 2
+        mx1, my1 = np.ceil(corners.max(axis=0)).astype(int) + 2
+        if mx1 <= 0 or my1 <= 0 or mx0 >= moving.width or my0 >= moving.height:
+            continue
+        mx0, my0 = max(mx0, 0), max(my0, 0)
+        patch = _gray(moving.read_window(mx0, my0, mx1, my1)).astype(np.float32)
+        # Window pixel -> moving-patch pixel: translate, inverse affine, translate
+        local = inverse.copy()
+        local[:, 2] += inverse[:, :2] @ [x0, y0] - [mx0, my0]
+        warped = cv2.warpAffine(patch, local, (w, h), flags=cv2.INTER_LINEAR | cv2.WARP_INVERSE_MAP,
+                                borderMode=cv2.BORDER_REFLECT)
+        if hanning is None or hanning.shape != ref.shape:
+            hanning = cv2.createHanningWindow((w, h), cv2.CV_32F)
+        (dx, dy), response = cv2.phaseCorrelate(ref, warped, hanning)
+        if response < MIN_PHASE_RESPONSE:
+            continue
+        centre = np.array([x0 + w / 2, y0 + h / 2])
+        reference_points.append(centre)
+        moving_points.append(cv2.transform(np.float32([[centre + [dx, dy]]]), inverse)[0, 0])
+        residuals.append(math.hypot(dx, dy))
+
+    if len(reference_points) < 3:
+        return matrix, len(reference_points), float(np.median(residuals)) if residuals else None
+    refined, inliers = cv2.estimateAffine2D(np.float32(moving_points), np.float32(reference_points),
+                                            method=cv2.RANSAC, ransacReprojThreshold=2.0)
+    if refined is None:
+        return matrix, 0, float(np.median(residuals))
+    return refined, int(inliers.sum()), float(np.median(residuals))
+
+
+def register_images(reference: Union[np.ndarray, ImageSource], moving: Union[np.ndarray, ImageSource],
+                    coarse_max_side: int = COARSE_MAX_SIDE, refine: bool = True) -> Registration:
+    """
+    Affine aligning ``moving`` onto ``reference`` (arrays or image sources).
+
+    1. ORB + RANSAC on a coarse level (about ``coarse_max_side`` px), or
+       ECC on that level when features are too few.
+    2. ECC polish on a level twice as large, when the images are bigger.
+    3. Full-resolution phase-correlation refinement (``refine``).
+    """
+    reference, moving = _as_source(reference), _as_source(moving)
+    ref_level, ref_scale = _level(reference, coarse_max_side)
+    mov_level, mov_scale = _level(moving, coarse_max_side)
+
+    coarse, inliers = match_features(ref_level, mov_level)
+    method = "orb"
+    if coarse is None:
+        # Start ECC from the scale difference between the two levels
+        initial = np.float32([[ref_level.shape[1] / mov_level.shape[1], 0, 0],
+                              [0, ref_level.shape[0] / mov_level.shape[0], 0]])
+        coarse = align_ecc(ref_level, mov_level, initial)
+        method = "ecc"
+        if coarse is None:
+            coarse, method = initial, "identity"
+    matrix = _scaled(coarse, mov_scale, ref_scale)
+
+    if max(reference.width, reference.height) > 2 * coarse_max_side:
+        fine_ref, fine_ref_scale = _level(reference, 2 * coarse_max_side)
+        fine_mov, fine_mov_scale = _level(moving, 2 * coarse_max_side)
+        initial = _unscaled(matrix, fine_mov_scale, fine_ref_scale)
+        polished = align_ecc(fine_ref, fine_mov, initial, iterations=30)
+        if polished is not None and np.abs(polished - initial).max() < 0.05 * max(fine_ref.shape):
+            matrix = _scaled(polished, fine_mov_scale, fine_ref_scale)
+            method += "+ecc"
+
+    residual = None
+    windows = 0
+    if refine:
+        matrix, windows, residual = refine_full_resolution(reference, moving, matrix)
+        if windows >= 3:
+            method += "+phase"
+    return Registration(matrix=np.asarray(matrix, dtype=np.float64), method=method, inliers=inliers,
+                        residual_px=residual, details={"refine_windows": windows})
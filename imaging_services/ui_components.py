@@ -0,0 +1,23 @@
+"""
+UI Components for Image Display
+Streamlit helpers that always send display-sized, compressed previews.
+Streamlit is imported on first use, so headless users of imaging_services
+(batch workers, the path planner) never load it.
+"""
+
+from typing import Optional, Union
+
+import numpy as np
+from PIL import Image
+
+from .image_source import ImageSource
+from .preview import DEFAULT_DISPLAY_WIDTH, encode_preview
+
+
+def show_image(image: Union[Image.Image, np.ndarray, ImageSource], caption: Optional[str] = None,
+               cache_key: Optional[str] = None, max_width: int = DEFAULT_DISPLAY_WIDTH):
+    """Drop-in for st.image that encodes a display-sized JPEG instead of full-resolution PNG"""
+    import streamlit as st
+
+    st.image(encode_preview(image, max_width=max_width, cache_key=cache_key),
+             caption=caption, use_container_width=True)
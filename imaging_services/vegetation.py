@@ -0,0 +1,535 @@
+"""
+Vegetation Classifier
+Compiles each green-cover method and sensitivity into a colour lookup
+table, so classifying an image is one uint8 gather per pixel with no
+float or HSV copies of the image. Per-image histograms answer cover
+percentages for any method and sensitivity without touching pixels,
+and both passes also run block by block over rasters too large to load.
+"""
+
+import math
+import sys
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from functools import lru_cache
+from statistics import NormalDist
+from typing import Callable, Iterator, Optional, Tuple, Union
+
+import cv2
+import numpy as np
+
+from .image_source import DEFAULT_BLOCK_ROWS, ArraySource, ImageSource
+from .packed_mask import PackedMask
+
+METHOD_GREEN_CHANNEL = "Green Channel Analysis"
+METHOD_HSV = "HSV Color Space"
+METHOD_NDVI = "NDVI Simulation"
+METHODS = (METHOD_GREEN_CHANNEL, METHOD_HSV, METHOD_NDVI)
+
+IDLE, GREEN = 0, 1
+# Mask value -> display colour (grey for idle land, green for vegetation)
+PALETTE_RGB = np.array([[128, 128, 128], [0, 255, 0]], dtype=np.uint8)
+PALETTE_GRAY = np.array([128, 255], dtype=np.uint8)
+
+HSV_HUE_RANGE = (35, 85)
+NDVI_BASE_THRESHOLD = 0.1
+# Rows gathered at a time, bounding the integer index temporaries
+GATHER_ROWS = 512
+MAX_CACHED_STATISTICS = 32
+MAX_CACHED_MASKS = 16
+
+# Approximate cover: strata per side, pixels drawn per refinement round, sample cap
+DEFAULT_STRATA = 8
+DEFAULT_ROUND_SAMPLES = 4096
+DEFAULT_MAX_SAMPLES = 1 << 20
+
+
+@dataclass
+class VegetationResult:
+    """uint8 mask (1 = vegetation) plus the method's statistics"""
+    mask: Optional[np.ndarray]
+    green_pixels: int
+    total_pixels: int
+    details: dict = field(default_factory=dict)
+
+    @property
+    def green_percentage(self) -> float:
+        return self.green_pixels / self.total_pixels * 100 if self.total_pixels else 0.0
+
+    @property
+    def idle_percentage(self) -> float:
+        return (self.total_pixels - self.green_pixels) / self.total_pixels * 100 if self.total_pixels else 0.0
+
+
+@dataclass
+class CoverEstimate:
+    """Green cover estimated from a stratified pixel sample"""
+    green_percentage: float
+    # Half-width of the confidence interval, in percentage points
+    margin: float
+    confidence: float
+    samples: int
+    total_pixels: int
+
+    @property
+    def idle_percentage(self) -> float:
+        return 100.0 - self.green_percentage
+
+    @property
+    def interval(self) -> Tuple[float, float]:
+        return max(0.0, self.green_percentage - self.margin), min(100.0, self.green_percentage + self.margin)
+
+
+def hsv_bounds(threshold_factor: float) -> Tuple[np.ndarray, np.ndarray]:
+    """Lower / upper HSV limits; higher sensitivity admits paler, darker greens"""
+    saturation_min = max(20, 40 - (threshold_factor - 1) * 20)
+    value_min = max(20, 40 - (threshold_factor - 1) * 20)
+    lower = np.array([HSV_HUE_RANGE[0], int(saturation_min), int(value_min)])
+    upper = np.array([HSV_HUE_RANGE[1], 255, 255])
+    return lower, upper
+
+
+def _rgb_cube() -> np.ndarray:
+    """Every 24-bit colour once, laid out so pixel i has R | G << 8 | B << 16 == i"""
+    index = np.arange(1 << 24, dtype=np.uint32)
+    cube = np.empty((1 << 24, 3), dtype=np.uint8)
+    cube[:, 0] = index & 0xFF
+    cube[:, 1] = (index >> 8) & 0xFF
+    cube[:, 2] = index >> 16
+    return cube.reshape(4096, 4096, 3)
+
+
+@lru_cache(maxsize=4)
+def hsv_lut(saturation_min: int, value_min: int) -> np.ndarray:
+    """16 MB table: RGB index -> 1 if the colour falls in the vegetation HSV range"""
+    hsv = cv2.cvtColor(_rgb_cube(), cv2.COLOR_RGB2HSV)
+    lower = np.array([HSV_HUE_RANGE[0], saturation_min, value_min])
+    upper = np.array([HSV_HUE_RANGE[1], 255, 255])
+    return (cv2.inRange(hsv, lower, upper).ravel() > 0).view(np.uint8)
+
+
+@lru_cache(maxsize=1)
+def hsv_sv_key_lut() -> np.ndarray:
+    """
+    32 MB table: RGB index -> S << 8 | V for colours whose hue is in the
+    vegetation range, 0 otherwise (S = 0 is never vegetation, so 0 is free
+    to mean "wrong hue").
+    """
+    hsv = cv2.cvtColor(_rgb_cube(), cv2.COLOR_RGB2HSV).reshape(-1, 3)
+    in_hue = (hsv[:, 0] >= HSV_HUE_RANGE[0]) & (hsv[:, 0] <= HSV_HUE_RANGE[1])
+    key = (hsv[:, 1].astype(np.uint16) << 8) | hsv[:, 2]
+    key[~in_hue] = 0
+    return key
+
+
+@lru_cache(maxsize=1)
+def pseudo_ndvi_table() -> np.ndarray:
+    """(G - R) / (R + G) for every (R, G) pair, indexed by R | G << 8, float32 as the pixel path computes it"""
+    index = np.arange(1 << 16)
+    red = (index & 0xFF).astype(np.float32)
+    green = (index >> 8).astype(np.float32)
+    denominator = red + green
+    denominator[denominator == 0] = 1
+    return (green - red) / denominator
+
+
+@lru_cache(maxsize=16)
+def ndvi_lut(threshold: float) -> np.ndarray:
+    # Compared in float32, as the per-pixel pseudo-NDVI always was
+    return (pseudo_ndvi_table() > np.float32(threshold)).view(np.uint8)
+
+
+def threshold_lut(threshold: float, inclusive: bool = True) -> np.ndarray:
+    """256-entry table for a single-channel threshold"""
+    levels = np.arange(256)
+    return ((levels >= threshold) if inclusive else (levels > threshold)).astype(np.uint8)
+
+
+def _rgb_index(block: np.ndarray) -> np.ndarray:
+    """R | G << 8 | B << 16 per pixel as uint32"""
+    if sys.byteorder == "little":
+        # RGBA bytes read as one little-endian uint32 are R | G << 8 | B << 16 | A << 24
+        index = cv2.cvtColor(np.ascontiguousarray(block[:, :, :3]), cv2.COLOR_RGB2RGBA).view(np.uint32)[:, :, 0]
+        index &= 0xFFFFFF
+        return index
+    index = block[:, :, 2].astype(np.uint32) << 16
+    index |= block[:, :, 1].astype(np.uint32) << 8
+    index |= block[:, :, 0]
+    return index
+
+
+def _rg_index(block: np.ndarray) -> np.ndarray:
+    """R | G << 8 per pixel as uint16"""
+    index = block[:, :, 1].astype(np.uint16) << 8
+    index |= block[:, :, 0]
+    return index
+
+
+def channel_histogram(image: np.ndarray, channel: int = 0) -> np.ndarray:
+    """
+    Exact int64 256-bin histogram of one channel of a uint8 image.
+
+    cv2.calcHist counts in float32, which is only exact below 2^24 per
+    bin, so it is run on row blocks and the blocks summed as integers.
+    """
+    counts = np.zeros(256, dtype=np.int64)
+    channels = [channel] if image.ndim == 3 else [0]
+    for y in range(0, image.shape[0], GATHER_ROWS):
+        counts += cv2.calcHist([image[y:y + GATHER_ROWS]], channels, None, [256], [0, 256]).ravel().astype(np.int64)
+    return counts
+
+
+def histogram_mean(counts: np.ndarray, values: np.ndarray = None) -> float:
+    values = np.arange(len(counts)) if values is None else values
+    total = counts.sum()
+    return float(counts @ values.astype(np.float64) / total) if total else 0.0
+
+
+def apply_lut(image: np.ndarray, lut: np.ndarray, index_fn=None) -> np.ndarray:
+    """Gather ``lut`` over the image block by block; ``index_fn`` maps a block to table indices"""
+    mask = np.empty(image.shape[:2], dtype=np.uint8)
+    if index_fn is None:
+        return cv2.LUT(image, lut) if len(lut) == 256 else np.take(lut, image, out=mask)
+    for y in range(0, image.shape[0], GATHER_ROWS):
+        np.take(lut, index_fn(image[y:y + GATHER_ROWS]), out=mask[y:y + GATHER_ROWS])
+    return mask
+
+
+def render_mask(mask: np.ndarray, color: bool = True) -> np.ndarray:
+    """Palette image of a vegetation mask: green / grey, or 255 / 128 for grayscale"""
+    palette = PALETTE_RGB if color else PALETTE_GRAY
+    lut = np.zeros((256,) + palette.shape[1:], dtype=np.uint8)
+    lut[:len(palette)] = palette
+    if not color:
+        return cv2.LUT(mask, lut)
+    # Per-channel table applied to the mask replicated into three channels
+    return cv2.LUT(cv2.cvtColor(mask, cv2.COLOR_GRAY2RGB), lut.reshape(1, 256, 3))
+
+
+def _green_index(block: np.ndarray) -> np.ndarray:
+    return block[:, :, 1]
+
+
+def compile_classifier(method: str, threshold_factor: float, color: bool = True,
+                       mean_green: Optional[float] = None) -> Tuple[np.ndarray, Optional[Callable]]:
+    """
+    Lookup table and block -> index function for one method and sensitivity.
+
+    The mean-threshold methods (green channel, grayscale NDVI simulation)
+    need the image's global ``mean_green`` from a statistics pass.
+    """
+    if method not in METHODS:
+        raise ValueError(f"Unknown green cover method {method!r}; expected one of {METHODS}")
+    if method == METHOD_HSV:
+        lower, _ = hsv_bounds(threshold_factor)
+        lut = hsv_lut(int(lower[1]), int(lower[2]))
+        # Grey pixels map to R = G = B
+        return (lut, _rgb_index) if color else (lut[np.arange(256) * 0x010101], None)
+    if method == METHOD_NDVI and color:
+        return ndvi_lut(NDVI_BASE_THRESHOLD / threshold_factor), _rg_index
+    if mean_green is None:
+        raise ValueError(f"{method} needs the image's mean green value")
+    lut = threshold_lut(mean_green / threshold_factor, inclusive=method != METHOD_NDVI)
+    return lut, _green_index if color else None
+
+
+def classify_vegetation(image: np.ndarray, method: str, threshold_factor: float) -> VegetationResult:
+    """
+    Vegetation mask for an RGB (or grayscale) uint8 image.
+
+    Green channel: green >= mean(green) / factor, with the mean taken from
+    a histogram pre-pass. HSV: the colour lies in the vegetation HSV range
+    (a cached 2^24-entry table per sensitivity). NDVI simulation: pseudo
+    NDVI (G - R) / (R + G) above 0.1 / factor (a 2^16-entry table over
+    red/green), or a mean threshold for grayscale input.
+    """
+    color = image.ndim == 3
+    total = image.shape[0] * image.shape[1]
+
+    if method == METHOD_HSV:
+        mask = apply_lut(image, *compile_classifier(method, threshold_factor, color))
+        lower, upper = hsv_bounds(threshold_factor)
+        details = {"hsv_range_lower": lower.tolist(), "hsv_range_upper": upper.tolist()}
+
+    elif method == METHOD_NDVI and color:
+        threshold = NDVI_BASE_THRESHOLD / threshold_factor
+        lut, _ = compile_classifier(method, threshold_factor, color)
+        mask = np.empty(image.shape[:2], dtype=np.uint8)
+        counts = np.zeros(1 << 16, dtype=np.int64)
+        for y in range(0, image.shape[0], GATHER_ROWS):
+            index = _rg_index(image[y:y + GATHER_ROWS])
+            np.take(lut, index, out=mask[y:y + GATHER_ROWS])
+            # Red/green histogram gives the exact mean pseudo-NDVI without a float image
+            counts += np.bincount(index.ravel(), minlength=1 << 16)
+        details = {"mean_ndvi": histogram_mean(counts, pseudo_ndvi_table()), "ndvi_threshold": float(threshold)}
+
+    else:
+        # Green channel, or grayscale NDVI simulation: threshold against the global mean
+        mean = histogram_mean(channel_histogram(image, 1))
+        mask = apply_lut(image, *compile_classifier(method, threshold_factor, color, mean_green=mean))
+        details = {"mean_green_value": mean, "threshold_used": float(mean / threshold_factor)} \
+            if method == METHOD_GREEN_CHANNEL else {"mean_ndvi": None, "ndvi_threshold": None}
+
+    return VegetationResult(mask=mask, green_pixels=int(np.count_nonzero(mask)), total_pixels=total,
+                            details=details)
+
+
+class CoverStatistics:
+    """
+    Sufficient statistics of one image for every green-cover method.
+
+    Holds a 256-bin green (or grey) histogram, a 2^16-bin red/green
+    histogram for pseudo-NDVI and a 256x256 saturation/value histogram of
+    the pixels whose hue is in the vegetation range. Built in one pass
+    over the image, or accumulated block by block with ``update`` and
+    ``finish``; afterwards ``cover`` answers any method and sensitivity in
+    O(bins) with exactly the pixel counts that classify_vegetation would
+    produce.
+    """
+
+    def __init__(self, image: Optional[np.ndarray] = None, color: bool = True):
+        self.color = image.ndim == 3 if image is not None else color
+        self.total_pixels = 0
+        self.green_hist = np.zeros(256, dtype=np.int64)
+        self._rg_hist = np.zeros(1 << 16, dtype=np.int64) if self.color else None
+        self._sv_hist = np.zeros(1 << 16, dtype=np.int64)
+        if image is not None:
+            self.update(image)
+            self.finish()
+
+    @classmethod
+    def from_source(cls, source: ImageSource, block_rows: int = DEFAULT_BLOCK_ROWS) -> "CoverStatistics":
+        """Statistics pass over an image source, one row block in memory at a time"""
+        statistics = cls(color=not source.grayscale)
+        for _, block in _iter_blocks(source, block_rows):
+            statistics.update(block)
+        statistics.finish()
+        return statistics
+
+    def update(self, block: np.ndarray) -> None:
+        """Accumulate one block of rows"""
+        self.total_pixels += block.shape[0] * block.shape[1]
+        self.green_hist += channel_histogram(block, 1)
+        if self.color:
+            sv_key = hsv_sv_key_lut()
+            for y in range(0, block.shape[0], GATHER_ROWS):
+                rows = block[y:y + GATHER_ROWS]
+                self._rg_hist += np.bincount(_rg_index(rows).ravel(), minlength=1 << 16)
+                self._sv_hist += np.bincount(np.take(sv_key, _rgb_index(rows)).ravel(), minlength=1 << 16)
+
+    def finish(self) -> None:
+        """Turn the histograms into the suffix sums ``cover`` reads"""
+        sv_hist = self._sv_hist
+        if not self.color:
+            np.add.at(sv_hist, hsv_sv_key_lut()[np.arange(256) * 0x010101], self.green_hist)
+        # Pixels with S >= s and V >= v for every (s, v): a 2-D suffix sum
+        sv_hist[0] = 0
+        self._sv_suffix = sv_hist.reshape(256, 256)[::-1, ::-1].cumsum(0).cumsum(1)[::-1, ::-1]
+
+        self.mean_green = histogram_mean(self.green_hist)
+        # Pseudo-NDVI values sorted once, so "NDVI > t" is a binary search plus a suffix sum
+        if self.color:
+            ndvi = pseudo_ndvi_table()
+            order = np.argsort(ndvi, kind="stable")
+            self._ndvi_sorted = ndvi[order]
+            self._ndvi_suffix = np.concatenate([self._rg_hist[order][::-1].cumsum()[::-1], [0]])
+            self.mean_ndvi = histogram_mean(self._rg_hist, ndvi)
+        self._green_suffix = np.concatenate([self.green_hist[::-1].cumsum()[::-1], [0]])
+
+    def _count_at_least(self, threshold: float, inclusive: bool) -> int:
+        """Green/grey pixels >= (or >) ``threshold``"""
+        first = int(np.ceil(threshold)) if inclusive else int(np.floor(threshold)) + 1
+        return int(self._green_suffix[min(max(first, 0), 256)])
+
+    def cover(self, method: str, threshold_factor: float) -> Tuple[int, dict]:
+        """(green pixels, method details) as classify_vegetation would report them"""
+        if method == METHOD_HSV:
+            lower, upper = hsv_bounds(threshold_factor)
+            return int(self._sv_suffix[lower[1], lower[2]]), \
+                {"hsv_range_lower": lower.tolist(), "hsv_range_upper": upper.tolist()}
+        if method == METHOD_NDVI and self.color:
+            threshold = NDVI_BASE_THRESHOLD / threshold_factor
+            first = np.searchsorted(self._ndvi_sorted, np.float32(threshold), side="right")
+            return int(self._ndvi_suffix[first]), {"mean_ndvi": self.mean_ndvi, "ndvi_threshold": float(threshold)}
+        if method not in METHODS:
+            raise ValueError(f"Unknown green cover method {method!r}; expected one of {METHODS}")
+        threshold = self.mean_green / threshold_factor
+        green = self._count_at_least(threshold, inclusive=method != METHOD_NDVI)
+        details = {"mean_green_value": self.mean_green, "threshold_used": float(threshold)} \
+            if method == METHOD_GREEN_CHANNEL else {"mean_ndvi": None, "ndvi_threshold": None}
+        return green, details
+
+
+def _iter_blocks(source: ImageSource, block_rows: int) -> Iterator[Tuple[int, np.ndarray]]:
+    """Row blocks of a source: RGB, or the single grey band of a grayscale source"""
+    for y0, block in source.iter_blocks(block_rows):
+        yield y0, block if not source.grayscale else block[:, :, 0]
+
+
+def stream_green_cover(source: ImageSource, method: str, threshold_factor: float,
+                       mask_path: Optional[str] = None, statistics: Optional[CoverStatistics] = None,
+                       block_rows: int = DEFAULT_BLOCK_ROWS, with_mask: bool = True,
+                       packed: bool = False) -> VegetationResult:
+    """
+    Two-pass green cover for rasters that do not fit in memory.
+
+    Pass one accumulates CoverStatistics over row blocks (skipped when
+    ``statistics`` is given), which already yields the exact percentages
+    and the global mean the threshold methods need. Pass two classifies
+    block by block into a uint8 mask, or a 1-bit PackedMask when
+    ``packed``, memory-mapped at ``mask_path`` (an .npy file) when given.
+    Peak memory is one block plus the tables. Results are identical to
+    classify_vegetation on the whole image.
+    """
+    statistics = statistics or CoverStatistics.from_source(source, block_rows)
+    green_pixels, details = statistics.cover(method, threshold_factor)
+    mask = None
+    if with_mask:
+        shape = (source.height, source.width)
+        if packed:
+            mask = PackedMask.empty(shape, mask_path)
+        else:
+            mask = np.lib.format.open_memmap(mask_path, mode="w+", dtype=np.uint8, shape=shape) \
+                if mask_path else np.empty(shape, dtype=np.uint8)
+        lut, index_fn = compile_classifier(method, threshold_factor, not source.grayscale,
+                                           mean_green=statistics.mean_green)
+        for y0, block in _iter_blocks(source, block_rows):
+            rows = apply_lut(block, lut, index_fn)
+            if packed:
+                mask.write_rows(y0, rows)
+            else:
+                mask[y0:y0 + block.shape[0]] = rows
+        if mask_path:
+            mask.flush()
+    return VegetationResult(mask=mask, green_pixels=green_pixels, total_pixels=statistics.total_pixels,
+                            details=details)
+
+
+def _strata(height: int, width: int, per_side: int) -> list:
+    """(y0, y1, x0, x1) cells of a per_side x per_side grid, empty cells dropped"""
+    ys = np.linspace(0, height, min(per_side, height) + 1).astype(int)
+    xs = np.linspace(0, width, min(per_side, width) + 1).astype(int)
+    return [(ys[i], ys[i + 1], xs[j], xs[j + 1]) for i in range(len(ys) - 1) for j in range(len(xs) - 1)]
+
+
+def iter_cover_estimates(image: Union[np.ndarray, ImageSource], method: str, threshold_factor: float,
+                         error_bound: float = 1.0, confidence: float = 0.95,
+                         strata: int = DEFAULT_STRATA, round_samples: int = DEFAULT_ROUND_SAMPLES,
+                         max_samples: int = DEFAULT_MAX_SAMPLES, seed: Optional[int] = 0) -> Iterator[CoverEstimate]:
+    """
+    Successively refined green cover estimates from a stratified random sample.
+
+    The image is split into a grid of strata and every round draws pixels
+    from each stratum in proportion to its area, so an estimate never
+    hinges on one corner of the survey. Yields an estimate after every
+    round and stops once the confidence interval is within ``error_bound``
+    percentage points, or after ``max_samples`` pixels. The mean-threshold
+    methods use the sample's mean green value as the global mean.
+    """
+    if method not in METHODS:
+        raise ValueError(f"Unknown green cover method {method!r}; expected one of {METHODS}")
+    source = ArraySource(image) if isinstance(image, np.ndarray) else image
+    color = not source.grayscale
+    total = source.width * source.height
+    cells = _strata(source.height, source.width, strata)
+    weights = np.array([(y1 - y0) * (x1 - x0) for y0, y1, x0, x1 in cells], dtype=np.float64) / total
+    draws = np.maximum(1, np.round(weights * round_samples)).astype(int)
+    z = NormalDist().inv_cdf((1 + confidence) / 2)
+    rng = np.random.default_rng(seed)
+
+    by_mean = method == METHOD_GREEN_CHANNEL or (method == METHOD_NDVI and not color)
+    if by_mean:
+        # Per-stratum green histograms, re-thresholded as the sample mean settles
+        histograms = np.zeros((len(cells), 256), dtype=np.int64)
+    else:
+        lut, index_fn = compile_classifier(method, threshold_factor, color)
+        hits = np.zeros(len(cells), dtype=np.int64)
+    counts = np.zeros(len(cells), dtype=np.int64)
+
+    while True:
+        ys = np.concatenate([rng.integers(y0, y1, n) for (y0, y1, _, _), n in zip(cells, draws)])
+        xs = np.concatenate([rng.integers(x0, x1, n) for (_, _, x0, x1), n in zip(cells, draws)])
+        stratum = np.repeat(np.arange(len(cells)), draws)
+        pixels = source.sample_pixels(ys, xs)[:, None]
+        pixels = pixels if color else pixels[:, :, 0]
+        counts += draws
+
+        if by_mean:
+            np.add.at(histograms, (stratum, pixels[:, 0, 1] if color else pixels[:, 0]), 1)
+            mean = float(weights @ (histograms @ np.arange(256) / counts))
+            lut, _ = compile_classifier(method, threshold_factor, color, mean_green=mean)
+            green = histograms @ lut.astype(np.int64)
+        else:
+            hits += np.bincount(stratum, weights=apply_lut(pixels, lut, index_fn)[:, 0], minlength=len(cells)).astype(np.int64)
+            green = hits
+
+        proportions = green / counts
+        # Shrunk proportions keep the variance of all-green / all-idle strata above zero
+        shrunk = (green + 0.5) / (counts + 1)
+        margin = z * math.sqrt(float(weights ** 2 @ (shrunk * (1 - shrunk) / counts))) * 100
+        samples = int(counts.sum())
+        yield CoverEstimate(green_percentage=float(weights @ proportions) * 100, margin=margin,
+                            confidence=confidence, samples=samples, total_pixels=total)
+        if margin <= error_bound or samples >= min(max_samples, total):
+            return
+
+
+def estimate_green_cover(image: Union[np.ndarray, ImageSource], method: str, threshold_factor: float,
+                         error_bound: float = 1.0, confidence: float = 0.95, **kwargs) -> CoverEstimate:
+    """The final estimate of iter_cover_estimates"""
+    estimate = None
+    for estimate in iter_cover_estimates(image, method, threshold_factor, error_bound, confidence, **kwargs):
+        pass
+    return estimate
+
+
+_statistics: "OrderedDict[str, CoverStatistics]" = OrderedDict()
+_statistics_lock = threading.Lock()
+
+
+def get_cover_statistics(key: str, image: Union[np.ndarray, ImageSource, None] = None) -> Optional[CoverStatistics]:
+    """
+    Cover statistics for an image, built once per ``key`` (the upload's
+    content hash) and kept in a small process-wide LRU. Returns None when
+    nothing is cached and no image is given.
+    """
+    with _statistics_lock:
+        statistics = _statistics.get(key)
+        if statistics is not None:
+            _statistics.move_to_end(key)
+            return statistics
+    if image is None:
+        return None
+    statistics = CoverStatistics.from_source(image) if isinstance(image, ImageSource) else CoverStatistics(image)
+    with _statistics_lock:
+        _statistics[key] = statistics
+        while len(_statistics) > MAX_CACHED_STATISTICS:
+            _statistics.popitem(last=False)
+    return statistics
+
+
+_masks: "OrderedDict[str, PackedMask]" = OrderedDict()
+_masks_lock = threading.Lock()
+
+
+def get_vegetation_mask(image_key: str, source: ImageSource, method: str, threshold_factor: float,
+                        statistics: Optional[CoverStatistics] = None, mask_path: Optional[str] = None) -> PackedMask:
+    """
+    Full-resolution mask for one image, method and sensitivity, classified
+    once (by stream_green_cover) and shared by every analysis of it. Kept
+    bit-packed, so the cache holds 1 bit per pixel.
+    """
+    key = f"{image_key}:{method}:{threshold_factor:.2f}"
+    with _masks_lock:
+        mask = _masks.get(key)
+        if mask is not None:
+            _masks.move_to_end(key)
+            return mask
+    mask = stream_green_cover(source, method, threshold_factor, mask_path=mask_path, statistics=statistics,
+                              packed=True).mask
+    with _masks_lock:
+        _masks[key] = mask
+        while len(_masks) > MAX_CACHED_MASKS:
+            _masks.popitem(last=False)
+    return mask
@@ -112,11 +112,44 @@
 #             st.subheader("Monitoring Image (Time B)")
 #             st.image(img_after_with_boxes, use_column_width=True, channels="BGR")
 
+import datetime
+
 import streamlit as st
 from PIL import Image
 import numpy as np
+import pandas as pd
 import cv2
-from ultralytics import YOLO
+
+from detection_services import (
+    MATCH_DISTANCE,
+    MATCH_IOU,
+    DetectorUnavailableError,
+    InferenceBusyError,
+    SiteHistory,
+    TreeMatches,
+    detect_epochs,
+    detect_image,
+    draw_detections,
+    get_detector,
+    get_inference_service,
+    list_sites,
+    match_trees,
+    summarize_epochs,
+)
+from imaging_services import (
+    ArraySource,
+    ChangeMap,
+    Registration,
+    change_map,
+    content_hash,
+    downscale,
+    get_vegetation_mask,
+    ingest_source,
+    register_images,
+    show_image,
+)
+from imaging_services.change_map import CATEGORY_NAMES
+from imaging_services.vegetation import METHOD_HSV, METHODS
 
 # Custom CSS for modern UI
 def load_css():
@@ -275,12 +308,6 @@ def load_css():
     </style>
     """, unsafe_allow_html=True)
 
-# Load and cache the model
-@st.cache_resource
-def load_model():
-    """Loads the YOLOv8 model from the specified path."""
-    return YOLO("models/best.pt")
-
 def show_results(count_before, count_after):
     """Display results in beautiful cards"""
     col1, col2, col3 = st.columns(3)
@@ -317,6 +344,142 @@ def show_results(count_before, count_after):
     
     return tree_loss, percent_loss
 
+# Page modes: a one-off before/after comparison, or a stored site time series
+COMPARE_MODE = "📷 Compare Two Images"
+HISTORY_MODE = "🗂️ Site History"
+# Site epochs are detected tile by tile once they are too large for one model input
+SITE_TILE_SIZE = 640
+
+# Tree matching gates offered on the page
+MATCH_GATES = {"Crown overlap (IoU)": MATCH_IOU, "Centroid distance": MATCH_DISTANCE}
+# Box colours (RGB) per tree status on the visual proof
+PERSISTING_COLOR = (0, 255, 0)
+LOST_COLOR = (220, 38, 38)
+NEW_COLOR = (59, 130, 246)
+
+def canopy_change_map(before_img_np, after_img_np, before_key, after_key, method, threshold_factor,
+                      registration: Registration) -> ChangeMap:
+    """Difference the (cached) vegetation masks of Time A and the registered Time B"""
+    before_source, after_source = ArraySource(before_img_np), ArraySource(after_img_np)
+    before_mask = get_vegetation_mask(before_key, before_source, method, threshold_factor)
+    after_mask = get_vegetation_mask(after_key, after_source, method, threshold_factor)
+    return change_map(before_mask, after_mask, registration)
+
+def draw_tree_changes(image, boxes, scores, status, changed_color, changed_label):
+    """Persisting trees in green, lost (or new) trees in ``changed_color``"""
+    persisting = status == "persisting"
+    annotated = draw_detections(image, boxes[persisting], scores[persisting], color=PERSISTING_COLOR)
+    return draw_detections(annotated, boxes[~persisting], scores[~persisting], color=changed_color,
+                           label=changed_label)
+
+def show_tree_changes(matches: TreeMatches, scores_before, scores_after):
+    """Per-tree change metrics and the table of lost and new trees"""
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Persisting Trees", f"{matches.persisting_count}")
+    col2.metric("Lost Trees", f"{matches.lost_count}")
+    col3.metric("New Trees", f"{matches.new_count}")
+    col4.metric("Lost Crown Area", f"{matches.lost_area:,.0f} px²")
+
+    rows = []
+    for status, indices, boxes, scores in (("Lost", matches.lost, matches.boxes_before, scores_before),
+                                           ("New", matches.new, matches.boxes_after, scores_after)):
+        for i in indices:
+            x1, y1, x2, y2 = boxes[i]
+            rows.append({"Status": status, "Tree": int(i), "Centre X": round((x1 + x2) / 2, 1),
+                         "Centre Y": round((y1 + y2) / 2, 1), "Crown Area (px²)": round((x2 - x1) * (y2 - y1), 1),
+                         "Confidence": round(float(scores[i]), 3)})
+    if rows:
+        st.caption("Positions are in Time A pixel coordinates")
+        st.dataframe(pd.DataFrame(rows), use_container_width=True, hide_index=True)
+
+def show_change_map(change: ChangeMap):
+    """Gain / loss metrics, the colour-coded map and the area table"""
+    registration = change.registration
+    overlap = max(change.overlap_pixels, 1)
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Canopy Cover (Time A → B)", f"{change.after_cover:.2f}%",
+                f"{change.after_cover - change.before_cover:+.2f}%")
+    col2.metric("Canopy Loss", f"{change.loss_pixels / overlap * 100:.2f}%", f"{change.loss_pixels:,} px",
+                delta_color="off")
+    col3.metric("Canopy Gain", f"{change.gain_pixels / overlap * 100:.2f}%", f"{change.gain_pixels:,} px",
+                delta_color="off")
+
+    show_image(change.to_image(), caption="Red: loss · Blue: gain · Green: stable canopy · Grey: stable bare")
+    st.dataframe(pd.DataFrame({
+        "Layer": CATEGORY_NAMES,
+        "Pixels": change.counts,
+        "Share of Overlap (%)": [0.0, *(change.counts[1:] / overlap * 100).round(2)],
+    }), use_container_width=True, hide_index=True)
+    dx, dy = registration.shift
+    st.caption(f"Registration: {registration.method}, shift ({dx:+.1f}, {dy:+.1f}) px, "
+               f"rotation {registration.rotation_deg:+.2f}°, scale {registration.scale:.4f}")
+
+def show_site_history():
+    """Add one epoch at a time to a stored site and show its time series"""
+    sites = list_sites()
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        site_name = st.text_input("Site Name", value=sites[0] if sites else "",
+                                  help=f"Stored sites: {', '.join(sites)}" if sites else "Name a new site to start its history")
+    # The classifier is fixed when a site is created, so every epoch's cover is comparable
+    with col2:
+        method = st.selectbox("Vegetation Classifier", METHODS, index=METHODS.index(METHOD_HSV), key="site_method")
+    with col3:
+        threshold_factor = st.slider("Green Sensitivity", min_value=0.5, max_value=2.5, value=1.5, step=0.1,
+                                     key="site_threshold")
+    if not site_name.strip():
+        st.info("Enter a site name to open or start its history.")
+        return
+    try:
+        history = SiteHistory.open(site_name, method, threshold_factor)
+    except ValueError as e:
+        st.error(f"❌ {e}")
+        return
+    if history.epochs:
+        st.caption(f"{len(history.epochs)} epochs stored · classifier: {history.method} "
+                   f"(sensitivity {history.threshold_factor:.1f})")
+
+    upload = st.file_uploader("Upload the next epoch image", type=['png', 'jpg', 'jpeg', 'tif', 'tiff'],
+                              key="site_epoch")
+    label = st.text_input("Epoch Label", value=datetime.date.today().isoformat())
+    if st.button("➕ Add Epoch to Site History", use_container_width=True) and upload is not None:
+        source, upload_key, _ = ingest_source(upload)
+        existing = history.find(upload_key)
+        if existing is not None:
+            st.info(f"This image is already stored as epoch {existing.label}.")
+        else:
+            try:
+                get_detector()
+            except DetectorUnavailableError as e:
+                st.error(f"❌ Tree detector not available: {e}")
+                return
+            # Only the new image is processed; the previous epoch is read back from disk
+            with st.spinner("🔍 Detecting trees and comparing with the stored history..."):
+                try:
+                    # Windows are read from the source, so a large orthomosaic is never decoded whole
+                    tile_size = SITE_TILE_SIZE if max(source.size) > 2 * SITE_TILE_SIZE else None
+                    detections = detect_image(source, get_inference_service().as_batch_predictor(),
+                                              tile_size=tile_size)
+                except InferenceBusyError as e:
+                    st.warning(f"⏳ {e}")
+                    return
+                mask = get_vegetation_mask(upload_key, source, history.method, history.threshold_factor)
+                record = history.add_epoch(label, upload_key, source, detections, mask)
+            st.success(f"✅ Epoch {record.label} added: {record.trees} trees, "
+                       f"{record.lost} lost and {record.new} new since the previous epoch.")
+
+    if not history.epochs:
+        return
+    st.markdown("---")
+    st.markdown('<div class="section-title">🗓️ Site Time Series</div>', unsafe_allow_html=True)
+    series = pd.DataFrame(history.time_series()).set_index("Epoch")
+    chart_col1, chart_col2 = st.columns(2)
+    with chart_col1:
+        st.line_chart(series["Trees"])
+    with chart_col2:
+        st.line_chart(series["Green Cover (%)"])
+    st.dataframe(series, use_container_width=True)
+
 def show():
     """Main function to display the Change Detection page."""
     
@@ -331,6 +494,11 @@ def show():
         </div>
     """, unsafe_allow_html=True)
     
+    mode = st.radio("Mode", [COMPARE_MODE, HISTORY_MODE], horizontal=True, label_visibility="collapsed")
+    if mode == HISTORY_MODE:
+        show_site_history()
+        return
+    
     # Upload section with two columns
     col1, col2 = st.columns(2)
     
@@ -354,6 +522,33 @@ def show():
         """, unsafe_allow_html=True)
         after_image = st.file_uploader("Upload Monitoring Image (Time B)", type=['png', 'jpg', 'jpeg'], key="after")
     
+    # Further dates of the same site are detected in the same batched run
+    with st.expander("🗓️ Multi-Epoch Comparison (optional)"):
+        extra_images = st.file_uploader(
+            "Upload later monitoring images (Time C, D, ...) in date order",
+            type=['png', 'jpg', 'jpeg'],
+            accept_multiple_files=True,
+            key="extra_epochs"
+        )
+        batch_size = st.slider("Epochs per batch", min_value=1, max_value=16, value=8)
+
+    # Per-tree matching between the two co-registered detection sets
+    with st.expander("🌲 Tree Matching"):
+        match_gate = st.selectbox("Match Trees By", list(MATCH_GATES))
+        match_iou = st.slider("Minimum Crown Overlap (IoU)", min_value=0.05, max_value=0.9, value=0.3, step=0.05,
+                              disabled=MATCH_GATES[match_gate] != MATCH_IOU)
+
+    # Pixel-level canopy change between the two co-registered images
+    with st.expander("🗺️ Canopy Change Map"):
+        map_changes = st.checkbox("Map canopy gain and loss", value=True)
+        col_method, col_threshold = st.columns(2)
+        with col_method:
+            change_method = st.selectbox("Vegetation Classifier", METHODS, index=METHODS.index(METHOD_HSV),
+                                         key="change_method")
+        with col_threshold:
+            change_threshold = st.slider("Green Sensitivity", min_value=0.5, max_value=2.5, value=1.5, step=0.1,
+                                         key="change_threshold")
+
     st.markdown("---")
     
     # Analyze button centered
@@ -361,31 +556,47 @@ def show():
     with col_btn[1]:
         analyze_button = st.button("🚀 Analyze & Compare Images", use_container_width=True)
     
-    # Load model
-    model = load_model()
-    
     # Analysis logic
     if analyze_button and before_image is not None and after_image is not None:
         
         # Open images and convert
-        before_img_pil = Image.open(before_image)
-        after_img_pil = Image.open(after_image)
-        
-        if before_img_pil.mode != 'RGB':
-            before_img_pil = before_img_pil.convert('RGB')
-        if after_img_pil.mode != 'RGB':
-            after_img_pil = after_img_pil.convert('RGB')
-        
-        before_img_np = np.array(before_img_pil)
-        after_img_np = np.array(after_img_pil)
+        uploads = [before_image, after_image] + list(extra_images or [])
+        epoch_images = []
+        for upload in uploads:
+            img_pil = Image.open(upload)
+            if img_pil.mode != 'RGB':
+                img_pil = img_pil.convert('RGB')
+            epoch_images.append(np.array(img_pil))
+        
+        before_img_np, after_img_np = epoch_images[0], epoch_images[1]
+
+        # Fail early if the shared detector cannot be loaded (it is warmed up at startup)
+        try:
+            get_detector()
+        except DetectorUnavailableError as e:
+            st.error(f"❌ Tree detector not available: {e}")
+            return
         
         # Analysis with progress
         with st.spinner("🔍 Analyzing images... This may take a moment."):
-            results_before = model(before_img_np, verbose=False)
-            count_before = len(results_before[0].boxes)
+            # All epochs go through the shared inference pool as batches, not one forward pass per image
+            try:
+                epoch_detections = detect_epochs(get_inference_service(), epoch_images, batch_size=batch_size)
+            except InferenceBusyError as e:
+                st.warning(f"⏳ {e}")
+                return
             
-            results_after = model(after_img_np, verbose=False)
-            count_after = len(results_after[0].boxes)
+            boxes_before, scores_before = epoch_detections[0]
+            count_before = len(boxes_before)
+            
+            boxes_after, scores_after = epoch_detections[1]
+            count_after = len(boxes_after)
+        
+        # Time B is registered onto Time A once, for tree matching and the change map
+        with st.spinner("🛰️ Registering images and matching trees..."):
+            registration = register_images(before_img_np, after_img_np)
+            matches = match_trees(boxes_before, boxes_after, registration.matrix,
+                                  metric=MATCH_GATES[match_gate], iou_threshold=match_iou)
         
         st.success("✅ Analysis complete!")
         st.markdown("---")
@@ -416,21 +627,33 @@ def show():
         
         st.markdown("---")
         
+        # Tree-level changes
+        st.markdown('<div class="section-title">🌲 Tree-Level Changes</div>', unsafe_allow_html=True)
+        show_tree_changes(matches, scores_before, scores_after)
+        
+        st.markdown("---")
+        
         # Visual proof section
         st.markdown('<div class="section-title">🖼️ Visual Proof</div>', unsafe_allow_html=True)
         
-        img_before_with_boxes = results_before[0].plot()
-        img_after_with_boxes = results_after[0].plot()
+        # Draw on display-sized copies; detection above ran at full resolution
+        before_preview, before_scale = downscale(before_img_np, 1280)
+        after_preview, after_scale = downscale(after_img_np, 1280)
+        img_before_with_boxes = draw_tree_changes(before_preview, boxes_before * before_scale, scores_before,
+                                                  matches.before_status(), LOST_COLOR, "Lost")
+        img_after_with_boxes = draw_tree_changes(after_preview, boxes_after * after_scale, scores_after,
+                                                 matches.after_status(), NEW_COLOR, "New")
         
+        st.caption("Green: persisting · Red: lost · Blue: new")
         proof_col1, proof_col2 = st.columns(2)
         
         with proof_col1:
             st.markdown('<div class="gallery-label">Baseline Image (Time A)</div>', unsafe_allow_html=True)
-            st.image(img_before_with_boxes, use_column_width=True, channels="BGR")
+            show_image(img_before_with_boxes)
         
         with proof_col2:
             st.markdown('<div class="gallery-label">Monitoring Image (Time B)</div>', unsafe_allow_html=True)
-            st.image(img_after_with_boxes, use_column_width=True, channels="BGR")
+            show_image(img_after_with_boxes)
         
         # Summary section
         st.markdown("---")
@@ -444,6 +667,26 @@ def show():
         with summary_col3:
             status = "⚠️ ALERT" if percent_loss > 10.0 else "✔️ NORMAL"
             st.metric("Status", status)
-    
+        
+        # Canopy change map
+        if map_changes:
+            st.markdown("---")
+            st.markdown('<div class="section-title">🗺️ Canopy Change Map</div>', unsafe_allow_html=True)
+            with st.spinner("🗺️ Mapping canopy change..."):
+                change = canopy_change_map(before_img_np, after_img_np,
+                                           content_hash(before_image.getvalue()), content_hash(after_image.getvalue()),
+                                           change_method, change_threshold, registration)
+            show_change_map(change)
+        
+        # Multi-epoch trend
+        if len(epoch_images) > 2:
+            st.markdown("---")
+            st.markdown('<div class="section-title">🗓️ Multi-Epoch Trend</div>', unsafe_allow_html=True)
+            
+            labels = [f"Time {chr(ord('A') + i)}" if i < 26 else f"Time {i + 1}" for i in range(len(epoch_images))]
+            trend = pd.DataFrame(summarize_epochs(epoch_detections, labels))
+            st.line_chart(trend.set_index("Epoch")["Trees"])
+            st.dataframe(trend, use_container_width=True, hide_index=True)
+
     elif analyze_button:
         st.error("❌ Please upload both images before analyzing.")
\ No newline at end of file
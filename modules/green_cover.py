@@ -1,59 +1,115 @@
 import streamlit as st
 import numpy as np
 from PIL import Image, ImageDraw
-import cv2
 import requests
 import io
-from typing import Tuple
 import base64
 
+from detection_services import (
+    canopy_area_by_region,
+    canopy_union_area,
+    DetectorUnavailableError,
+    draw_detections,
+    InferenceBusyError,
+    get_detection_cache,
+    get_detector,
+    get_inference_service,
+    detect_image,
+)
+from detection_services.backends import DEFAULT_CONFIDENCE, DEFAULT_IOU
+from imaging_services import TiffSource, ingest_source, show_image
+from imaging_services.cover_index import CoverIndex, get_cover_index
+from imaging_services.image_source import spill_file
+from imaging_services.ndvi import (
+    DEFAULT_NDVI_THRESHOLD,
+    DEFAULT_NIR_BAND,
+    DEFAULT_RED_BAND,
+    get_ndvi_statistics,
+)
+from imaging_services.packed_mask import PackedMask
+from imaging_services.patches import patch_statistics
+from imaging_services.regions import (
+    count_regions,
+    get_region_labels,
+    load_regions,
+    regions_key,
+)
+from imaging_services.vegetation import (
+    METHOD_GREEN_CHANNEL,
+    METHOD_HSV,
+    METHOD_NDVI,
+    METHODS,
+    get_cover_statistics,
+    get_vegetation_mask,
+    iter_cover_estimates,
+    render_mask,
+)
+
+# Longest side of the vegetation mask shown on the page
+MASK_DISPLAY_MAX_SIDE = 2048
+
 def show_tree_count_page():
     """Tree detection, counting, and tree cover estimation page"""
     st.title("🌳 Tree Count & Cover Estimator")
-    uploaded_file = st.file_uploader("Upload an image", type=["jpg", "jpeg", "png"])
+    uploaded_file = st.file_uploader("Upload an image", type=["jpg", "jpeg", "png", "tif", "tiff"])
     
     if not uploaded_file:
         st.info("Please upload an image to detect trees.")
         return
 
-    image = Image.open(uploaded_file)
-    st.image(image, caption="Uploaded Image", use_container_width=True)
+    # Large TIFFs are read window by window; display uses a cached, display-sized preview pyramid
+    image, upload_key, pyramid = ingest_source(uploaded_file)
+    show_image(image, caption="Uploaded Image", cache_key=upload_key)
 
-    @st.cache_resource
-    def load_model():
-        if YOLO is not None:
-            return YOLO("models/best.pt")  # Path to your trained YOLO model
-        else:
-            st.error("YOLO model not available. Please check your installation.")
-            return None
+    # Large orthomosaics lose almost every crown when squeezed into the model input size
+    with st.expander("🧩 Tiled Inference (large images)", expanded=max(image.size) > 2 * 640):
+        use_tiling = st.checkbox("Enable tiled inference", value=max(image.size) > 2 * 640)
+        tile_size = st.select_slider("Tile Size (px)", options=[320, 480, 640, 800, 960, 1280], value=640)
+        overlap = st.slider("Tile Overlap", min_value=0.0, max_value=0.5, value=0.2, step=0.05)
+        batch_size = st.slider("Batch Size", min_value=1, max_value=32, value=8)
 
-    model = load_model()
+    with st.expander("🎚️ Detection Thresholds"):
+        conf = st.slider("Confidence Threshold", min_value=0.05, max_value=0.95, value=DEFAULT_CONFIDENCE, step=0.05)
+        iou = st.slider("NMS IoU Threshold", min_value=0.1, max_value=0.95, value=DEFAULT_IOU, step=0.05)
+
+    try:
+        model = get_detector()
+    except DetectorUnavailableError as e:
+        st.error(f"Tree detector not available: {e}")
+        model = None
     if model is not None:
-        with st.spinner("Detecting trees..."):
-            results = model(np.array(image))
+        # Forward passes go through the shared, bounded worker pool rather than this session's thread
+        service = get_inference_service()
+        predict_batch = service.as_batch_predictor(conf=conf, iou=iou)
+
+        def run_detection():
+            with st.spinner("Detecting trees..."):
+                return detect_image(image, predict_batch, tile_size=tile_size if use_tiling else None,
+                                    overlap=overlap, batch_size=batch_size)
 
-        # Extract boxes and confidence
-        boxes = results[0].boxes.xyxy.cpu().numpy() if results[0].boxes is not None else []
-        confidences = results[0].boxes.conf.cpu().numpy() if results[0].boxes is not None else []
+        # Reruns and repeat uploads of the same image are served from the shared result cache
+        cache = get_detection_cache()
+        cache_key = cache.make_key(upload_key, model.model_id, conf=conf, iou=iou,
+                                   tiling=(tile_size, overlap) if use_tiling else None)
+        try:
+            boxes, confidences = cache.get_or_compute(cache_key, run_detection)
+        except InferenceBusyError as e:
+            st.warning(f"⏳ {e}")
+            return
 
-        img_np = np.array(image)
-        total_area = img_np.shape[0] * img_np.shape[1]  # total pixels
-        total_tree_area = 0
+        img_width, img_height = image.size
+        total_area = img_height * img_width  # total pixels
+        pixel_boxes = np.asarray(boxes).astype(int)
 
-        for i, box in enumerate(boxes):
-            x1, y1, x2, y2 = box.astype(int)
-            # Draw rectangle and label
-            cv2.rectangle(img_np, (x1, y1), (x2, y2), (0, 255, 0), 2)
-            cv2.putText(img_np, f"Tree {confidences[i]:.2f}", (x1, y1 - 5),
-                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 1)
-            # Add to total area
-            total_tree_area += (x2 - x1) * (y2 - y1)
+        # Union of crown boxes, so overlapping crowns are only counted once
+        total_tree_area = canopy_union_area(pixel_boxes, img_width, img_height)
 
         # ✅ Calculate Tree Cover Percentage
         tree_cover_percent = (total_tree_area / total_area) * 100 if total_area > 0 else 0
 
-        # Display results
-        st.image(img_np, caption="Detected Trees", use_container_width=True)
+        # Display results (boxes drawn on the display-sized level, not a full-resolution copy)
+        preview, scale = pyramid.preview()
+        show_image(draw_detections(preview, pixel_boxes * scale, confidences), caption="Detected Trees")
         st.success(f"🌲 Number of trees detected: **{len(boxes)}**")
         st.metric("🟩 Tree Cover Percentage", f"{tree_cover_percent:.2f}%")
 
@@ -72,8 +128,25 @@ def show_tree_count_page():
                 "Total Tree Area (px²)": int(total_tree_area),
                 "Tree Cover (%)": round(tree_cover_percent, 2),
                 "Detected Trees": len(boxes),
-                "Model Used": "YOLO (ultralytics)"
+                "Model Used": f"YOLO ({model.name})"
             })
+
+            # Per-region canopy cover
+            grid_size = st.slider("Region Grid (cells per side)", min_value=1, max_value=10, value=3)
+            region_area = canopy_area_by_region(pixel_boxes, img_width, img_height, grid=(grid_size, grid_size))
+            region_cover = (region_area / ((img_width / grid_size) * (img_height / grid_size)) * 100).round(2)
+            st.dataframe(
+                {f"Col {c + 1}": region_cover[:, c] for c in range(grid_size)},
+                use_container_width=True
+            )
+            st.caption("Tree cover (%) per region, rows top to bottom")
+        cache_stats = cache.stats()
+        st.caption(f"🗄️ Detection cache: {cache_stats['hits']} hits · {cache_stats['misses']} misses · "
+                   f"{cache_stats['entries']}/{cache_stats['max_entries']} entries")
+        queue_stats = service.stats()
+        st.caption(f"🚦 Inference queue: {queue_stats['queue_depth']}/{queue_stats['max_queue']} waiting · "
+                   f"p99 wait {queue_stats['wait_ms_p99']:.0f} ms · "
+                   f"{queue_stats['mean_batch_images']} images per batch")
     else:
         st.error("Tree detection is not available due to missing dependencies.")
 
@@ -86,7 +159,7 @@ def show_upload_method():
     
     uploaded_file = st.file_uploader(
         "Choose an image file",
-        type=['png', 'jpg', 'jpeg'],
+        type=['png', 'jpg', 'jpeg', 'tif', 'tiff'],
         help="Upload satellite imagery or aerial photos"
     )
     
@@ -113,46 +186,174 @@ def show_upload_method():
         
         # Show analysis stats
         show_stats = st.checkbox("Show Detailed Statistics", value=True)
+        
+        # Sampled estimate shown while the exact pass runs
+        quick_estimate = st.checkbox("Quick estimate first", value=True,
+                                     help="Estimate cover from a random pixel sample before the exact analysis")
+        error_bound = st.slider("Estimate Error Bound (± %)", min_value=0.1, max_value=5.0, value=1.0, step=0.1,
+                                disabled=not quick_estimate)
     
     with col2:
         if uploaded_file is not None:
-            # Display original image
-            image = Image.open(uploaded_file)
+            # Display original image (large TIFFs are read block by block, never decoded whole)
+            image, upload_key, _ = ingest_source(uploaded_file)
             st.markdown("### Original Image")
-            st.image(image, caption="Original Image", use_container_width=True)
+            show_image(image, caption="Original Image", cache_key=upload_key)
+            
+            # Drone rasters with a NIR band get true NDVI instead of the RGB simulation (alpha is not a band)
+            if len(image.spectral_bands) >= 4:
+                show_multispectral_ndvi(image, upload_key)
             
             if st.button("🔍 Analyze Green Cover", type="primary"):
-                with st.spinner("Analyzing vegetation coverage..."):
-                    # Analyze green cover
-                    processed_image, green_percentage, idle_percentage, stats = analyze_green_cover(
-                        image, green_threshold, method
-                    )
-                    
-                    # Display results
-                    st.success(f"✅ Analysis Complete!")
-                    
-                    # Show processed image
-                    st.markdown("### Analysis Results")
-                    col1, col2 = st.columns(2)
+                st.session_state["green_cover_analyzed"] = upload_key
+            
+            # After the first analysis, slider and method changes are answered from cached
+            # histograms of this image instead of reclassifying every pixel
+            if st.session_state.get("green_cover_analyzed") == upload_key:
+                cover_statistics = get_cover_statistics(upload_key)
+                if cover_statistics is None:
+                    estimate_placeholder = st.empty()
+                    if quick_estimate:
+                        for estimate in iter_cover_estimates(image, method, green_threshold, error_bound):
+                            estimate_placeholder.info(
+                                f"≈ {estimate.green_percentage:.1f}% ± {estimate.margin:.1f}% green "
+                                f"({estimate.confidence:.0%} confidence, {estimate.samples:,} pixels sampled)")
+                    with st.spinner("Analyzing vegetation coverage..."):
+                        cover_statistics = get_cover_statistics(upload_key, image)
+                    estimate_placeholder.empty()
+                green_pixels, details = cover_statistics.cover(method, green_threshold)
+                stats = cover_stats(method, cover_statistics.total_pixels, green_pixels, details)
+                green_percentage = green_pixels / stats["total_pixels"] * 100
+                idle_percentage = stats["idle_pixels"] / stats["total_pixels"] * 100
+                
+                # Display results
+                st.success(f"✅ Analysis Complete!")
+                
+                # Show processed image
+                st.markdown("### Analysis Results")
+                col1, col2 = st.columns(2)
+                
+                with col1:
+                    # The full-resolution mask is only rendered on request
+                    if st.checkbox("Show vegetation mask", value=False):
+                        with st.spinner("Rendering vegetation mask..."):
+                            processed_image = vegetation_mask_preview(image, upload_key, method,
+                                                                      green_threshold, cover_statistics)
+                        show_image(processed_image, caption="Green Cover Analysis")
+                
+                with col2:
+                    # Metrics
+                    st.metric("Green Cover", f"{green_percentage:.2f}%", 
+                             delta=f"{green_percentage - 50:.1f}% vs average")
+                    st.metric("Idle/Non-Green Land", f"{idle_percentage:.2f}%")
+                    st.metric("Total Pixels Analyzed", f"{stats['total_pixels']:,}")
                     
-                    with col1:
-                        st.image(processed_image, caption="Green Cover Analysis", use_container_width=True)
+                    # Progress bars
+                    st.markdown("#### Coverage Breakdown")
+                    st.progress(green_percentage / 100, text=f"Green: {green_percentage:.1f}%")
+                    st.progress(idle_percentage / 100, text=f"Non-Green: {idle_percentage:.1f}%")
                     
-                    with col2:
-                        # Metrics
-                        st.metric("Green Cover", f"{green_percentage:.2f}%", 
-                                 delta=f"{green_percentage - 50:.1f}% vs average")
-                        st.metric("Idle/Non-Green Land", f"{idle_percentage:.2f}%")
-                        st.metric("Total Pixels Analyzed", f"{stats['total_pixels']:,}")
-                        
-                        # Progress bars
-                        st.markdown("#### Coverage Breakdown")
-                        st.progress(green_percentage / 100, text=f"Green: {green_percentage:.1f}%")
-                        st.progress(idle_percentage / 100, text=f"Non-Green: {idle_percentage:.1f}%")
-                        
-                        if show_stats:
-                            st.markdown("#### Detailed Statistics")
-                            st.json(stats)
+                    if show_stats:
+                        st.markdown("#### Detailed Statistics")
+                        st.json(stats)
+                
+                # Per-cell cover from a summed-area table over the mask: any grid size, no rescans
+                if st.checkbox("Show cover by region", value=False):
+                    grid_size = st.slider("Region Grid (cells per side)", min_value=1, max_value=20, value=4)
+                    with st.spinner("Indexing vegetation mask..."):
+                        cover_index = vegetation_cover_index(image, upload_key, method, green_threshold,
+                                                             cover_statistics)
+                    region_cover = cover_index.grid(grid_size, grid_size).round(2)
+                    st.dataframe(
+                        {f"Col {c + 1}": region_cover[:, c] for c in range(grid_size)},
+                        use_container_width=True
+                    )
+                    st.caption("Green cover (%) per region, rows top to bottom")
+                
+                # Canopy patches from the same mask: optional clean-up, then connected components
+                if st.checkbox("Show canopy patch analytics", value=False):
+                    patch_col1, patch_col2, patch_col3 = st.columns(3)
+                    with patch_col1:
+                        opening = st.slider("Remove Specks (radius px)", min_value=0, max_value=5, value=0)
+                    with patch_col2:
+                        closing = st.slider("Fill Gaps (radius px)", min_value=0, max_value=5, value=0)
+                    with patch_col3:
+                        min_patch = st.number_input("Minimum Patch (px)", min_value=1, value=10)
+                    with st.spinner("Finding canopy patches..."):
+                        mask = vegetation_mask(image, upload_key, method, green_threshold, cover_statistics)
+                        patches = patch_statistics(mask, opening=opening, closing=closing, min_size=int(min_patch))
+                    summary = patches.summary()
+                    metric_col1, metric_col2, metric_col3 = st.columns(3)
+                    metric_col1.metric("Canopy Patches", f"{patches.patch_count:,}")
+                    metric_col2.metric("Largest Patch", f"{patches.largest_patch:,} px",
+                                       delta=f"{summary['largest_patch_share']:.1f}% of canopy", delta_color="off")
+                    metric_col3.metric("Fragmentation Index", f"{patches.fragmentation_index:.3f}")
+                    st.dataframe(
+                        {"Patch Size": list(summary["size_distribution"]),
+                         "Patches": list(summary["size_distribution"].values())},
+                        use_container_width=True
+                    )
+                    if show_stats:
+                        st.json(summary)
+                
+                # Cover per parcel: polygons are rasterized once, then all counted in one pass
+                parcels_file = st.file_uploader("Parcel polygons (GeoJSON)", type=["geojson", "json"],
+                                                help="Polygons in pixel coordinates, or map coordinates for GeoTIFFs")
+                if parcels_file is not None:
+                    geo_transform = image.geo_transform if isinstance(image, TiffSource) else None
+                    georeferenced = geo_transform is not None and st.radio(
+                        "Polygon Coordinates", ["Map (GeoTIFF CRS)", "Pixel"], horizontal=True
+                    ) == "Map (GeoTIFF CRS)"
+                    try:
+                        regions = load_regions(parcels_file.getvalue(), geo_transform if georeferenced else None)
+                    except (ValueError, KeyError, TypeError) as e:
+                        st.error(f"Could not read the polygons: {e}")
+                        regions = []
+                    if regions:
+                        with st.spinner(f"Measuring cover in {len(regions)} parcels..."):
+                            covers = parcel_cover(image, upload_key, method, green_threshold,
+                                                  cover_statistics, regions)
+                        st.dataframe(region_cover_table(covers), use_container_width=True)
+                    else:
+                        st.warning("No polygons found in the uploaded file.")
+
+def show_multispectral_ndvi(source, upload_key: str):
+    """True NDVI section for multi-band uploads (only the red and NIR bands are read)"""
+    st.markdown("### Multispectral NDVI")
+    bands = source.spectral_bands
+    band_names = [f"Band {band + 1}" for band in range(source.bands)]
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        red_band = st.selectbox("Red Band", bands, index=min(DEFAULT_RED_BAND, len(bands) - 1),
+                                format_func=band_names.__getitem__)
+    with col2:
+        nir_band = st.selectbox("NIR Band", bands, index=min(DEFAULT_NIR_BAND, len(bands) - 1),
+                                format_func=band_names.__getitem__)
+    with col3:
+        ndvi_threshold = st.slider("NDVI Threshold", min_value=-1.0, max_value=1.0,
+                                   value=DEFAULT_NDVI_THRESHOLD, step=0.01)
+    if red_band == nir_band:
+        st.warning("Pick different bands for red and NIR.")
+        return
+    
+    with st.spinner("Computing NDVI..."):
+        ndvi = get_ndvi_statistics(upload_key, source, red_band, nir_band)
+    
+    # Cover at any threshold comes straight from the histogram
+    cover = ndvi.cover(ndvi_threshold)
+    metric_col1, metric_col2, metric_col3 = st.columns(3)
+    metric_col1.metric("Vegetation (NDVI)", f"{cover:.2f}%")
+    metric_col2.metric("Non-Vegetation", f"{100 - cover:.2f}%")
+    metric_col3.metric("Mean NDVI", f"{ndvi.mean_ndvi:.3f}")
+    
+    preview_col1, preview_col2 = st.columns(2)
+    with preview_col1:
+        show_image(ndvi.preview(), caption="NDVI (red = bare, green = dense vegetation)")
+    with preview_col2:
+        show_image(render_mask(ndvi.preview_mask(ndvi_threshold)), caption=f"NDVI ≥ {ndvi_threshold:.2f}")
+    
+    st.markdown("#### NDVI Histogram")
+    st.bar_chart({"NDVI": ndvi.bin_centres.round(2), "Pixels": ndvi.histogram}, x="NDVI", y="Pixels")
 
 def show_map_method():
     """Interactive map method (placeholder for Google Maps integration)"""
@@ -206,195 +407,83 @@ def show_coordinates_method():
     if st.button("🛰️ Download & Analyze", type="primary"):
         st.warning("This feature requires satellite imagery API access. Please use the Upload Image method for full functionality.")
 
-def analyze_green_cover(image: Image.Image, threshold_factor: float, method: str) -> Tuple[Image.Image, float, float, dict]:
+def spill_path(source, upload_key: str, method: str, threshold_factor: float, suffix: str):
     """
-    Analyze green cover in the uploaded image
+    On-disk location for full-resolution arrays of large TIFF uploads (None for in-memory images)
     """
-    
-    # Convert PIL image to numpy array
-    img_array = np.array(image)
-    original_shape = img_array.shape
-    
-    if method == "Green Channel Analysis":
-        processed_img, green_pct, idle_pct, stats = green_channel_analysis(img_array, threshold_factor)
-    elif method == "HSV Color Space":
-        processed_img, green_pct, idle_pct, stats = hsv_analysis(img_array, threshold_factor)
-    else:  # NDVI Simulation
-        processed_img, green_pct, idle_pct, stats = ndvi_simulation(img_array, threshold_factor)
-    
-    # Convert back to PIL Image
-    processed_image = Image.fromarray(processed_img)
-    
-    return processed_image, green_pct, idle_pct, stats
+    if not isinstance(source, TiffSource):
+        return None
+    return spill_file(f"{upload_key}.m{METHODS.index(method)}.f{threshold_factor:.2f}.{suffix}.npy")
 
-def green_channel_analysis(img_array: np.ndarray, threshold_factor: float) -> Tuple[np.ndarray, float, float, dict]:
+def vegetation_mask(source, upload_key: str, method: str, threshold_factor: float,
+                    cover_statistics) -> PackedMask:
     """
-    Analyze green cover using green channel analysis
+    Full-resolution 1-bit vegetation mask, classified block by block with the cached statistics
     """
-    height, width = img_array.shape[:2]
-    total_pixels = height * width
-    
-    # Extract green channel
-    if len(img_array.shape) == 3:
-        green_channel = img_array[:, :, 1].astype(np.float32)
-    else:
-        green_channel = img_array.astype(np.float32)
-    
-    # Calculate mean green value
-    mean_green = np.mean(green_channel)
-    
-    # Create threshold
-    threshold = mean_green / threshold_factor
-    
-    # Create binary mask
-    green_mask = green_channel >= threshold
-    
-    # Count green pixels
-    green_pixels = np.sum(green_mask)
-    idle_pixels = total_pixels - green_pixels
-    
-    # Calculate percentages
-    green_percentage = (green_pixels / total_pixels) * 100
-    idle_percentage = (idle_pixels / total_pixels) * 100
-    
-    # Create visualization
-    processed_img = np.zeros_like(img_array)
-    if len(img_array.shape) == 3:
-        processed_img[green_mask] = [0, 255, 0]  # Green for vegetation
-        processed_img[~green_mask] = [128, 128, 128]  # Gray for non-vegetation
-    else:
-        processed_img[green_mask] = 255
-        processed_img[~green_mask] = 128
-    
-    # Statistics
-    stats = {
-        "total_pixels": int(total_pixels),
-        "green_pixels": int(green_pixels),
-        "idle_pixels": int(idle_pixels),
-        "mean_green_value": float(mean_green),
-        "threshold_used": float(threshold),
-        "method": "Green Channel Analysis"
-    }
-    
-    return processed_img, green_percentage, idle_percentage, stats
+    # Packed masks of large TIFFs are memory-mapped next to the spilled upload
+    return get_vegetation_mask(upload_key, source, method, threshold_factor, cover_statistics,
+                               mask_path=spill_path(source, upload_key, method, threshold_factor, "mask"))
 
-def hsv_analysis(img_array: np.ndarray, threshold_factor: float) -> Tuple[np.ndarray, float, float, dict]:
+def vegetation_mask_preview(source, upload_key: str, method: str, threshold_factor: float,
+                            cover_statistics) -> Image.Image:
     """
-    Analyze green cover using HSV color space
+    Display-sized vegetation mask (palette image)
     """
-    height, width = img_array.shape[:2]
-    total_pixels = height * width
-    
-    # Convert to HSV
-    if len(img_array.shape) == 3:
-        hsv = cv2.cvtColor(img_array, cv2.COLOR_RGB2HSV)
-    else:
-        # If grayscale, convert to RGB first
-        rgb_img = cv2.cvtColor(img_array, cv2.COLOR_GRAY2RGB)
-        hsv = cv2.cvtColor(rgb_img, cv2.COLOR_RGB2HSV)
-    
-    # Define green range in HSV
-    lower_green = np.array([35, 40, 40])  # Adjusted for vegetation
-    upper_green = np.array([85, 255, 255])
-    
-    # Adjust range based on threshold factor
-    saturation_min = max(20, 40 - (threshold_factor - 1) * 20)
-    value_min = max(20, 40 - (threshold_factor - 1) * 20)
-    
-    lower_green[1] = int(saturation_min)
-    lower_green[2] = int(value_min)
-    
-    # Create mask
-    green_mask = cv2.inRange(hsv, lower_green, upper_green)
-    green_mask = green_mask > 0
-    
-    # Count pixels
-    green_pixels = np.sum(green_mask)
-    idle_pixels = total_pixels - green_pixels
-    
-    # Calculate percentages
-    green_percentage = (green_pixels / total_pixels) * 100
-    idle_percentage = (idle_pixels / total_pixels) * 100
-    
-    # Create visualization
-    processed_img = np.zeros_like(img_array)
-    if len(processed_img.shape) == 3:
-        processed_img[green_mask] = [0, 255, 0]  # Green
-        processed_img[~green_mask] = [128, 128, 128]  # Gray
-    else:
-        processed_img[green_mask] = 255
-        processed_img[~green_mask] = 128
-    
-    stats = {
-        "total_pixels": int(total_pixels),
-        "green_pixels": int(green_pixels),
-        "idle_pixels": int(idle_pixels),
-        "hsv_range_lower": lower_green.tolist(),
-        "hsv_range_upper": upper_green.tolist(),
-        "method": "HSV Color Space Analysis"
+    mask = vegetation_mask(source, upload_key, method, threshold_factor, cover_statistics)
+    return mask.to_image(MASK_DISPLAY_MAX_SIDE, color=not source.grayscale)
+
+def vegetation_cover_index(source, upload_key: str, method: str, threshold_factor: float,
+                           cover_statistics) -> CoverIndex:
+    """
+    Summed-area table of the vegetation mask, cached per image, method and sensitivity
+    """
+    key = f"{upload_key}:{method}:{threshold_factor:.2f}"
+    cover_index = get_cover_index(key)
+    if cover_index is None:
+        mask = vegetation_mask(source, upload_key, method, threshold_factor, cover_statistics)
+        cover_index = get_cover_index(key, mask, spill_path(source, upload_key, method, threshold_factor, "sat"))
+    return cover_index
+
+def parcel_cover(source, upload_key: str, method: str, threshold_factor: float, cover_statistics, regions):
+    """
+    Green cover per polygon (GeoJSON regions from load_regions) as RegionCover rows, counted on the
+    cached full-resolution mask; the label image is cached per image and polygon set
+    """
+    key = regions_key(regions)
+    labels_path = spill_file(f"{upload_key}.{key}.labels.npy") \
+        if isinstance(source, TiffSource) else None
+    labels = get_region_labels(f"{upload_key}:{key}", regions, source.height, source.width, labels_path)
+    mask = vegetation_mask(source, upload_key, method, threshold_factor, cover_statistics)
+    return count_regions(labels, mask, regions)
+
+def region_cover_table(covers) -> dict:
+    """
+    Per-polygon results as dataframe columns
+    """
+    return {
+        "Parcel": [cover.name for cover in covers],
+        "Area (px)": [cover.pixels for cover in covers],
+        "Green (px)": [cover.green_pixels for cover in covers],
+        "Green Cover (%)": [round(cover.green_percentage, 2) for cover in covers],
     }
-    
-    return processed_img, green_percentage, idle_percentage, stats
 
-def ndvi_simulation(img_array: np.ndarray, threshold_factor: float) -> Tuple[np.ndarray, float, float, dict]:
+METHOD_LABELS = {
+    METHOD_GREEN_CHANNEL: "Green Channel Analysis",
+    METHOD_HSV: "HSV Color Space Analysis",
+    METHOD_NDVI: "NDVI Simulation",
+}
+
+def cover_stats(method: str, total_pixels: int, green_pixels: int, details: dict) -> dict:
     """
-    Simulate NDVI analysis using RGB channels
+    Statistics dictionary shown under Detailed Statistics
     """
-    height, width = img_array.shape[:2]
-    total_pixels = height * width
-    
-    if len(img_array.shape) == 3:
-        # Simulate NDVI using Red and Green channels
-        red = img_array[:, :, 0].astype(np.float32)
-        green = img_array[:, :, 1].astype(np.float32)
-        
-        # Avoid division by zero
-        denominator = red + green
-        denominator[denominator == 0] = 1
-        
-        # Calculate pseudo-NDVI
-        ndvi = (green - red) / denominator
-        
-        # Adjust threshold based on factor
-        threshold = 0.1 / threshold_factor
-        
-        # Create mask
-        green_mask = ndvi > threshold
-        
-    else:
-        # For grayscale, use simple thresholding
-        gray = img_array.astype(np.float32)
-        threshold = np.mean(gray) / threshold_factor
-        green_mask = gray > threshold
-        ndvi = gray  # For stats
-    
-    # Count pixels
-    green_pixels = np.sum(green_mask)
-    idle_pixels = total_pixels - green_pixels
-    
-    # Calculate percentages
-    green_percentage = (green_pixels / total_pixels) * 100
-    idle_percentage = (idle_pixels / total_pixels) * 100
-    
-    # Create visualization
-    processed_img = np.zeros_like(img_array)
-    if len(processed_img.shape) == 3:
-        processed_img[green_mask] = [0, 255, 0]  # Green
-        processed_img[~green_mask] = [128, 128, 128]  # Gray
-    else:
-        processed_img[green_mask] = 255
-        processed_img[~green_mask] = 128
-    
-    stats = {
+    return {
         "total_pixels": int(total_pixels),
         "green_pixels": int(green_pixels),
-        "idle_pixels": int(idle_pixels),
-        "mean_ndvi": float(np.mean(ndvi)) if len(img_array.shape) == 3 else None,
-        "ndvi_threshold": float(threshold) if len(img_array.shape) == 3 else None,
-        "method": "NDVI Simulation"
+        "idle_pixels": int(total_pixels - green_pixels),
+        **details,
+        "method": METHOD_LABELS[method]
     }
-    
-    return processed_img, green_percentage, idle_percentage, stats
 
 # Show tips at the bottom
 if st.checkbox("💡 Analysis Tips"):
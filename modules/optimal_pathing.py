@@ -3,8 +3,15 @@
 import streamlit as st
 import os
 import sys
+import numpy as np
 from PIL import Image
 
+from imaging_services import ingest_upload, open_image_source, show_image
+from imaging_services.vegetation import METHODS, get_cover_statistics, get_vegetation_mask
+
+# Terrain classifier choices: the original IsoGray threshold, or any Green Cover method
+ISO_GRAY_CLASSIFIER = "Green Threshold (IsoGray)"
+
 # -----------------------------
 # Add ForestPathPlanner to Python path
 # -----------------------------
@@ -49,8 +56,8 @@ def show_image_based_pathing():
     uploaded_file = st.file_uploader("Upload a forest image", type=['png', 'jpg', 'jpeg'])
 
     if uploaded_file:
-        image = Image.open(uploaded_file)
-        st.image(image, caption="Uploaded Forest Area", use_container_width=True)
+        image, upload_key, _ = ingest_upload(uploaded_file)
+        show_image(image, caption="Uploaded Forest Area", cache_key=upload_key)
 
         st.markdown("### Set Start and End Points")
         col1, col2 = st.columns(2)
@@ -61,14 +68,31 @@ def show_image_based_pathing():
             end_x = st.number_input("End X", min_value=0, max_value=image.width-1, value=image.width-50)
             end_y = st.number_input("End Y", min_value=0, max_value=image.height-1, value=image.height-50)
 
+        st.markdown("### Terrain Classification")
+        col1, col2 = st.columns(2)
+        with col1:
+            classifier = st.selectbox("Vegetation Classifier", [ISO_GRAY_CLASSIFIER, *METHODS])
+        with col2:
+            green_threshold = st.slider("Green Sensitivity", min_value=0.5, max_value=2.5, value=1.5, step=0.1)
+
         if st.button("🗺️ Find Optimal Path"):
             with st.spinner("Calculating optimal path..."):
                 try:
+                    # Green Cover masks are shared: one already computed for this upload is reused.
+                    # The source is opened as Green Cover opens it, so one upload key means one source
+                    mask = None
+                    if classifier != ISO_GRAY_CLASSIFIER:
+                        source = open_image_source(uploaded_file, key=upload_key)
+                        mask = get_vegetation_mask(upload_key, source, classifier, green_threshold,
+                                                   get_cover_statistics(upload_key, source))
+
                     # Call the ForestPathPlanner C++ backend
                     result = appOptim.main_with_return(
                         image=image,
                         start=(start_x, start_y),
-                        end=(end_x, end_y)
+                        end=(end_x, end_y),
+                        threshold_factor=green_threshold,
+                        mask=mask
                     )
                     display_path_results(result)
 
@@ -83,7 +107,7 @@ def display_path_results(result: dict):
 
     col1, col2 = st.columns(2)
     with col1:
-        st.image(result['path_image'], caption="Optimal Path", use_container_width=True)
+        show_image(result['path_image'], caption="Optimal Path")
 
     with col2:
         st.metric("Path Length", f"{result['path_length']:.1f} pixels")
@@ -92,7 +116,7 @@ def display_path_results(result: dict):
         st.metric("Open Areas", f"{result['idle_coverage']:.1f}%")
     
     if 'terrain_image' in result:
-        st.image(result['terrain_image'], caption="Terrain Map", use_container_width=True)
+        show_image(result['terrain_image'], caption="Terrain Map")
     if 'cost_image' in result:
-        st.image(result['cost_image'], caption="Cost Map", use_container_width=True)
+        show_image(result['cost_image'], caption="Cost Map")
 
@@ -128,49 +128,6 @@
 #     outputs = session.run(None, {input_name: input_tensor})
 #     return outputs[0]
 
-# def process_output(output: np.ndarray, img_width: int, img_height: int, confidence_threshold: float, iou_threshold: float) -> List:
-#     boxes = []
-#     # Assuming YOLOv5 single-class output
-#     num_predictions = output.shape[2] if output.ndim == 3 else output.shape[1]
-#     for i in range(num_predictions):
-#         xc = output[0][0][i]
-#         yc = output[0][1][i]
-#         w = output[0][2][i]
-#         h = output[0][3][i]
-#         conf = output[0][4][i]
-#         if conf >= confidence_threshold:
-#             x1 = (xc - w/2) / 640 * img_width
-#             y1 = (yc - h/2) / 640 * img_height
-#             x2 = (xc + w/2) / 640 * img_width
-#             y2 = (yc + h/2) / 640 * img_height
-#             boxes.append([x1, y1, x2, y2, "tree", conf])
-#     if len(boxes) > 0:
-#         boxes = apply_nms(boxes, iou_threshold)
-#     return boxes
-
-# def apply_nms(boxes: List, iou_threshold: float) -> List:
-#     if len(boxes) == 0:
-#         return []
-#     boxes = sorted(boxes, key=lambda x: x[5], reverse=True)
-#     result = []
-#     while boxes:
-#         result.append(boxes[0])
-#         boxes = [box for box in boxes[1:] if calculate_iou(boxes[0], box) < iou_threshold]
-#     return result
-
-# def calculate_iou(box1: List, box2: List) -> float:
-#     x1_max = max(box1[0], box2[0])
-#     y1_max = max(box1[1], box2[1])
-#     x2_min = min(box1[2], box2[2])
-#     y2_min = min(box1[3], box2[3])
-#     if x2_min <= x1_max or y2_min <= y1_max:
-#         return 0.0
-#     inter = (x2_min - x1_max) * (y2_min - y1_max)
-#     area1 = (box1[2] - box1[0]) * (box1[3] - box1[1])
-#     area2 = (box2[2] - box2[0]) * (box2[3] - box2[1])
-#     union = area1 + area2 - inter
-#     return inter / union if union > 0 else 0.0
-
 # def draw_detections(image: Image.Image, detections: List) -> Image.Image:
 #     img_with_boxes = image.copy()
 #     draw = ImageDraw.Draw(img_with_boxes)
@@ -202,13 +159,44 @@ import streamlit as st
 import numpy as np
 from PIL import Image
 import cv2
-import onnxruntime as ort
+from typing import List
+
+from detection_services import (
+    BACKEND_ONNX,
+    OnnxBackend,
+    box_overlap,
+    canopy_union_area,
+    decode_yolo_output,
+    load_detector_settings,
+    nms,
+)
+from imaging_services import content_hash, show_image
 
 # ✅ Configuration
-MODEL_PATH = r"C:\Users\TANMAY\OneDrive\Desktop\streamlit-app_editted\models\best.onnx"
 CONFIDENCE_THRESHOLD = 0.2
 IOU_THRESHOLD = 0.7  # optional if your model uses NMS
 
+def process_output(output: np.ndarray, img_width: int, img_height: int, confidence_threshold: float, iou_threshold: float) -> List:
+    """Decode the (1, 5, N) ONNX output into [x1, y1, x2, y2, "tree", conf] detections"""
+    boxes, scores = decode_yolo_output(output, img_width, img_height, confidence_threshold, iou_threshold)
+    return [[*box.tolist(), "tree", float(conf)] for box, conf in zip(boxes, scores)]
+
+def apply_nms(boxes: List, iou_threshold: float) -> List:
+    if len(boxes) == 0:
+        return []
+    coords = np.array([box[:4] for box in boxes], dtype=np.float32)
+    scores = np.array([box[5] for box in boxes], dtype=np.float32)
+    return [boxes[i] for i in nms(coords, scores, iou_threshold)]
+
+def calculate_iou(box1: List, box2: List) -> float:
+    return float(box_overlap(np.asarray(box1[:4], dtype=np.float32),
+                             np.asarray([box2[:4]], dtype=np.float32))[0])
+
+@st.cache_resource
+def load_onnx_detector() -> OnnxBackend:
+    """ONNX Runtime session built once per process, tuned by the TREESENSE_ORT_* settings"""
+    return OnnxBackend(load_detector_settings(backend=BACKEND_ONNX))
+
 # --- Streamlit App ---
 st.title("🌳 Tree-Based Green Cover Estimation")
 st.markdown("Upload an aerial or satellite image, and the model will detect trees to estimate green cover percentage.")
@@ -218,42 +206,20 @@ uploaded_file = st.file_uploader("Upload Image", type=["jpg", "jpeg", "png"])
 
 if uploaded_file is not None:
     image = Image.open(uploaded_file).convert("RGB")
-    st.image(image, caption="Uploaded Image", use_container_width=True)
+    show_image(image, caption="Uploaded Image", cache_key=content_hash(uploaded_file.getvalue()))
 
     if st.button("Calculate Green Cover"):
         with st.spinner("Detecting trees and calculating green cover..."):
             
-            def calculate_green_cover_yolo(image: Image.Image, model_path, conf_thresh=0.2):
+            def calculate_green_cover_yolo(image: Image.Image, detector: OnnxBackend, conf_thresh=0.2):
                 img = np.array(image)
                 h, w = img.shape[:2]
 
-                # Preprocess for model
-                img_resized = cv2.resize(img, (640, 640))
-                input_img = img_resized.astype(np.float32)/255.0
-                input_img = np.transpose(input_img, (2,0,1))[np.newaxis,:,:,:]
-
-                # Load ONNX model
-                session = ort.InferenceSession(model_path)
-                outputs = session.run(None, {session.get_inputs()[0].name: input_img})
-
-                # Post-process (adjust if your ONNX outputs differently)
-                # Assume outputs[0] = boxes, outputs[1] = scores, outputs[2] = class_ids
-                boxes = np.array(outputs[0])
-                scores = np.array(outputs[1])
-                # class_ids = np.array(outputs[2])  # optional if multiple classes
-
-                # Filter by confidence
-                valid = scores > conf_thresh
-                boxes = boxes[valid]
-
-                # Rescale boxes to original image size
-                scale_x = w / 640
-                scale_y = h / 640
-                boxes[:, [0,2]] = boxes[:, [0,2]] * scale_x
-                boxes[:, [1,3]] = boxes[:, [1,3]] * scale_y
+                # Preprocess, run the cached session and decode the (1, 5, N) head output
+                boxes, scores = detector.predict([img], conf_thresh, IOU_THRESHOLD)[0]
 
-                # Compute total area of boxes
-                tree_area = np.sum((boxes[:,2]-boxes[:,0]) * (boxes[:,3]-boxes[:,1]))
+                # Exact area of the union of boxes (overlapping crowns counted once)
+                tree_area = canopy_union_area(boxes, w, h)
                 total_area = h * w
                 green_cover_pct = (tree_area / total_area) * 100
 
@@ -269,15 +235,15 @@ if uploaded_file is not None:
                 return green_cover_pct, annotated_img
 
             # Run calculation
-            green_cover_pct, annotated_image = calculate_green_cover_yolo(image, MODEL_PATH, CONFIDENCE_THRESHOLD)
+            green_cover_pct, annotated_image = calculate_green_cover_yolo(image, load_onnx_detector(), CONFIDENCE_THRESHOLD)
 
             st.success(f"🌿 Estimated Green Cover: {green_cover_pct:.2f}%")
-            st.image(annotated_image, caption="Annotated Tree Detection", use_container_width=True)
+            show_image(annotated_image, caption="Annotated Tree Detection")
 
 st.markdown("---")
 st.markdown("""
 💡 **Note:** This method estimates green cover based on **tree area detected** by your model.  
-- Overlapping trees may slightly overestimate coverage.  
+- Overlapping crowns are counted once (area of the union of detected boxes).  
 - Works best with clear aerial or satellite images where trees are visible.  
 """)
 
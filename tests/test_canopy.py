@@ -0,0 +1,37 @@
+"""
+Canopy Area Engine tests
+"""
+
+import numpy as np
+
+from detection_services.canopy import canopy_area_by_region, canopy_union_area
+
+
+def _raster_area(boxes: np.ndarray, width: int, height: int) -> int:
+    covered = np.zeros((height, width), dtype=bool)
+    for x0, y0, x1, y1 in np.clip(boxes, 0, None).astype(int):
+        covered[y0:y1, x0:x1] = True
+    return int(covered.sum())
+
+
+def test_union_area_matches_raster_count():
+    rng = np.random.default_rng(0)
+    corners = rng.integers(-20, 300, (300, 2))
+    boxes = np.concatenate([corners, corners + rng.integers(1, 60, (300, 2))], axis=1)
+
+    assert canopy_union_area(boxes, 320, 240) == _raster_area(boxes, 320, 240)
+
+
+def test_union_area_agrees_with_region_totals():
+    rng = np.random.default_rng(1)
+    corners = rng.random((500, 2)) * 900
+    boxes = np.concatenate([corners, corners + rng.uniform(5, 90, (500, 2))], axis=1)
+
+    total = canopy_union_area(boxes, 1000, 800)
+
+    assert np.isclose(total, canopy_area_by_region(boxes, 1000, 800, grid=(3, 4)).sum())
+
+
+def test_nested_and_empty_boxes():
+    assert canopy_union_area(np.array([[0, 0, 10, 10], [2, 2, 5, 5], [5, 5, 15, 15]])) == 175.0
+    assert canopy_union_area(np.zeros((0, 4))) == 0.0
@@ -0,0 +1,65 @@
+"""
+Tree Matching tests
+"""
+
+import numpy as np
+
+from detection_services.matching import MATCH_DISTANCE, match_trees, overlapping_pairs
+
+
+def _grid_crowns(side: float, count: int, spacing: float, origin: float) -> np.ndarray:
+    """``count`` x ``count`` square crowns of ``side`` px, ``spacing`` px apart"""
+    xs, ys = np.meshgrid(np.arange(count) * spacing + origin, np.arange(count) * spacing + origin)
+    corners = np.stack([xs.ravel(), ys.ravel()], axis=1)
+    return np.concatenate([corners, corners + side], axis=1)
+
+
+def test_large_crown_matches_among_small_crowns():
+    small = _grid_crowns(20, 10, 60, 0)
+    large_before = np.array([[1000.0, 1000.0, 1120.0, 1120.0]])
+    # Shifted 40 px: IoU 0.5, but the centroids are twice the median crown side apart
+    large_after = large_before + [40, 0, 40, 0]
+    before = np.concatenate([small, large_before])
+    after = np.concatenate([small, large_after])
+
+    matches = match_trees(before, after)
+
+    assert matches.lost_count == 0
+    assert matches.new_count == 0
+    assert matches.persisting_count == len(before)
+    pairs = {tuple(pair) for pair in matches.pairs.tolist()}
+    assert (len(small), len(small)) in pairs
+
+
+def test_huge_box_does_not_widen_candidate_search():
+    small = _grid_crowns(20, 100, 60, 0)
+    huge = np.array([[1000.0, 1000.0, 2500.0, 2500.0]])
+    before = np.concatenate([small, huge])
+
+    pairs = sum(len(first) for first, _ in overlapping_pairs(before, small, 20.0))
+
+    # Every small crown pairs with its own copy; the huge box
+    # only with the crowns under it, not every crown with every other
+    under_huge = np.sum((small[:, 2] >= 1000) & (small[:, 0] <= 2500) & (small[:, 3] >= 1000) & (small[:, 1] <= 2500))
+    assert pairs <= len(small) + under_huge
+    assert match_trees(before, small).persisting_count == len(small)
+
+
+def test_non_overlapping_crowns_stay_unmatched():
+    before = np.array([[0.0, 0.0, 20.0, 20.0], [100.0, 100.0, 220.0, 220.0]])
+    after = np.array([[25.0, 0.0, 45.0, 20.0], [100.0, 100.0, 220.0, 220.0]])
+
+    matches = match_trees(before, after)
+
+    assert matches.pairs.tolist() == [[1, 1]]
+    assert matches.lost.tolist() == [0]
+    assert matches.new.tolist() == [0]
+
+
+def test_distance_metric_keeps_median_side_radius():
+    before = np.array([[0.0, 0.0, 20.0, 20.0], [500.0, 500.0, 520.0, 520.0]])
+    after = np.array([[15.0, 0.0, 35.0, 20.0], [560.0, 500.0, 580.0, 520.0]])
+
+    matches = match_trees(before, after, metric=MATCH_DISTANCE)
+
+    assert matches.pairs.tolist() == [[0, 0]]